@@ -1,6 +1,7 @@
-from flask import Flask, request, render_template, redirect, url_for, session, flash, jsonify, send_from_directory
+from flask import Flask, request, render_template, redirect, url_for, session, flash, jsonify, send_from_directory, Response, stream_with_context
 import hashlib
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
 import os
 from functools import wraps
 from dotenv import load_dotenv
@@ -8,6 +9,12 @@ from upload_to_drive import create_drive_uploader
 from sheets_manager import create_sheets_manager
 from oauth_manager import oauth_drive_manager
 from supabase_manager import create_supabase_manager
+from local_store import create_local_first_manager
+from live_events import event_broker
+import replenishment
+import slow_movers
+import csv_export
+import report_snapshots
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,6 +26,31 @@ app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-pr
 PRODUCT_SHEET_ID = os.environ.get('PRODUCT_SHEET_ID', '17fQBTqiUG6tFH-67its-iaKDV2ef4HLJ9S3BGKTVSdM')
 STOCK_SHEET_ID = os.environ.get('STOCK_SHEET_ID', '1OaEqOS7I0_hN2Q1nc4isqPXXdjp7_i7ZAPJFhUr5X7k')
 
+# Timezone of the stores; as_of values given without an offset are read in it,
+# since the database would otherwise take them as UTC (seven hours off in Thailand)
+STORE_TIMEZONE = ZoneInfo(os.environ.get('STORE_TIMEZONE', 'Asia/Bangkok'))
+
+# Keyset pagination page sizes for listings and JSON endpoints
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Longest dashboard analytics window (days)
+MAX_PERIOD_DAYS = 3660
+
+# Browser cache lifetime (seconds) of each dashboard JSON endpoint; live changes
+# to counts and alerts arrive over /events/dashboard, so these can stay short.
+# Alerts and stock counts are not cached at all (0): the dashboard reloads them
+# after an event or a resolve and must not get the list from before the change.
+DASHBOARD_CACHE_SECONDS = {
+    'kpis': 30,
+    'top_products': 300,
+    'alerts': 0,
+    'stock_counts': 0,
+    'products': 60,
+    'variance': 60,
+    'inventory_as_of': 60
+}
+
 # Initialize Google Drive uploader, Sheets manager, and Supabase
 try:
     drive_uploader = create_drive_uploader()
@@ -34,6 +66,13 @@ except Exception as e:
     sheets_manager = None
     supabase_manager = None
 
+# Branch servers with unreliable internet serve lookups and counts from a local
+# SQLite copy and replicate to Supabase in the background (see local_store.py)
+if supabase_manager and os.environ.get('LOCAL_FIRST', '').lower() in ('1', 'true', 'yes'):
+    supabase_manager = create_local_first_manager(supabase_manager) or supabase_manager
+    if hasattr(supabase_manager, 'start_replication'):
+        supabase_manager.start_replication()
+
 # Simple user authentication (in production, use proper authentication)
 USERS = {
     'admin': {'password': hashlib.sha256('Teeomega2014'.encode()).hexdigest(), 'role': 'admin'},
@@ -409,11 +448,11 @@ def get_product(barcode):
                 duplicate_warning = None
                 try:
                     # Get all existing counts for this product (across all branches for now)
-                    existing_counts = supabase_manager.client.table('stock_counts').select('branch_name, count_number, counted_at').eq('barcode', barcode).order('counted_at', desc=True).execute()
+                    existing_counts = supabase_manager.get_stock_count_history(barcode)
                     
-                    if existing_counts.data and len(existing_counts.data) > 0:
-                        total_counts = len(existing_counts.data)
-                        latest_count = existing_counts.data[0]
+                    if existing_counts:
+                        total_counts = len(existing_counts)
+                        latest_count = existing_counts[0]
                         
                         # Create warning message
                         branch_info = latest_count.get('branch_name', 'ไม่ระบุสาขา')
@@ -622,12 +661,8 @@ def submit_stock():
                     }
                     
                     # Get count info before saving
-                    try:
-                        existing_counts = supabase_manager.client.table('stock_counts').select('id').eq('product_id', product['id']).eq('branch_id', branch['id']).execute()
-                        count_number = len(existing_counts.data) + 1
-                        count_info = f"นับครั้งที่ {count_number}"
-                    except:
-                        count_info = "นับครั้งแรก"
+                    count_number = supabase_manager.count_stock_counts(product['id'], branch['id']) + 1
+                    count_info = f"นับครั้งที่ {count_number}" if count_number > 1 else "นับครั้งแรก"
                     
                     supabase_success = supabase_manager.add_stock_count(stock_count_data)
                     if supabase_success:
@@ -735,24 +770,82 @@ def internal_error(error):
     traceback.print_exc()
     return jsonify({'error': 'Internal server error', 'details': str(error)}), 500
 
+def load_report_snapshot(report_key, refresh=False):
+    """Today's precomputed copy of a report ({'payload', 'generated_at'}), or None.
+    
+    With refresh the report is rebuilt now and stored as the new snapshot.
+    """
+    if not supabase_manager:
+        return None
+    if refresh:
+        return report_snapshots.refresh(supabase_manager, report_key)
+    return report_snapshots.load(supabase_manager, report_key)
+
+def load_summary_report(refresh=False):
+    """Products with days of stock / suggested orders, and per-branch rollups.
+    
+    Returns {'products', 'branch_summary', 'generated_at', 'precomputed'}, or
+    None when no data source is available.
+    """
+    # Supabase: the nightly snapshot, else computed now from stock per branch with recent sales
+    snapshot = load_report_snapshot('summary', refresh)
+    if snapshot:
+        return dict(snapshot['payload'], generated_at=snapshot['generated_at'], precomputed=True)
+    
+    if supabase_manager:
+        report = report_snapshots.build_summary(supabase_manager)
+        if report:
+            print(f"Computed replenishment for {len(report['products'])} products")
+            return dict(report, generated_at=datetime.now(), precomputed=False)
+    
+    if not sheets_manager:
+        return None
+    
+    print(f"Getting stock summary from sheets: {STOCK_SHEET_ID}, {PRODUCT_SHEET_ID}")
+    products = sheets_manager.get_stock_summary(STOCK_SHEET_ID, PRODUCT_SHEET_ID)
+    print(f"Retrieved {len(products) if products else 0} products")
+    
+    # The stock sheet has no sales data, so only stock totals are known here
+    return {
+        'products': replenishment.build_stock_only_report(products),
+        'branch_summary': [],
+        'generated_at': datetime.now(),
+        'precomputed': False
+    }
+
+def load_slow_report(refresh=False):
+    """Slow-moving inventory report ({'products', 'generated_at', 'precomputed'}), or None on failure"""
+    snapshot = load_report_snapshot('slow', refresh)
+    if snapshot:
+        return dict(snapshot['payload'], generated_at=snapshot['generated_at'], precomputed=True)
+    
+    def compute_report():
+        report = report_snapshots.build_slow(supabase_manager)
+        if report is not None:
+            report.update(generated_at=datetime.now(), precomputed=False)
+        return report
+    
+    # No snapshot yet today: last movement per product/branch is kept up to
+    # date by triggers, and the classified report is cached for a few minutes
+    return slow_movers.slow_report_cache.get_or_compute(datetime.now().date(), compute_report)
+
 @app.route('/report/summary')
 @admin_required
 def admin_summary():
     print("=== Admin Summary Route Called ===")
     
-    if not sheets_manager:
-        print("ERROR: Sheets manager not available")
-        flash('Sheets manager not available', 'error')
-        return redirect(url_for('index'))
-    
     try:
-        print(f"Getting stock summary from sheets: {STOCK_SHEET_ID}, {PRODUCT_SHEET_ID}")
-        products = sheets_manager.get_stock_summary(STOCK_SHEET_ID, PRODUCT_SHEET_ID)
-        print(f"Retrieved {len(products) if products else 0} products")
+        report = load_summary_report(refresh=bool(request.args.get('refresh')))
+        if report is None:
+            print("ERROR: Sheets manager not available")
+            flash('Sheets manager not available', 'error')
+            return redirect(url_for('index'))
         
-        # For now, we'll show basic stock summary
-        # In the future, you could integrate with sales data from another sheet
-        return render_template('summary.html', products=products, branch_summary=[])
+        return render_template('summary.html',
+                             products=report['products'],
+                             branch_summary=report['branch_summary'],
+                             generated_at=report['generated_at'],
+                             precomputed=report['precomputed'])
         
     except Exception as e:
         print(f"ERROR in admin_summary: {e}")
@@ -761,16 +854,42 @@ def admin_summary():
         flash(f'Error loading summary data: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+@app.route('/report/slow')
+@admin_required
+def report_slow():
+    if not supabase_manager:
+        flash('Supabase not available', 'error')
+        return redirect(url_for('admin_summary'))
+    
+    report = load_slow_report(refresh=bool(request.args.get('refresh')))
+    if report is None:
+        flash('Error loading slow-moving inventory report', 'error')
+        return redirect(url_for('admin_summary'))
+    
+    return render_template('slow.html',
+                         products=report['products'],
+                         generated_at=report['generated_at'],
+                         precomputed=report['precomputed'])
+
 @app.route('/report/products')
 @admin_required
 def view_products():
+    # Supabase: render the first page only, the rest is fetched from /api/products
+    if supabase_manager:
+        try:
+            page = supabase_manager.get_products_page(limit=PAGE_SIZE)
+            if page is not None:
+                return render_template('products.html', products=page['items'], next_cursor=page['next_cursor'])
+        except Exception as e:
+            print(f"Error getting products from Supabase: {e}")
+    
     if not sheets_manager:
         flash('Sheets manager not available', 'error')
         return redirect(url_for('index'))
     
     try:
         products = sheets_manager.get_all_products(PRODUCT_SHEET_ID)
-        return render_template('products.html', products=products)
+        return render_template('products.html', products=products, next_cursor=None)
         
     except Exception as e:
         print(f"Error getting products: {e}")
@@ -780,25 +899,20 @@ def view_products():
 @app.route('/dashboard')
 @admin_required
 def dashboard():
-    """Smart Inventory Dashboard - Phase 1"""
+    """Smart Inventory Dashboard - page shell; widgets load from /api/dashboard/* in parallel"""
     if not supabase_manager:
         flash('Database not available. Using legacy system.', 'error')
         return redirect(url_for('admin_summary'))
     
     try:
-        # Get filter parameters
-        branch_id = request.args.get('branch_id')
-        period = int(request.args.get('period', 30))
-        
-        # Get dashboard data
-        summary = supabase_manager.get_dashboard_summary(branch_id)
-        alerts = supabase_manager.get_active_alerts(branch_id)
+        start_date, end_date = supabase_manager.resolve_period(**get_period_args())
         branches = supabase_manager.get_all_branches()
         
         return render_template('dashboard.html', 
-                             summary=summary, 
-                             alerts=alerts, 
-                             branches=branches)
+                             branches=branches,
+                             period_start=start_date.isoformat(),
+                             period_end=end_date.isoformat(),
+                             period_days=(end_date - start_date).days + 1)
         
     except Exception as e:
         print(f"Error loading dashboard: {e}")
@@ -807,6 +921,307 @@ def dashboard():
         flash(f'Error loading dashboard: {str(e)}', 'error')
         return redirect(url_for('admin_summary'))
 
+def cached_json(payload, max_age):
+    """JSON response that the browser may reuse for max_age seconds (0: never stored)"""
+    response = jsonify(payload)
+    response.headers['Cache-Control'] = f'private, max-age={max_age}' if max_age else 'no-store'
+    return response
+
+@app.route('/api/dashboard/kpis')
+@admin_required
+def api_dashboard_kpis():
+    """Dashboard KPI cards: counters, today's and the selected period's sales"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    kpis = supabase_manager.get_dashboard_kpis(request.args.get('branch_id'), **get_period_args())
+    return cached_json(kpis, DASHBOARD_CACHE_SECONDS['kpis'])
+
+@app.route('/api/dashboard/top_products')
+@admin_required
+def api_dashboard_top_products():
+    """Dashboard top 5 products for the selected period"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    branch_id = request.args.get('branch_id')
+    period_args = get_period_args()
+    
+    # The default view (all branches, 30 days) is precomputed nightly
+    snapshot = None
+    if not branch_id and period_args == {'period': report_snapshots.TOP_PRODUCTS_PERIOD_DAYS}:
+        snapshot = load_report_snapshot('top_products')
+    
+    if snapshot:
+        items = snapshot['payload']['items']
+        generated_at = snapshot['generated_at']
+    else:
+        start_date, end_date = supabase_manager.resolve_period(**period_args)
+        items = supabase_manager.get_top_selling_products(
+            limit=5, branch_id=branch_id, start_date=start_date, end_date=end_date)
+        generated_at = datetime.now()
+    
+    return cached_json({
+        'items': items,
+        'generated_at': generated_at.isoformat(timespec='minutes'),
+        'precomputed': snapshot is not None
+    }, DASHBOARD_CACHE_SECONDS['top_products'])
+
+def get_period_args():
+    """Read period (days) or a custom start_date/end_date range from the query string"""
+    if request.args.get('period') == 'custom':
+        try:
+            start_date = date.fromisoformat(request.args.get('start_date', ''))
+            end_date = date.fromisoformat(request.args.get('end_date', ''))
+            if start_date > end_date:
+                start_date, end_date = end_date, start_date
+            return {'start_date': start_date, 'end_date': end_date}
+        except ValueError:
+            print(f"Invalid custom period: {request.args.get('start_date')} - {request.args.get('end_date')}")
+    
+    try:
+        period = int(request.args.get('period', 30))
+    except ValueError:
+        period = 30
+    return {'period': max(1, min(period, MAX_PERIOD_DAYS))}
+
+def get_page_args():
+    """Read cursor/limit query parameters for keyset-paginated endpoints"""
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+    except ValueError:
+        limit = PAGE_SIZE
+    return cursor, max(1, min(limit, MAX_PAGE_SIZE))
+
+@app.route('/api/stock_counts')
+@admin_required
+def api_stock_counts():
+    """Keyset-paginated stock counts, newest first"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    cursor, limit = get_page_args()
+    try:
+        page = supabase_manager.get_recent_stock_counts(request.args.get('branch_id'), limit, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return cached_json(page, DASHBOARD_CACHE_SECONDS['stock_counts'])
+
+@app.route('/api/alerts')
+@admin_required
+def api_alerts():
+    """Keyset-paginated active alerts, newest first"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    cursor, limit = get_page_args()
+    try:
+        page = supabase_manager.get_active_alerts_page(request.args.get('branch_id'), limit, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return cached_json(page, DASHBOARD_CACHE_SECONDS['alerts'])
+
+@app.route('/api/products')
+@admin_required
+def api_products():
+    """Keyset-paginated active products ordered by name (?q= searches barcode and name)"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    cursor, limit = get_page_args()
+    search = request.args.get('q', '').strip() or None
+    try:
+        page = supabase_manager.get_products_page(limit, cursor, search)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if page is None:
+        return jsonify({'error': 'Failed to load products'}), 500
+    return cached_json(page, DASHBOARD_CACHE_SECONDS['products'])
+
+@app.route('/api/variance')
+@admin_required
+def api_variance():
+    """Shrinkage report: per-branch variance totals and the products with the largest shortfalls"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    _, limit = get_page_args()
+    branch_id = request.args.get('branch_id')
+    
+    # All-branch requests are served from the nightly snapshot
+    snapshot = None
+    if not branch_id and limit <= report_snapshots.VARIANCE_LIMIT:
+        snapshot = load_report_snapshot('variance')
+    
+    if snapshot:
+        branches = snapshot['payload']['branches']
+        products = snapshot['payload']['products'][:limit]
+        generated_at = snapshot['generated_at']
+    else:
+        branches = supabase_manager.get_branch_variance_summary()
+        products = supabase_manager.get_shrinkage_report(branch_id, limit)
+        generated_at = datetime.now()
+    
+    return cached_json({
+        'branches': branches,
+        'products': products,
+        'generated_at': generated_at.isoformat(timespec='minutes'),
+        'precomputed': snapshot is not None
+    }, DASHBOARD_CACHE_SECONDS['variance'])
+
+def parse_as_of(value):
+    """Read an as_of query value: a date means the end of that day, or a full ISO datetime.
+    
+    The result is always timezone-aware; values without an offset are store time.
+    """
+    if not value:
+        return datetime.now(STORE_TIMEZONE)
+    if len(value) == 10:
+        return datetime.combine(date.fromisoformat(value), time.max, tzinfo=STORE_TIMEZONE)
+    as_of = datetime.fromisoformat(value)
+    if as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=STORE_TIMEZONE)
+    return as_of
+
+@app.route('/api/inventory/as_of')
+@admin_required
+def api_inventory_as_of():
+    """Stock of every product in a branch at a point in time (format=csv or xlsx for a download)"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    branch_id = request.args.get('branch_id')
+    if not branch_id:
+        return jsonify({'error': 'branch_id is required'}), 400
+    try:
+        as_of = parse_as_of(request.args.get('as_of'))
+    except ValueError:
+        return jsonify({'error': f"Invalid as_of: {request.args.get('as_of')}"}), 400
+    
+    items = supabase_manager.get_inventory_as_of(branch_id, as_of, request.args.get('product_id'))
+    if items is None:
+        return jsonify({'error': 'Failed to load inventory'}), 500
+    
+    if request.args.get('format') in ('csv', 'xlsx'):
+        return export_download(f"inventory_as_of_{as_of.strftime('%Y%m%d')}", csv_export.INVENTORY_AS_OF_COLUMNS, items, request.args.get('format'))
+    
+    return cached_json({
+        'branch_id': branch_id,
+        'as_of': as_of.isoformat(),
+        'items': items
+    }, DASHBOARD_CACHE_SECONDS['inventory_as_of'])
+
+@app.route('/api/alerts/<alert_id>/resolve', methods=['POST'])
+@admin_required
+def api_resolve_alert(alert_id):
+    """Resolve an alert; open dashboards are notified through the live event stream"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    if supabase_manager.resolve_alert(alert_id, None):
+        return jsonify({'success': True})
+    return jsonify({'error': 'Failed to resolve alert'}), 500
+
+@app.route('/events/dashboard')
+@admin_required
+def dashboard_events():
+    """Server-Sent Events stream of new stock counts, alerts and resolved alerts"""
+    subscriber = event_broker.subscribe()
+    if subscriber is None:
+        # Every stream holds a worker thread; refuse rather than starve normal requests
+        return Response('Too many live dashboards', status=503, headers={'Retry-After': '60'})
+    return Response(
+        stream_with_context(event_broker.stream(subscriber)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def csv_download(name, columns, rows):
+    """Stream rows as a CSV attachment (chunked, nothing buffered in full)"""
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    return Response(
+        stream_with_context(csv_export.stream_csv(columns, rows)),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def xlsx_download(name, columns, rows):
+    """Send rows as an XLSX attachment (rows spooled to disk, not memory)"""
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
+    return Response(
+        stream_with_context(csv_export.stream_xlsx(columns, rows, name)),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def export_download(name, columns, rows, fmt):
+    """CSV or XLSX attachment depending on the export URL's extension"""
+    if fmt == 'xlsx':
+        return xlsx_download(name, columns, rows)
+    return csv_download(name, columns, rows)
+
+@app.route('/export/stock_counts.csv', defaults={'fmt': 'csv'})
+@app.route('/export/stock_counts.xlsx', defaults={'fmt': 'xlsx'})
+@admin_required
+def export_stock_counts(fmt):
+    """All stock counts, newest first; optional branch_id and period/start_date/end_date"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    start_date = end_date = None
+    if request.args.get('period'):
+        start_date, end_date = supabase_manager.resolve_period(**get_period_args())
+    
+    rows = supabase_manager.iter_stock_counts(request.args.get('branch_id'), start_date, end_date)
+    return export_download('stock_counts', csv_export.STOCK_COUNT_COLUMNS, rows, fmt)
+
+@app.route('/export/inventory.csv', defaults={'fmt': 'csv'})
+@app.route('/export/inventory.xlsx', defaults={'fmt': 'xlsx'})
+@admin_required
+def export_inventory(fmt):
+    """Current inventory per product and branch; optional branch_id"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    rows = supabase_manager.iter_inventory(request.args.get('branch_id'))
+    return export_download('inventory', csv_export.INVENTORY_COLUMNS, rows, fmt)
+
+@app.route('/export/summary.csv', defaults={'fmt': 'csv'})
+@app.route('/export/summary.xlsx', defaults={'fmt': 'xlsx'})
+@admin_required
+def export_summary(fmt):
+    """The /report/summary product table"""
+    report = load_summary_report()
+    if report is None:
+        return jsonify({'error': 'No data source available'}), 503
+    
+    return export_download('summary', csv_export.SUMMARY_COLUMNS, report['products'], fmt)
+
+@app.route('/export/slow.csv', defaults={'fmt': 'csv'})
+@app.route('/export/slow.xlsx', defaults={'fmt': 'xlsx'})
+@admin_required
+def export_slow(fmt):
+    """The /report/slow table"""
+    if not supabase_manager:
+        return jsonify({'error': 'Database not available'}), 503
+    
+    report = load_slow_report()
+    if report is None:
+        return jsonify({'error': 'Failed to load report'}), 500
+    return export_download('slow_moving', csv_export.SLOW_COLUMNS, report['products'], fmt)
+
 @app.route('/favicon.ico')
 def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Batch Writes
+Shared helper for writing rows to Supabase in batches: a failed batch is
+retried, then split in half until the rows that cannot be written are
+isolated (used by import_products.py, sync_products.py, reconcile.py and
+local_store.py)
+"""
+
+import time
+
+# Rows written per batch, and attempts for a whole batch or a single row
+IMPORT_WINDOW = 500
+MAX_ATTEMPTS = 2
+RETRY_BACKOFF_SECONDS = 2
+
+def _write_with_retry(write, batch):
+    """Write a batch, retrying once after a pause; re-raises the last error"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            write(batch)
+            return
+        except Exception:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            time.sleep(RETRY_BACKOFF_SECONDS)
+
+def upsert_bisecting(write, batch, rejects, top_level=True):
+    """Upsert a batch of (row number, record) pairs; returns the number of records written.
+
+    A failed batch is split in half and each half retried, so a few bad
+    rows cost about 2 * log2(batch size) requests to isolate instead of one
+    request per row. Whole batches and single rows are retried once first,
+    so a passing network error does not reject good rows.
+    """
+    try:
+        if top_level or len(batch) == 1:
+            _write_with_retry(write, batch)
+        else:
+            write(batch)
+        return len(batch)
+    except Exception as e:
+        if len(batch) == 1:
+            rejects.append((batch[0][0], batch[0][1], str(e)))
+            return 0
+        middle = len(batch) // 2
+        return (upsert_bisecting(write, batch[:middle], rejects, top_level=False) +
+                upsert_bisecting(write, batch[middle:], rejects, top_level=False))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Inventory Ledger Compaction
+Checkpoints ledger balances into inventory_snapshots so that stock on any date
+is the nearest snapshot plus a short replay of inventory_movements.
+Schedule it periodically (e.g. a nightly cron job).
+"""
+
+import sys
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+from supabase_manager import create_supabase_manager
+
+def main():
+    parser = argparse.ArgumentParser(description='Write inventory ledger snapshots')
+    parser.add_argument('--at', type=str, help='Snapshot time (ISO format, default: now)')
+    
+    args = parser.parse_args()
+    
+    load_dotenv()
+    manager = create_supabase_manager()
+    if not manager:
+        print("Error: Supabase is not configured")
+        sys.exit(1)
+    
+    at = datetime.fromisoformat(args.at) if args.at else None
+    created = manager.compact_inventory_snapshots(at)
+    print(f"Created {created} inventory snapshots")
+
+if __name__ == '__main__':
+    main()
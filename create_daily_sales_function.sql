@@ -0,0 +1,50 @@
+-- ยอดขายรายวันแบบมีพารามิเตอร์ (แทนการต่อสตริง SQL ส่งผ่าน execute_sql)
+-- รันใน Supabase SQL Editor
+
+-- Covering index for the date-range scan, per branch or across all branches
+CREATE INDEX IF NOT EXISTS idx_sales_branch_date ON sales(branch_id, transaction_date) INCLUDE (total_amount);
+CREATE INDEX IF NOT EXISTS idx_sales_date_amount ON sales(transaction_date) INCLUDE (total_amount);
+
+-- Returns one row per day in [p_start_date, p_end_date], zero-filled, oldest first.
+-- plpgsql caches the plan of each RETURN QUERY per session; the branch filter is
+-- split into two statements so each keeps a plan that fits its own index.
+CREATE OR REPLACE FUNCTION get_daily_sales_summary(
+    p_start_date DATE,
+    p_end_date DATE,
+    p_branch_id UUID DEFAULT NULL
+)
+RETURNS TABLE (sale_date DATE, transaction_count BIGINT, total_sales NUMERIC)
+LANGUAGE plpgsql STABLE AS $$
+BEGIN
+    IF p_branch_id IS NULL THEN
+        RETURN QUERY
+        SELECT d.day::DATE, COALESCE(s.cnt, 0)::BIGINT, COALESCE(s.amount, 0)::NUMERIC
+        FROM generate_series(p_start_date, p_end_date, INTERVAL '1 day') AS d(day)
+        LEFT JOIN (
+            SELECT DATE(sa.transaction_date) AS day, COUNT(*) AS cnt, SUM(sa.total_amount) AS amount
+            FROM sales sa
+            WHERE sa.transaction_date >= p_start_date
+              AND sa.transaction_date < p_end_date + 1
+            GROUP BY DATE(sa.transaction_date)
+        ) s ON s.day = d.day::DATE
+        ORDER BY d.day;
+    ELSE
+        RETURN QUERY
+        SELECT d.day::DATE, COALESCE(s.cnt, 0)::BIGINT, COALESCE(s.amount, 0)::NUMERIC
+        FROM generate_series(p_start_date, p_end_date, INTERVAL '1 day') AS d(day)
+        LEFT JOIN (
+            SELECT DATE(sa.transaction_date) AS day, COUNT(*) AS cnt, SUM(sa.total_amount) AS amount
+            FROM sales sa
+            WHERE sa.branch_id = p_branch_id
+              AND sa.transaction_date >= p_start_date
+              AND sa.transaction_date < p_end_date + 1
+            GROUP BY DATE(sa.transaction_date)
+        ) s ON s.day = d.day::DATE
+        ORDER BY d.day;
+    END IF;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_daily_sales_summary(DATE, DATE, UUID) TO anon, authenticated;
+
+SELECT 'get_daily_sales_summary พร้อมใช้งาน' as status;
@@ -0,0 +1,64 @@
+-- พยากรณ์ความต้องการสินค้า (demand forecast) ต่อสินค้าและสาขา
+-- เขียนโดย forecast_demand.py และอ่านโดยรายงานสรุป / การคำนวณจุดสั่งซื้อ
+-- รันใน Supabase SQL Editor (หลังจาก create_sales_rollups.sql, ก่อน create_replenishment_function.sql)
+
+-- 1. Latest forecast per product and branch
+CREATE TABLE IF NOT EXISTS demand_forecasts (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    branch_id UUID NOT NULL REFERENCES branches(id) ON DELETE CASCADE,
+    forecast_date DATE NOT NULL,            -- day the job ran; history ends the day before
+    daily_demand DOUBLE PRECISION NOT NULL, -- forecast units per day
+    horizon_days INTEGER NOT NULL,
+    forecast_quantity DOUBLE PRECISION NOT NULL, -- daily_demand * horizon_days
+    method VARCHAR(20) NOT NULL,            -- 'ses', 'croston' or 'none'
+    history_days INTEGER NOT NULL,
+    sale_days INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (product_id, branch_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_demand_forecasts_date ON demand_forecasts(forecast_date);
+
+-- 2. Per-product history lookups for the forecasting job
+CREATE INDEX IF NOT EXISTS idx_daily_product_rollup_product_date ON daily_product_sales_rollup(product_id, sale_date);
+
+-- Daily sales of one batch of active products (ordered by id, after p_after_product_id),
+-- as one JSON document of column arrays; days without sales are omitted
+CREATE OR REPLACE FUNCTION get_sales_history_batch(
+    p_start_date DATE,
+    p_end_date DATE,
+    p_after_product_id UUID DEFAULT NULL,
+    p_product_limit INTEGER DEFAULT 2000
+)
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH batch_products AS (
+        SELECT id
+        FROM products
+        WHERE is_active = true
+          AND (p_after_product_id IS NULL OR id > p_after_product_id)
+        ORDER BY id
+        LIMIT p_product_limit
+    ),
+    history AS (
+        SELECT r.product_id, r.branch_id, r.sale_date, r.quantity
+        FROM daily_product_sales_rollup r
+        JOIN batch_products bp ON bp.id = r.product_id
+        WHERE r.sale_date BETWEEN p_start_date AND p_end_date
+          AND r.branch_id IS NOT NULL
+          AND r.quantity <> 0
+    )
+    SELECT json_build_object(
+        'last_product_id', (SELECT id FROM batch_products ORDER BY id DESC LIMIT 1),
+        'product_id', COALESCE(array_agg(h.product_id), '{}'),
+        'branch_id', COALESCE(array_agg(h.branch_id), '{}'),
+        'sale_date', COALESCE(array_agg(h.sale_date), '{}'),
+        'quantity', COALESCE(array_agg(h.quantity), '{}')
+    )
+    FROM history h;
+$$;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON demand_forecasts TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_sales_history_batch(DATE, DATE, UUID, INTEGER) TO anon, authenticated;
+
+SELECT 'demand_forecasts และ get_sales_history_batch พร้อมใช้งาน' as status;
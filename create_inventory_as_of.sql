@@ -0,0 +1,65 @@
+-- สต๊อก ณ เวลาใดๆ (as_of) ของทั้งสาขา: snapshot ล่าสุดก่อนเวลานั้น + movements หลัง snapshot
+-- รันใน Supabase SQL Editor (หลังจาก create_inventory_ledger.sql)
+
+-- Nearest snapshot per product in a branch, and the movements after it
+CREATE INDEX IF NOT EXISTS idx_inventory_snapshots_branch_product_at
+    ON inventory_snapshots(branch_id, product_id, snapshot_at DESC);
+CREATE INDEX IF NOT EXISTS idx_movements_branch_product_date
+    ON inventory_movements(branch_id, product_id, performed_at);
+
+-- One set-based query for the whole branch (or one product), returned as a single
+-- JSON array so large branches are not cut off by the API row limit
+CREATE OR REPLACE FUNCTION get_inventory_as_of(
+    p_branch_id UUID,
+    p_as_of TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    p_product_id UUID DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH last_snapshot AS (
+        SELECT DISTINCT ON (product_id) product_id, snapshot_at, quantity
+        FROM inventory_snapshots
+        WHERE branch_id = p_branch_id
+          AND snapshot_at <= p_as_of
+          AND (p_product_id IS NULL OR product_id = p_product_id)
+        ORDER BY product_id, snapshot_at DESC
+    ),
+    replay AS (
+        SELECT m.product_id,
+               SUM(movement_delta(m.movement_type, m.quantity)) AS delta,
+               COUNT(*) AS movements,
+               MAX(m.performed_at) AS last_movement_at
+        FROM inventory_movements m
+        LEFT JOIN last_snapshot s ON s.product_id = m.product_id
+        WHERE m.branch_id = p_branch_id
+          AND m.performed_at > COALESCE(s.snapshot_at, '-infinity')
+          AND m.performed_at <= p_as_of
+          AND (p_product_id IS NULL OR m.product_id = p_product_id)
+        GROUP BY m.product_id
+    ),
+    balances AS (
+        SELECT COALESCE(s.product_id, r.product_id) AS product_id,
+               COALESCE(s.quantity, 0) + COALESCE(r.delta, 0) AS quantity,
+               s.snapshot_at,
+               COALESCE(r.movements, 0) AS movements_replayed,
+               COALESCE(r.last_movement_at, s.snapshot_at) AS last_movement_at
+        FROM last_snapshot s
+        FULL JOIN replay r ON r.product_id = s.product_id
+    )
+    SELECT COALESCE(json_agg(json_build_object(
+               'product_id', bl.product_id,
+               'barcode', p.barcode,
+               'sku', p.sku,
+               'product_name', p.name,
+               'quantity', bl.quantity,
+               'snapshot_at', bl.snapshot_at,
+               'movements_replayed', bl.movements_replayed,
+               'last_movement_at', bl.last_movement_at
+           ) ORDER BY p.name, bl.product_id), '[]'::JSON)
+    FROM balances bl
+    JOIN products p ON p.id = bl.product_id;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_inventory_as_of(UUID, TIMESTAMP WITH TIME ZONE, UUID) TO anon, authenticated;
+
+SELECT 'get_inventory_as_of พร้อมใช้งาน' as status;
@@ -0,0 +1,303 @@
+-- สมุดบัญชีความเคลื่อนไหวสต๊อก (append-only) พร้อม snapshot ยอดคงเหลือเป็นระยะ
+-- ทุกการนับ การขาย และการปรับยอด ถูกบันทึกใน inventory_movements
+-- inventory.current_quantity คำนวณจาก ledger (ไม่เขียนทับโดยตรงอีกต่อไป)
+-- รันใน Supabase SQL Editor (หลังจาก create_variance_engine.sql)
+
+-- 1. Ledger table (database_schema.sql creates it; repeated here for older databases)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'movement_type') THEN
+        CREATE TYPE movement_type AS ENUM ('in', 'out', 'adjustment');
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS inventory_movements (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    product_id UUID REFERENCES products(id) ON DELETE CASCADE,
+    branch_id UUID REFERENCES branches(id) ON DELETE CASCADE,
+    movement_type movement_type NOT NULL,
+    quantity INTEGER NOT NULL,
+    unit_cost DECIMAL(10,2),
+    reference_type VARCHAR(50), -- 'sale', 'sale_reversal', 'count', 'adjustment', 'opening', ...
+    reference_id UUID,
+    reason TEXT,
+    performed_by UUID REFERENCES users(id),
+    performed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    notes TEXT
+);
+
+ALTER TABLE inventory_movements ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_movements_product_branch_date ON inventory_movements(product_id, branch_id, performed_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_product_branch_unique ON inventory(product_id, branch_id);
+
+-- 'in' / 'out' carry positive quantities; 'adjustment' is signed
+CREATE OR REPLACE FUNCTION movement_delta(p_type movement_type, p_quantity INTEGER)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE p_type WHEN 'out' THEN -p_quantity ELSE p_quantity END;
+$$;
+
+-- 2. Append-only: movements are corrected by new movements, never edited
+--    (deletes cascading from a removed product or branch are still allowed)
+CREATE OR REPLACE FUNCTION inventory_movements_append_only()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' AND pg_trigger_depth() > 1 THEN
+        RETURN OLD;
+    END IF;
+    RAISE EXCEPTION 'inventory_movements is append-only; record a correcting movement instead';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS inventory_movements_no_change ON inventory_movements;
+CREATE TRIGGER inventory_movements_no_change
+    BEFORE UPDATE OR DELETE ON inventory_movements
+    FOR EACH ROW EXECUTE FUNCTION inventory_movements_append_only();
+
+-- 3. Snapshots: checkpointed balances, written by compact_inventory_snapshots()
+CREATE TABLE IF NOT EXISTS inventory_snapshots (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    branch_id UUID NOT NULL REFERENCES branches(id) ON DELETE CASCADE,
+    snapshot_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    quantity INTEGER NOT NULL,
+    movement_count INTEGER NOT NULL DEFAULT 0, -- movements folded in since the previous snapshot
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (product_id, branch_id, snapshot_at)
+);
+
+-- 4. Applying a movement: keep inventory.current_quantity equal to the ledger balance,
+--    and drop snapshots a back-dated movement has made stale (the compactor rewrites them)
+CREATE OR REPLACE FUNCTION inventory_movements_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_delta INTEGER := movement_delta(NEW.movement_type, NEW.quantity);
+BEGIN
+    DELETE FROM inventory_snapshots
+    WHERE product_id = NEW.product_id AND branch_id = NEW.branch_id
+      AND snapshot_at >= NEW.performed_at;
+
+    -- An opening movement records the balance inventory already holds
+    IF NEW.reference_type = 'opening' THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO inventory (product_id, branch_id, current_quantity, last_updated_at)
+    VALUES (NEW.product_id, NEW.branch_id, v_delta, NOW())
+    ON CONFLICT (product_id, branch_id) DO UPDATE
+    SET current_quantity = COALESCE(inventory.current_quantity, 0) + v_delta,
+        last_updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS inventory_movements_apply ON inventory_movements;
+CREATE TRIGGER inventory_movements_apply
+    AFTER INSERT ON inventory_movements
+    FOR EACH ROW EXECUTE FUNCTION inventory_movements_apply();
+
+-- 5. Balance at any time: nearest snapshot at or before p_at plus the movements after it.
+--    NULL when the product has no history in the branch.
+CREATE OR REPLACE FUNCTION inventory_balance_at(p_product_id UUID, p_branch_id UUID,
+                                                p_at TIMESTAMP WITH TIME ZONE DEFAULT NOW())
+RETURNS INTEGER
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    v_base INTEGER;
+    v_since TIMESTAMP WITH TIME ZONE;
+    v_has_snapshot BOOLEAN;
+    v_delta BIGINT;
+    v_movements BIGINT;
+BEGIN
+    SELECT quantity, snapshot_at INTO v_base, v_since
+    FROM inventory_snapshots
+    WHERE product_id = p_product_id AND branch_id = p_branch_id AND snapshot_at <= p_at
+    ORDER BY snapshot_at DESC
+    LIMIT 1;
+    v_has_snapshot := FOUND;
+
+    SELECT SUM(movement_delta(movement_type, quantity)), COUNT(*) INTO v_delta, v_movements
+    FROM inventory_movements
+    WHERE product_id = p_product_id AND branch_id = p_branch_id
+      AND performed_at > COALESCE(v_since, '-infinity')
+      AND performed_at <= p_at;
+
+    IF NOT v_has_snapshot AND v_movements = 0 THEN
+        RETURN NULL;
+    END IF;
+    RETURN COALESCE(v_base, 0) + COALESCE(v_delta, 0);
+END;
+$$;
+
+-- 6. Compactor: one new snapshot per product/branch with movements since its last
+--    snapshot. Run periodically (compact_inventory_ledger.py, e.g. nightly).
+CREATE OR REPLACE FUNCTION compact_inventory_snapshots(p_at TIMESTAMP WITH TIME ZONE DEFAULT NOW())
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_created INTEGER;
+BEGIN
+    WITH last_snapshot AS (
+        SELECT DISTINCT ON (product_id, branch_id) product_id, branch_id, snapshot_at, quantity
+        FROM inventory_snapshots
+        WHERE snapshot_at <= p_at
+        ORDER BY product_id, branch_id, snapshot_at DESC
+    ),
+    pending AS (
+        SELECT m.product_id, m.branch_id,
+               SUM(movement_delta(m.movement_type, m.quantity)) AS delta,
+               COUNT(*) AS movements
+        FROM inventory_movements m
+        LEFT JOIN last_snapshot s ON s.product_id = m.product_id AND s.branch_id = m.branch_id
+        WHERE m.performed_at > COALESCE(s.snapshot_at, '-infinity')
+          AND m.performed_at <= p_at
+          AND m.product_id IS NOT NULL AND m.branch_id IS NOT NULL
+        GROUP BY m.product_id, m.branch_id
+    )
+    INSERT INTO inventory_snapshots (product_id, branch_id, snapshot_at, quantity, movement_count)
+    SELECT p.product_id, p.branch_id, p_at, COALESCE(s.quantity, 0) + p.delta, p.movements
+    FROM pending p
+    LEFT JOIN last_snapshot s ON s.product_id = p.product_id AND s.branch_id = p.branch_id
+    ON CONFLICT (product_id, branch_id, snapshot_at) DO NOTHING;
+
+    GET DIAGNOSTICS v_created = ROW_COUNT;
+    RETURN v_created;
+END;
+$$;
+
+-- 7. Ledger writers
+-- Sales: each line item takes stock out; removing a line item puts it back
+CREATE OR REPLACE FUNCTION sale_items_ledger_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_branch_id UUID;
+    v_date TIMESTAMP WITH TIME ZONE;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT branch_id, transaction_date INTO v_branch_id, v_date FROM sales WHERE id = OLD.sale_id;
+        IF v_branch_id IS NOT NULL AND OLD.product_id IS NOT NULL THEN
+            INSERT INTO inventory_movements (product_id, branch_id, movement_type, quantity,
+                                             reference_type, reference_id, performed_at)
+            VALUES (OLD.product_id, v_branch_id, 'in', OLD.quantity, 'sale_reversal', OLD.sale_id, NOW());
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT branch_id, transaction_date INTO v_branch_id, v_date FROM sales WHERE id = NEW.sale_id;
+        IF v_branch_id IS NOT NULL AND NEW.product_id IS NOT NULL THEN
+            INSERT INTO inventory_movements (product_id, branch_id, movement_type, quantity,
+                                             reference_type, reference_id, performed_at)
+            VALUES (NEW.product_id, v_branch_id, 'out', NEW.quantity, 'sale', NEW.sale_id, COALESCE(v_date, NOW()));
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sale_items_ledger ON sale_items;
+CREATE TRIGGER sale_items_ledger
+    AFTER INSERT OR DELETE OR UPDATE OF sale_id, product_id, quantity ON sale_items
+    FOR EACH ROW EXECUTE FUNCTION sale_items_ledger_trigger();
+
+-- Deleting a sale: runs BEFORE the delete, while its items still exist. The items
+-- removed by ON DELETE CASCADE no longer find their sale, so sale_items_ledger_trigger
+-- skips them and their stock is only put back here.
+CREATE OR REPLACE FUNCTION sales_delete_ledger_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.branch_id IS NOT NULL THEN
+        INSERT INTO inventory_movements (product_id, branch_id, movement_type, quantity,
+                                         reference_type, reference_id, performed_at)
+        SELECT si.product_id, OLD.branch_id, 'in', si.quantity, 'sale_reversal', OLD.id, NOW()
+        FROM sale_items si
+        WHERE si.sale_id = OLD.id AND si.product_id IS NOT NULL;
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_delete_ledger ON sales;
+CREATE TRIGGER sales_delete_ledger
+    BEFORE DELETE ON sales
+    FOR EACH ROW EXECUTE FUNCTION sales_delete_ledger_trigger();
+
+-- Counts: an adjustment that brings the ledger balance to the counted quantity
+CREATE OR REPLACE FUNCTION stock_counts_ledger_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_at TIMESTAMP WITH TIME ZONE := COALESCE(NEW.counted_at, NOW());
+BEGIN
+    IF NEW.product_id IS NULL OR NEW.branch_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- Same lock as set_inventory_quantity: two counts committed together must not
+    -- both adjust from the old balance. The balance below is read after the lock,
+    -- so it sees the other count's movement.
+    PERFORM pg_advisory_xact_lock(hashtext(NEW.product_id::TEXT || ':' || NEW.branch_id::TEXT));
+
+    INSERT INTO inventory_movements (product_id, branch_id, movement_type, quantity,
+                                     reference_type, reference_id, reason, performed_by, performed_at)
+    VALUES (NEW.product_id, NEW.branch_id, 'adjustment',
+            NEW.counted_quantity - COALESCE(inventory_balance_at(NEW.product_id, NEW.branch_id, v_at), 0),
+            'count', NEW.id, NEW.counter_name, NEW.counted_by, v_at);
+
+    UPDATE inventory
+    SET last_counted_at = GREATEST(last_counted_at, v_at),
+        last_counted_by = COALESCE(NEW.counted_by, last_counted_by)
+    WHERE product_id = NEW.product_id AND branch_id = NEW.branch_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stock_counts_ledger ON stock_counts;
+CREATE TRIGGER stock_counts_ledger
+    AFTER INSERT ON stock_counts
+    FOR EACH ROW EXECUTE FUNCTION stock_counts_ledger_trigger();
+
+-- Manual corrections: set a quantity through an adjustment movement
+CREATE OR REPLACE FUNCTION set_inventory_quantity(p_product_id UUID, p_branch_id UUID, p_quantity INTEGER,
+                                                  p_reason TEXT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_delta INTEGER;
+BEGIN
+    -- Serialize concurrent corrections of the same item
+    PERFORM pg_advisory_xact_lock(hashtext(p_product_id::TEXT || ':' || p_branch_id::TEXT));
+
+    v_delta := p_quantity - COALESCE(inventory_balance_at(p_product_id, p_branch_id, NOW()), 0);
+    INSERT INTO inventory_movements (product_id, branch_id, movement_type, quantity, reference_type, reason)
+    VALUES (p_product_id, p_branch_id, 'adjustment', v_delta, 'adjustment', p_reason);
+    RETURN v_delta;
+END;
+$$;
+
+-- 8. Expected quantity at count time is now the ledger balance
+--    (replaces the version in create_variance_engine.sql)
+CREATE OR REPLACE FUNCTION expected_stock_quantity(p_product_id UUID, p_branch_id UUID, p_at TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER
+LANGUAGE sql STABLE AS $$
+    SELECT inventory_balance_at(p_product_id, p_branch_id, p_at);
+$$;
+
+-- 9. Opening balances for inventory rows without ledger history (safe to re-run),
+--    then a first snapshot
+INSERT INTO inventory_movements (product_id, branch_id, movement_type, quantity, reference_type, reason, performed_at)
+SELECT i.product_id, i.branch_id, 'adjustment', COALESCE(i.current_quantity, 0), 'opening',
+       'Opening balance from inventory', NOW()
+FROM inventory i
+WHERE i.product_id IS NOT NULL AND i.branch_id IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM inventory_movements m
+      WHERE m.product_id = i.product_id AND m.branch_id = i.branch_id
+  );
+
+SELECT compact_inventory_snapshots();
+
+GRANT SELECT ON inventory_movements, inventory_snapshots TO anon, authenticated;
+GRANT INSERT ON inventory_movements TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION inventory_balance_at(UUID, UUID, TIMESTAMP WITH TIME ZONE) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION compact_inventory_snapshots(TIMESTAMP WITH TIME ZONE) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION set_inventory_quantity(UUID, UUID, INTEGER, TEXT) TO anon, authenticated;
+
+SELECT 'Inventory ledger (inventory_movements + inventory_snapshots) พร้อมใช้งาน' as status;
@@ -0,0 +1,86 @@
+-- สินค้าใกล้หมด: คัดกรองฝั่งฐานข้อมูลแทนการดึง inventory ทั้งตารางมากรองใน Python
+-- รันใน Supabase SQL Editor (หลังจาก database_schema.sql / create_missing_tables.sql)
+
+-- 1. คอลัมน์ที่แอปเขียนจริง (current_quantity) และสำเนา reorder_level ของสินค้า
+--    การเก็บ reorder_level ไว้ในแถว inventory ทำให้เงื่อนไข stock <= reorder_level
+--    อยู่ในตารางเดียวและสร้าง partial index ได้
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS current_quantity INTEGER DEFAULT 0;
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS reorder_level INTEGER NOT NULL DEFAULT 0;
+
+UPDATE inventory i
+SET reorder_level = COALESCE(p.reorder_level, 0)
+FROM products p
+WHERE p.id = i.product_id
+  AND i.reorder_level IS DISTINCT FROM COALESCE(p.reorder_level, 0);
+
+-- 2. Triggers keep inventory.reorder_level in sync with products.reorder_level
+CREATE OR REPLACE FUNCTION inventory_copy_reorder_level()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT COALESCE(reorder_level, 0) INTO NEW.reorder_level
+    FROM products WHERE id = NEW.product_id;
+    NEW.reorder_level = COALESCE(NEW.reorder_level, 0);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS inventory_reorder_level_on_write ON inventory;
+CREATE TRIGGER inventory_reorder_level_on_write
+    BEFORE INSERT OR UPDATE OF product_id ON inventory
+    FOR EACH ROW EXECUTE FUNCTION inventory_copy_reorder_level();
+
+CREATE OR REPLACE FUNCTION products_propagate_reorder_level()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE inventory
+    SET reorder_level = COALESCE(NEW.reorder_level, 0)
+    WHERE product_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_reorder_level_changed ON products;
+CREATE TRIGGER products_reorder_level_changed
+    AFTER UPDATE OF reorder_level ON products
+    FOR EACH ROW
+    WHEN (OLD.reorder_level IS DISTINCT FROM NEW.reorder_level)
+    EXECUTE FUNCTION products_propagate_reorder_level();
+
+-- 3. Partial index: contains only the rows that are currently low on stock
+CREATE INDEX IF NOT EXISTS idx_inventory_low_stock
+    ON inventory(branch_id, product_id)
+    WHERE current_quantity <= reorder_level;
+
+-- 4. View used by SupabaseManager.get_low_stock_alerts
+CREATE OR REPLACE VIEW low_stock_inventory AS
+SELECT
+    i.id,
+    i.product_id,
+    i.branch_id,
+    i.current_quantity,
+    i.reorder_level,
+    i.last_counted_at,
+    p.sku,
+    p.barcode,
+    p.name AS product_name,
+    b.name AS branch_name,
+    b.code AS branch_code
+FROM inventory i
+JOIN products p ON p.id = i.product_id
+JOIN branches b ON b.id = i.branch_id
+WHERE i.current_quantity <= i.reorder_level;
+
+-- 5. Count-only variant for the dashboard badge
+CREATE OR REPLACE FUNCTION count_low_stock_items(p_branch_id UUID DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE sql STABLE AS $$
+    SELECT COUNT(*)::INTEGER
+    FROM inventory
+    WHERE current_quantity <= reorder_level
+      AND (p_branch_id IS NULL OR branch_id = p_branch_id);
+$$;
+
+GRANT SELECT ON low_stock_inventory TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION count_low_stock_items(UUID) TO anon, authenticated;
+
+SELECT 'low_stock_inventory view และ count_low_stock_items พร้อมใช้งาน' as status;
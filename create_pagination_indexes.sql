@@ -0,0 +1,15 @@
+-- Indexes สำหรับ keyset pagination (การแบ่งหน้าแบบ cursor)
+-- รันใน Supabase SQL Editor
+
+-- stock_counts: (counted_at, id) newest first, optionally per branch
+CREATE INDEX IF NOT EXISTS idx_stock_counts_counted_at_id ON stock_counts(counted_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_stock_counts_branch_counted_at_id ON stock_counts(branch_id, counted_at DESC, id DESC);
+
+-- alerts: (created_at, id) newest first, active alerts only
+CREATE INDEX IF NOT EXISTS idx_alerts_active_created_at_id ON alerts(created_at DESC, id DESC) WHERE is_resolved = false;
+CREATE INDEX IF NOT EXISTS idx_alerts_active_branch_created_at_id ON alerts(branch_id, created_at DESC, id DESC) WHERE is_resolved = false;
+
+-- products: (name, id) for the product listing, active products only
+CREATE INDEX IF NOT EXISTS idx_products_active_name_id ON products(name, id) WHERE is_active = true;
+
+SELECT 'Pagination indexes ถูกสร้างสำเร็จแล้ว' as status;
@@ -0,0 +1,67 @@
+-- ฟังก์ชันสำหรับตรวจสอบความตรงกันของรายการสินค้าระหว่าง Google Sheets และ Supabase (reconcile.py)
+-- รันใน Supabase SQL Editor (หลังจาก create_products_table.sql)
+
+-- Key ranges are compared in byte order (COLLATE "C"), the same order Python sorts
+-- strings in, so both sides agree on which rows fall in a range
+CREATE INDEX IF NOT EXISTS idx_products_active_barcode_c ON products ((barcode COLLATE "C")) WHERE is_active = true;
+
+-- Row count and hash of the active products in each barcode range [p_lows[i], p_highs[i])
+-- (a NULL high is unbounded). A range hash is md5 of the concatenated row hashes in
+-- barcode order, a row hash is md5('barcode|sku|name'), or md5('barcode|name') when
+-- p_with_sku is false (sheets without an SKU column). Returns one JSON document of
+-- column arrays in the order of the ranges given.
+DROP FUNCTION IF EXISTS get_product_range_hashes(TEXT[], TEXT[]);
+CREATE OR REPLACE FUNCTION get_product_range_hashes(p_lows TEXT[], p_highs TEXT[], p_with_sku BOOLEAN DEFAULT true)
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH ranges AS (
+        SELECT lo, hi, ord
+        FROM unnest(p_lows, p_highs) WITH ORDINALITY AS r(lo, hi, ord)
+    ),
+    hashed AS (
+        SELECT r.ord,
+               COUNT(p.barcode) AS row_count,
+               md5(COALESCE(string_agg(md5(concat_ws('|', p.barcode, CASE WHEN p_with_sku THEN COALESCE(p.sku, '') END, p.name)), ''
+                                       ORDER BY p.barcode COLLATE "C"), '')) AS range_hash
+        FROM ranges r
+        LEFT JOIN products p
+               ON p.is_active = true
+              AND p.barcode COLLATE "C" >= r.lo COLLATE "C"
+              AND (r.hi IS NULL OR p.barcode COLLATE "C" < r.hi COLLATE "C")
+        GROUP BY r.ord
+    )
+    SELECT json_build_object(
+        'count', COALESCE(array_agg(row_count ORDER BY ord), '{}'),
+        'hash', COALESCE(array_agg(range_hash ORDER BY ord), '{}')
+    )
+    FROM hashed;
+$$;
+
+-- The active products in the given barcode ranges (same bounds as above), as column arrays
+CREATE OR REPLACE FUNCTION get_product_range_rows(p_lows TEXT[], p_highs TEXT[])
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH ranges AS (
+        SELECT lo, hi
+        FROM unnest(p_lows, p_highs) AS r(lo, hi)
+    ),
+    matched AS (
+        SELECT DISTINCT p.barcode, p.sku, p.name
+        FROM ranges r
+        JOIN products p
+          ON p.is_active = true
+         AND p.barcode COLLATE "C" >= r.lo COLLATE "C"
+         AND (r.hi IS NULL OR p.barcode COLLATE "C" < r.hi COLLATE "C")
+    )
+    SELECT json_build_object(
+        'barcode', COALESCE(array_agg(barcode ORDER BY barcode COLLATE "C"), '{}'),
+        'sku', COALESCE(array_agg(sku ORDER BY barcode COLLATE "C"), '{}'),
+        'name', COALESCE(array_agg(name ORDER BY barcode COLLATE "C"), '{}')
+    )
+    FROM matched;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_product_range_hashes(TEXT[], TEXT[], BOOLEAN) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_product_range_rows(TEXT[], TEXT[]) TO anon, authenticated;
+
+SELECT 'ฟังก์ชัน reconciliation พร้อมใช้งาน' as status;
@@ -0,0 +1,74 @@
+-- ข้อมูลสำหรับคำนวณวันคงเหลือและจำนวนแนะนำสั่งซื้อ (รายงานสรุป /report/summary)
+-- รันใน Supabase SQL Editor (หลังจาก create_low_stock_view.sql, create_sales_rollups.sql และ create_demand_forecasts.sql)
+
+-- Date-range scan of the product rollup across all branches
+CREATE INDEX IF NOT EXISTS idx_daily_product_rollup_date ON daily_product_sales_rollup(sale_date);
+
+-- Returns one JSON document of column arrays (products, branches and one cell per
+-- product/branch with stock or recent sales). A single document is not cut off by
+-- the API row limit and loads straight into NumPy arrays in replenishment.py.
+-- forecast_daily is the forecast_demand.py demand per day (NULL when there is no
+-- forecast from the last week; replenishment.py then uses recent sales).
+CREATE OR REPLACE FUNCTION get_replenishment_inputs(p_as_of DATE DEFAULT CURRENT_DATE)
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH sold AS (
+        SELECT product_id, branch_id,
+               SUM(quantity) AS sold_30days,
+               SUM(quantity) FILTER (WHERE sale_date > p_as_of - 7) AS sold_7days
+        FROM daily_product_sales_rollup
+        WHERE sale_date > p_as_of - 30 AND sale_date <= p_as_of
+          AND product_id IS NOT NULL AND branch_id IS NOT NULL
+        GROUP BY product_id, branch_id
+    ),
+    cells AS (
+        SELECT COALESCE(i.product_id, s.product_id) AS product_id,
+               COALESCE(i.branch_id, s.branch_id) AS branch_id,
+               COALESCE(i.current_quantity, 0) AS current_quantity,
+               i.id IS NOT NULL AS counted,
+               COALESCE(s.sold_30days, 0) AS sold_30days,
+               COALESCE(s.sold_7days, 0) AS sold_7days,
+               f.daily_demand AS forecast_daily
+        FROM inventory i
+        FULL JOIN sold s ON s.product_id = i.product_id AND s.branch_id = i.branch_id
+        LEFT JOIN demand_forecasts f
+               ON f.product_id = COALESCE(i.product_id, s.product_id)
+              AND f.branch_id = COALESCE(i.branch_id, s.branch_id)
+              AND f.forecast_date > p_as_of - 7
+    )
+    SELECT json_build_object(
+        'products', (
+            SELECT json_build_object(
+                'id', COALESCE(array_agg(id ORDER BY name), '{}'),
+                'barcode', COALESCE(array_agg(barcode ORDER BY name), '{}'),
+                'name', COALESCE(array_agg(name ORDER BY name), '{}'),
+                'reorder_level', COALESCE(array_agg(COALESCE(reorder_level, 0) ORDER BY name), '{}'),
+                'max_stock_level', COALESCE(array_agg(max_stock_level ORDER BY name), '{}')
+            )
+            FROM products WHERE is_active = true
+        ),
+        'branches', (
+            SELECT json_build_object(
+                'id', COALESCE(array_agg(id ORDER BY name), '{}'),
+                'name', COALESCE(array_agg(name ORDER BY name), '{}')
+            )
+            FROM branches WHERE is_active = true
+        ),
+        'cells', (
+            SELECT json_build_object(
+                'product_id', COALESCE(array_agg(product_id), '{}'),
+                'branch_id', COALESCE(array_agg(branch_id), '{}'),
+                'current_quantity', COALESCE(array_agg(current_quantity), '{}'),
+                'counted', COALESCE(array_agg(counted), '{}'),
+                'sold_30days', COALESCE(array_agg(sold_30days), '{}'),
+                'sold_7days', COALESCE(array_agg(sold_7days), '{}'),
+                'forecast_daily', COALESCE(array_agg(forecast_daily), '{}')
+            )
+            FROM cells
+        )
+    );
+$$;
+
+GRANT EXECUTE ON FUNCTION get_replenishment_inputs(DATE) TO anon, authenticated;
+
+SELECT 'get_replenishment_inputs พร้อมใช้งาน' as status;
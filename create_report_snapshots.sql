@@ -0,0 +1,16 @@
+-- รายงานที่คำนวณล่วงหน้า (report snapshots) สำหรับหน้ารายงานของผู้ดูแล
+-- เขียนโดย precompute_reports.py (ตั้ง cron ช่วงกลางคืน) และอ่านโดยหน้ารายงาน / Dashboard
+-- รันใน Supabase SQL Editor (หลังจาก create_slow_movers.sql และ create_variance_engine.sql)
+
+-- Latest precomputed copy of each report
+CREATE TABLE IF NOT EXISTS report_snapshots (
+    report_key VARCHAR(50) PRIMARY KEY,        -- 'summary', 'slow', 'variance', 'top_products'
+    payload JSONB NOT NULL,                    -- the report data as the page renders it
+    generated_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    duration_ms INTEGER,                       -- time taken to build the report
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON report_snapshots TO anon, authenticated;
+
+SELECT 'report_snapshots พร้อมใช้งาน' as status;
@@ -0,0 +1,247 @@
+-- ตารางสรุปยอดขายล่วงหน้า (rollups) สำหรับ Dashboard ตามช่วงเวลา
+-- รันใน Supabase SQL Editor (ต้องใช้ PostgreSQL 15+ สำหรับ NULLS NOT DISTINCT)
+
+-- 1. Rollup tables, maintained by triggers on sales / sale_items
+CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+    sale_date DATE NOT NULL,
+    branch_id UUID REFERENCES branches(id) ON DELETE CASCADE,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    total_sales DECIMAL(14,2) NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (sale_date, branch_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_product_sales_rollup (
+    sale_date DATE NOT NULL,
+    branch_id UUID REFERENCES branches(id) ON DELETE CASCADE,
+    product_id UUID REFERENCES products(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (sale_date, branch_id, product_id)
+);
+
+-- Monthly product totals keep long windows (90/365 days) as cheap as short ones
+CREATE TABLE IF NOT EXISTS monthly_product_sales_rollup (
+    sale_month DATE NOT NULL, -- first day of the month
+    branch_id UUID REFERENCES branches(id) ON DELETE CASCADE,
+    product_id UUID REFERENCES products(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (sale_month, branch_id, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_sales_rollup_branch_date ON daily_sales_rollup(branch_id, sale_date);
+CREATE INDEX IF NOT EXISTS idx_daily_product_rollup_branch_date ON daily_product_sales_rollup(branch_id, sale_date);
+CREATE INDEX IF NOT EXISTS idx_monthly_product_rollup_branch_month ON monthly_product_sales_rollup(branch_id, sale_month);
+
+-- 2. Trigger functions (insert / update / delete all adjust the rollups by delta)
+CREATE OR REPLACE FUNCTION apply_sales_rollup(p_date DATE, p_branch_id UUID, p_count INTEGER, p_amount NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO daily_sales_rollup (sale_date, branch_id, transaction_count, total_sales)
+    VALUES (p_date, p_branch_id, p_count, p_amount)
+    ON CONFLICT (sale_date, branch_id) DO UPDATE
+    SET transaction_count = daily_sales_rollup.transaction_count + EXCLUDED.transaction_count,
+        total_sales = daily_sales_rollup.total_sales + EXCLUDED.total_sales;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_product_sales_rollup(p_date DATE, p_branch_id UUID, p_product_id UUID,
+                                                      p_quantity INTEGER, p_revenue NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO daily_product_sales_rollup (sale_date, branch_id, product_id, quantity, revenue)
+    VALUES (p_date, p_branch_id, p_product_id, p_quantity, p_revenue)
+    ON CONFLICT (sale_date, branch_id, product_id) DO UPDATE
+    SET quantity = daily_product_sales_rollup.quantity + EXCLUDED.quantity,
+        revenue = daily_product_sales_rollup.revenue + EXCLUDED.revenue;
+
+    INSERT INTO monthly_product_sales_rollup (sale_month, branch_id, product_id, quantity, revenue)
+    VALUES (date_trunc('month', p_date)::DATE, p_branch_id, p_product_id, p_quantity, p_revenue)
+    ON CONFLICT (sale_month, branch_id, product_id) DO UPDATE
+    SET quantity = monthly_product_sales_rollup.quantity + EXCLUDED.quantity,
+        revenue = monthly_product_sales_rollup.revenue + EXCLUDED.revenue;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Adds (p_sign = 1) or removes (p_sign = -1) every item of a sale at the given date and branch
+CREATE OR REPLACE FUNCTION apply_sale_items_rollup(p_sale_id UUID, p_date DATE, p_branch_id UUID, p_sign INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_item RECORD;
+BEGIN
+    FOR v_item IN
+        SELECT product_id, SUM(quantity)::INTEGER AS quantity, SUM(COALESCE(total_price, 0)) AS revenue
+        FROM sale_items
+        WHERE sale_id = p_sale_id
+        GROUP BY product_id
+    LOOP
+        PERFORM apply_product_sales_rollup(p_date, p_branch_id, v_item.product_id,
+                                           p_sign * v_item.quantity, p_sign * v_item.revenue);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sales_rollup_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_sales_rollup(DATE(OLD.transaction_date), OLD.branch_id, -1, -COALESCE(OLD.total_amount, 0));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_sales_rollup(DATE(NEW.transaction_date), NEW.branch_id, 1, COALESCE(NEW.total_amount, 0));
+    END IF;
+    -- The items' product rollups follow the sale to its new date / branch
+    IF TG_OP = 'UPDATE' AND (DATE(OLD.transaction_date) IS DISTINCT FROM DATE(NEW.transaction_date)
+                             OR OLD.branch_id IS DISTINCT FROM NEW.branch_id) THEN
+        PERFORM apply_sale_items_rollup(NEW.id, DATE(OLD.transaction_date), OLD.branch_id, -1);
+        PERFORM apply_sale_items_rollup(NEW.id, DATE(NEW.transaction_date), NEW.branch_id, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Runs BEFORE a sale is deleted, while its items still exist. The items removed
+-- by ON DELETE CASCADE no longer find their sale, so sale_items_rollup_trigger
+-- skips them and they are only subtracted here.
+CREATE OR REPLACE FUNCTION sales_delete_items_rollup_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM apply_sale_items_rollup(OLD.id, DATE(OLD.transaction_date), OLD.branch_id, -1);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sale_items_rollup_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_date DATE;
+    v_branch_id UUID;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT DATE(transaction_date), branch_id INTO v_date, v_branch_id FROM sales WHERE id = OLD.sale_id;
+        IF FOUND THEN
+            PERFORM apply_product_sales_rollup(v_date, v_branch_id, OLD.product_id,
+                                               -OLD.quantity, -COALESCE(OLD.total_price, 0));
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT DATE(transaction_date), branch_id INTO v_date, v_branch_id FROM sales WHERE id = NEW.sale_id;
+        IF FOUND THEN
+            PERFORM apply_product_sales_rollup(v_date, v_branch_id, NEW.product_id,
+                                               NEW.quantity, COALESCE(NEW.total_price, 0));
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_rollup ON sales;
+CREATE TRIGGER sales_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF transaction_date, branch_id, total_amount ON sales
+    FOR EACH ROW EXECUTE FUNCTION sales_rollup_trigger();
+
+DROP TRIGGER IF EXISTS sales_delete_items_rollup ON sales;
+CREATE TRIGGER sales_delete_items_rollup
+    BEFORE DELETE ON sales
+    FOR EACH ROW EXECUTE FUNCTION sales_delete_items_rollup_trigger();
+
+DROP TRIGGER IF EXISTS sale_items_rollup ON sale_items;
+CREATE TRIGGER sale_items_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF sale_id, product_id, quantity, total_price ON sale_items
+    FOR EACH ROW EXECUTE FUNCTION sale_items_rollup_trigger();
+
+-- 3. Backfill from existing sales (safe to re-run)
+TRUNCATE daily_sales_rollup, daily_product_sales_rollup, monthly_product_sales_rollup;
+
+INSERT INTO daily_sales_rollup (sale_date, branch_id, transaction_count, total_sales)
+SELECT DATE(transaction_date), branch_id, COUNT(*), COALESCE(SUM(total_amount), 0)
+FROM sales
+GROUP BY DATE(transaction_date), branch_id;
+
+INSERT INTO daily_product_sales_rollup (sale_date, branch_id, product_id, quantity, revenue)
+SELECT DATE(s.transaction_date), s.branch_id, si.product_id, SUM(si.quantity), COALESCE(SUM(si.total_price), 0)
+FROM sale_items si
+JOIN sales s ON s.id = si.sale_id
+GROUP BY DATE(s.transaction_date), s.branch_id, si.product_id;
+
+INSERT INTO monthly_product_sales_rollup (sale_month, branch_id, product_id, quantity, revenue)
+SELECT date_trunc('month', sale_date)::DATE, branch_id, product_id, SUM(quantity), SUM(revenue)
+FROM daily_product_sales_rollup
+GROUP BY date_trunc('month', sale_date)::DATE, branch_id, product_id;
+
+-- 4. Period totals with the previous period of the same length for comparison
+CREATE OR REPLACE FUNCTION get_sales_period_summary(
+    p_start_date DATE,
+    p_end_date DATE,
+    p_branch_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    current_sales NUMERIC,
+    current_transactions BIGINT,
+    previous_sales NUMERIC,
+    previous_transactions BIGINT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        COALESCE(SUM(r.total_sales) FILTER (WHERE r.sale_date >= p_start_date), 0),
+        COALESCE(SUM(r.transaction_count) FILTER (WHERE r.sale_date >= p_start_date), 0)::BIGINT,
+        COALESCE(SUM(r.total_sales) FILTER (WHERE r.sale_date < p_start_date), 0),
+        COALESCE(SUM(r.transaction_count) FILTER (WHERE r.sale_date < p_start_date), 0)::BIGINT
+    FROM daily_sales_rollup r
+    WHERE r.sale_date BETWEEN p_start_date - (p_end_date - p_start_date + 1) AND p_end_date
+      AND (p_branch_id IS NULL OR r.branch_id = p_branch_id);
+$$;
+
+-- 5. Top products for a period: whole months from the monthly rollup,
+--    the partial months at either edge from the daily rollup
+CREATE OR REPLACE FUNCTION get_top_products_for_period(
+    p_start_date DATE,
+    p_end_date DATE,
+    p_branch_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 10
+)
+RETURNS TABLE (
+    product_id UUID,
+    name VARCHAR,
+    category VARCHAR,
+    barcode VARCHAR,
+    total_quantity BIGINT,
+    total_sales NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    WITH bounds AS (
+        SELECT
+            CASE WHEN p_start_date = date_trunc('month', p_start_date)::DATE
+                 THEN p_start_date
+                 ELSE (date_trunc('month', p_start_date) + INTERVAL '1 month')::DATE
+            END AS full_from,
+            date_trunc('month', p_end_date + 1)::DATE AS full_until
+    ),
+    period_rows AS (
+        SELECT m.product_id, m.quantity, m.revenue
+        FROM monthly_product_sales_rollup m, bounds b
+        WHERE m.sale_month >= b.full_from AND m.sale_month < b.full_until
+          AND (p_branch_id IS NULL OR m.branch_id = p_branch_id)
+        UNION ALL
+        SELECT d.product_id, d.quantity, d.revenue
+        FROM daily_product_sales_rollup d, bounds b
+        WHERE d.sale_date BETWEEN p_start_date AND p_end_date
+          AND NOT (d.sale_date >= b.full_from AND d.sale_date < b.full_until)
+          AND (p_branch_id IS NULL OR d.branch_id = p_branch_id)
+    )
+    SELECT pr.product_id, p.name, p.category, p.barcode,
+           SUM(pr.quantity)::BIGINT AS total_quantity,
+           SUM(pr.revenue) AS total_sales
+    FROM period_rows pr
+    JOIN products p ON p.id = pr.product_id
+    GROUP BY pr.product_id, p.name, p.category, p.barcode
+    HAVING SUM(pr.quantity) > 0
+    ORDER BY total_quantity DESC
+    LIMIT p_limit;
+$$;
+
+GRANT SELECT ON daily_sales_rollup, daily_product_sales_rollup, monthly_product_sales_rollup TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_sales_period_summary(DATE, DATE, UUID) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_top_products_for_period(DATE, DATE, UUID, INTEGER) TO anon, authenticated;
+
+SELECT 'Sales rollups และฟังก์ชันสรุปตามช่วงเวลา พร้อมใช้งาน' as status;
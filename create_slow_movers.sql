@@ -0,0 +1,118 @@
+-- สินค้าไม่เคลื่อนไหว: วันที่ขายล่าสุด / นับล่าสุด ต่อสินค้าและสาขา (อัปเดตแบบ incremental)
+-- รันใน Supabase SQL Editor (หลังจาก create_low_stock_view.sql และ create_sales_rollups.sql)
+
+-- 1. Last movement per product and branch, maintained by triggers so the report
+--    never has to scan the sales history
+CREATE TABLE IF NOT EXISTS product_movement_stats (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    branch_id UUID NOT NULL REFERENCES branches(id) ON DELETE CASCADE,
+    last_sale_date DATE,
+    last_counted_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (product_id, branch_id)
+);
+
+-- 2. Trigger functions (only move dates forward; deleting a sale keeps the last sale date)
+CREATE OR REPLACE FUNCTION sale_items_movement_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_date DATE;
+    v_branch_id UUID;
+BEGIN
+    SELECT DATE(transaction_date), branch_id INTO v_date, v_branch_id FROM sales WHERE id = NEW.sale_id;
+    IF v_branch_id IS NULL OR NEW.product_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO product_movement_stats (product_id, branch_id, last_sale_date)
+    VALUES (NEW.product_id, v_branch_id, v_date)
+    ON CONFLICT (product_id, branch_id) DO UPDATE
+    SET last_sale_date = GREATEST(product_movement_stats.last_sale_date, EXCLUDED.last_sale_date),
+        updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stock_counts_movement_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.branch_id IS NULL OR NEW.product_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO product_movement_stats (product_id, branch_id, last_counted_at)
+    VALUES (NEW.product_id, NEW.branch_id, NEW.counted_at)
+    ON CONFLICT (product_id, branch_id) DO UPDATE
+    SET last_counted_at = GREATEST(product_movement_stats.last_counted_at, EXCLUDED.last_counted_at),
+        updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sale_items_movement ON sale_items;
+CREATE TRIGGER sale_items_movement
+    AFTER INSERT OR UPDATE OF sale_id, product_id ON sale_items
+    FOR EACH ROW EXECUTE FUNCTION sale_items_movement_trigger();
+
+DROP TRIGGER IF EXISTS stock_counts_movement ON stock_counts;
+CREATE TRIGGER stock_counts_movement
+    AFTER INSERT ON stock_counts
+    FOR EACH ROW EXECUTE FUNCTION stock_counts_movement_trigger();
+
+-- 3. Backfill from the rollups and existing counts (safe to re-run)
+INSERT INTO product_movement_stats (product_id, branch_id, last_sale_date)
+SELECT product_id, branch_id, MAX(sale_date)
+FROM daily_product_sales_rollup
+WHERE product_id IS NOT NULL AND branch_id IS NOT NULL AND quantity > 0
+GROUP BY product_id, branch_id
+ON CONFLICT (product_id, branch_id) DO UPDATE
+SET last_sale_date = GREATEST(product_movement_stats.last_sale_date, EXCLUDED.last_sale_date);
+
+INSERT INTO product_movement_stats (product_id, branch_id, last_counted_at)
+SELECT product_id, branch_id, MAX(counted_at)
+FROM stock_counts
+WHERE product_id IS NOT NULL AND branch_id IS NOT NULL
+GROUP BY product_id, branch_id
+ON CONFLICT (product_id, branch_id) DO UPDATE
+SET last_counted_at = GREATEST(product_movement_stats.last_counted_at, EXCLUDED.last_counted_at);
+
+-- 4. Stocked product/branch rows with their last movement and 30-day sales,
+--    returned as one JSON document of column arrays (see slow_movers.py)
+CREATE OR REPLACE FUNCTION get_slow_mover_inputs(p_as_of DATE DEFAULT CURRENT_DATE)
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH sold AS (
+        SELECT product_id, branch_id, SUM(quantity) AS sold_30days
+        FROM daily_product_sales_rollup
+        WHERE sale_date > p_as_of - 30 AND sale_date <= p_as_of
+        GROUP BY product_id, branch_id
+    ),
+    rows AS (
+        SELECT p.barcode, p.name AS product_name, b.name AS branch_name,
+               i.current_quantity, COALESCE(p.cost_price, 0) AS cost_price,
+               m.last_sale_date, m.last_counted_at,
+               COALESCE(s.sold_30days, 0) AS sold_30days
+        FROM inventory i
+        JOIN products p ON p.id = i.product_id AND p.is_active = true
+        JOIN branches b ON b.id = i.branch_id
+        LEFT JOIN product_movement_stats m ON m.product_id = i.product_id AND m.branch_id = i.branch_id
+        LEFT JOIN sold s ON s.product_id = i.product_id AND s.branch_id = i.branch_id
+        WHERE i.current_quantity > 0
+    )
+    SELECT json_build_object(
+        'barcode', COALESCE(array_agg(barcode), '{}'),
+        'product_name', COALESCE(array_agg(product_name), '{}'),
+        'branch_name', COALESCE(array_agg(branch_name), '{}'),
+        'current_quantity', COALESCE(array_agg(current_quantity), '{}'),
+        'cost_price', COALESCE(array_agg(cost_price), '{}'),
+        'last_sale_date', COALESCE(array_agg(last_sale_date), '{}'),
+        'last_counted_at', COALESCE(array_agg(last_counted_at), '{}'),
+        'sold_30days', COALESCE(array_agg(sold_30days), '{}')
+    )
+    FROM rows;
+$$;
+
+GRANT SELECT ON product_movement_stats TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_slow_mover_inputs(DATE) TO anon, authenticated;
+
+SELECT 'product_movement_stats และ get_slow_mover_inputs พร้อมใช้งาน' as status;
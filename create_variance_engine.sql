@@ -0,0 +1,176 @@
+-- ผลต่างการนับสต๊อก: เติม system_quantity / variance อัตโนมัติเมื่อบันทึกการนับ
+-- และเก็บสถิติผลต่างต่อสินค้า/สาขาแบบ incremental สำหรับรายงานสินค้าสูญหาย
+-- รันใน Supabase SQL Editor (หลังจาก create_low_stock_view.sql)
+
+-- 1. Indexes for "sales / movements since the last count" lookups
+CREATE INDEX IF NOT EXISTS idx_sale_items_sale_product ON sale_items(sale_id, product_id);
+CREATE INDEX IF NOT EXISTS idx_movements_product_branch_date ON inventory_movements(product_id, branch_id, performed_at);
+
+-- 2. Expected quantity: stock at the last count, less sales and plus movements since then.
+--    Movements that reference a sale are skipped; those units are already in sale_items.
+--    create_inventory_ledger.sql replaces this with the ledger balance at count time.
+CREATE OR REPLACE FUNCTION expected_stock_quantity(p_product_id UUID, p_branch_id UUID, p_at TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    v_quantity INTEGER;
+    v_since TIMESTAMP WITH TIME ZONE;
+    v_sold BIGINT;
+    v_moved BIGINT;
+BEGIN
+    SELECT current_quantity, last_counted_at INTO v_quantity, v_since
+    FROM inventory
+    WHERE product_id = p_product_id AND branch_id = p_branch_id;
+
+    IF NOT FOUND OR v_quantity IS NULL THEN
+        RETURN NULL; -- never counted: nothing to compare against
+    END IF;
+    v_since := COALESCE(v_since, '-infinity');
+
+    SELECT COALESCE(SUM(si.quantity), 0) INTO v_sold
+    FROM sales s
+    JOIN sale_items si ON si.sale_id = s.id AND si.product_id = p_product_id
+    WHERE s.branch_id = p_branch_id
+      AND s.transaction_date > v_since
+      AND s.transaction_date <= p_at;
+
+    SELECT COALESCE(SUM(CASE movement_type
+                            WHEN 'in' THEN quantity
+                            WHEN 'out' THEN -quantity
+                            ELSE quantity -- adjustment: signed
+                        END), 0) INTO v_moved
+    FROM inventory_movements
+    WHERE product_id = p_product_id
+      AND branch_id = p_branch_id
+      AND performed_at > v_since
+      AND performed_at <= p_at
+      AND COALESCE(reference_type, '') NOT IN ('sale', 'count');
+
+    RETURN v_quantity - v_sold + v_moved;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION stock_counts_fill_variance()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.system_quantity IS NULL THEN
+        NEW.system_quantity := expected_stock_quantity(NEW.product_id, NEW.branch_id, COALESCE(NEW.counted_at, NOW()));
+    END IF;
+    IF NEW.system_quantity IS NOT NULL THEN
+        NEW.variance := NEW.counted_quantity - NEW.system_quantity;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stock_counts_variance ON stock_counts;
+CREATE TRIGGER stock_counts_variance
+    BEFORE INSERT ON stock_counts
+    FOR EACH ROW EXECUTE FUNCTION stock_counts_fill_variance();
+
+-- 3. Running variance statistics per product and branch (Welford's method:
+--    mean and sum of squared deviations are updated from each new count)
+CREATE TABLE IF NOT EXISTS count_variance_stats (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    branch_id UUID NOT NULL REFERENCES branches(id) ON DELETE CASCADE,
+    count_events INTEGER NOT NULL DEFAULT 0,
+    total_variance BIGINT NOT NULL DEFAULT 0,
+    total_abs_variance BIGINT NOT NULL DEFAULT 0,
+    shrinkage_units BIGINT NOT NULL DEFAULT 0, -- sum of shortfalls (negative variances)
+    overage_units BIGINT NOT NULL DEFAULT 0,   -- sum of surpluses (positive variances)
+    mean_variance DOUBLE PRECISION NOT NULL DEFAULT 0,
+    m2_variance DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_variance INTEGER,
+    last_counted_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (product_id, branch_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_count_variance_stats_shrinkage ON count_variance_stats(shrinkage_units DESC);
+
+CREATE OR REPLACE FUNCTION stock_counts_variance_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.variance IS NULL OR NEW.product_id IS NULL OR NEW.branch_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO count_variance_stats AS st (
+        product_id, branch_id, count_events, total_variance, total_abs_variance,
+        shrinkage_units, overage_units, mean_variance, m2_variance, last_variance, last_counted_at)
+    VALUES (
+        NEW.product_id, NEW.branch_id, 1, NEW.variance, ABS(NEW.variance),
+        GREATEST(-NEW.variance, 0), GREATEST(NEW.variance, 0), NEW.variance, 0, NEW.variance, NEW.counted_at)
+    ON CONFLICT (product_id, branch_id) DO UPDATE
+    SET count_events = st.count_events + 1,
+        total_variance = st.total_variance + NEW.variance,
+        total_abs_variance = st.total_abs_variance + ABS(NEW.variance),
+        shrinkage_units = st.shrinkage_units + GREATEST(-NEW.variance, 0),
+        overage_units = st.overage_units + GREATEST(NEW.variance, 0),
+        mean_variance = st.mean_variance + (NEW.variance - st.mean_variance) / (st.count_events + 1),
+        m2_variance = st.m2_variance + (NEW.variance - st.mean_variance)
+                      * (NEW.variance - (st.mean_variance + (NEW.variance - st.mean_variance) / (st.count_events + 1))),
+        last_variance = NEW.variance,
+        last_counted_at = GREATEST(st.last_counted_at, NEW.counted_at);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stock_counts_variance_stats ON stock_counts;
+CREATE TRIGGER stock_counts_variance_stats
+    AFTER INSERT ON stock_counts
+    FOR EACH ROW EXECUTE FUNCTION stock_counts_variance_stats();
+
+-- 4. Rebuild the statistics from counts that already have a variance (safe to re-run)
+TRUNCATE count_variance_stats;
+
+INSERT INTO count_variance_stats (
+    product_id, branch_id, count_events, total_variance, total_abs_variance,
+    shrinkage_units, overage_units, mean_variance, m2_variance, last_variance, last_counted_at)
+SELECT product_id, branch_id, COUNT(*), SUM(variance), SUM(ABS(variance)),
+       SUM(GREATEST(-variance, 0)), SUM(GREATEST(variance, 0)),
+       AVG(variance), COALESCE(VAR_POP(variance) * COUNT(*), 0),
+       (ARRAY_AGG(variance ORDER BY counted_at DESC))[1], MAX(counted_at)
+FROM stock_counts
+WHERE variance IS NOT NULL AND product_id IS NOT NULL AND branch_id IS NOT NULL
+GROUP BY product_id, branch_id;
+
+-- 5. Shrinkage report views (read from the statistics, not from count history)
+CREATE OR REPLACE VIEW variance_stats_report AS
+SELECT
+    st.product_id,
+    st.branch_id,
+    p.barcode,
+    p.name AS product_name,
+    b.name AS branch_name,
+    st.count_events,
+    st.total_variance,
+    st.total_abs_variance,
+    st.shrinkage_units,
+    st.overage_units,
+    st.shrinkage_units * COALESCE(p.cost_price, 0) AS shrinkage_value,
+    st.mean_variance,
+    CASE WHEN st.count_events > 1 THEN SQRT(st.m2_variance / (st.count_events - 1)) END AS stddev_variance,
+    st.last_variance,
+    st.last_counted_at
+FROM count_variance_stats st
+JOIN products p ON p.id = st.product_id
+JOIN branches b ON b.id = st.branch_id;
+
+CREATE OR REPLACE VIEW branch_variance_summary AS
+SELECT
+    st.branch_id,
+    b.name AS branch_name,
+    COUNT(*) AS products_counted,
+    SUM(st.count_events) AS count_events,
+    SUM(st.total_variance) AS total_variance,
+    SUM(st.shrinkage_units) AS shrinkage_units,
+    SUM(st.overage_units) AS overage_units,
+    SUM(st.shrinkage_units * COALESCE(p.cost_price, 0)) AS shrinkage_value
+FROM count_variance_stats st
+JOIN products p ON p.id = st.product_id
+JOIN branches b ON b.id = st.branch_id
+GROUP BY st.branch_id, b.name;
+
+GRANT SELECT ON count_variance_stats, variance_stats_report, branch_variance_summary TO anon, authenticated;
+
+SELECT 'Variance engine (system_quantity / variance / count_variance_stats) พร้อมใช้งาน' as status;
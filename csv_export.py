@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Streaming CSV Export
+Writes report and history rows as CSV chunks from a generator, so exports
+start downloading at once and never hold the whole file in memory; the same
+column layouts can also be written as an XLSX workbook
+"""
+
+import csv
+import io
+import tempfile
+
+# Rows written before each chunk is handed to the response
+CSV_CHUNK_ROWS = 500
+
+# Byte order mark so Excel opens the UTF-8 (Thai) text correctly
+UTF8_BOM = '\ufeff'
+
+# Bytes read from the finished workbook per response chunk
+XLSX_CHUNK_BYTES = 64 * 1024
+
+# Excel caps sheet names at 31 characters
+XLSX_SHEET_TITLE_MAX = 31
+
+def _cell(row, getter):
+    """Value of one column: getter is a key or a function of the row"""
+    value = getter(row) if callable(getter) else row.get(getter)
+    return '' if value is None else value
+
+def stream_csv(columns, rows):
+    """Yield the CSV for rows in UTF-8 chunks.
+
+    columns is a list of (header, getter) pairs; rows may be any iterable,
+    including a generator that is still fetching from the database.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write(UTF8_BOM)
+    writer.writerow([header for header, _ in columns])
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_cell(row, getter) for _, getter in columns])
+        if count % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue().encode('utf-8')
+
+def stream_xlsx(columns, rows, title='export'):
+    """Yield an XLSX workbook of rows in byte chunks.
+
+    openpyxl's write-only mode spools each row to a temporary file instead of
+    keeping the sheet in memory. An XLSX is a zip archive, so unlike the CSV
+    the first byte is only sent once every row has been written.
+    """
+    # Imported here so the CSV exports keep working where openpyxl is missing
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    def xlsx_value(value):
+        # Control characters (pasted from POS notes) make openpyxl reject the cell
+        return ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:XLSX_SHEET_TITLE_MAX])
+    sheet.append([header for header, _ in columns])
+    for row in rows:
+        sheet.append([xlsx_value(_cell(row, getter)) for _, getter in columns])
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(XLSX_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+def nested(relation, key):
+    """Getter for a column of an embedded relation, e.g. nested('products', 'name')"""
+    return lambda row: (row.get(relation) or {}).get(key)
+
+# Column layouts of each export
+STOCK_COUNT_COLUMNS = [
+    ('counted_at', 'counted_at'),
+    ('barcode', nested('products', 'barcode')),
+    ('product_name', nested('products', 'name')),
+    ('branch', lambda row: row.get('branch_name') or (row.get('branches') or {}).get('name')),
+    ('counted_quantity', 'counted_quantity'),
+    ('system_quantity', 'system_quantity'),
+    ('variance', 'variance'),
+    ('count_number', 'count_number'),
+    ('counter_name', 'counter_name'),
+    ('image_url', 'image_url'),
+    ('notes', 'notes')
+]
+
+INVENTORY_COLUMNS = [
+    ('sku', nested('products', 'sku')),
+    ('barcode', nested('products', 'barcode')),
+    ('product_name', nested('products', 'name')),
+    ('category', nested('products', 'category')),
+    ('branch_code', nested('branches', 'code')),
+    ('branch', nested('branches', 'name')),
+    ('current_quantity', 'current_quantity'),
+    ('reorder_level', 'reorder_level'),
+    ('cost_price', nested('products', 'cost_price')),
+    ('last_counted_at', 'last_counted_at')
+]
+
+SUMMARY_COLUMNS = [
+    ('barcode', 'barcode'),
+    ('product_name', 'product_name'),
+    ('total_stock', 'total_stock'),
+    ('sold_30days', 'sold_30days'),
+    ('sold_7days', 'sold_7days'),
+    ('forecast_30days', 'forecast_30days'),
+    ('days_of_stock', lambda row: round(row['days_of_stock'], 1)),
+    ('suggested_order', 'suggested_order')
+]
+
+SLOW_COLUMNS = [
+    ('barcode', 'barcode'),
+    ('product_name', 'product_name'),
+    ('branch', 'branch'),
+    ('total_stock', 'total_stock'),
+    ('stock_value', lambda row: round(row['stock_value'], 2)),
+    ('sold_30days', 'sold_30days'),
+    ('last_sale_date', 'last_sale_date'),
+    ('days_since_sale', 'days_since_sale'),
+    ('last_counted_at', 'last_counted_at'),
+    ('status', 'status')
+]
+
+INVENTORY_AS_OF_COLUMNS = [
+    ('sku', 'sku'),
+    ('barcode', 'barcode'),
+    ('product_name', 'product_name'),
+    ('quantity', 'quantity'),
+    ('last_movement_at', 'last_movement_at')
+]
@@ -59,10 +59,12 @@ CREATE TABLE inventory (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     product_id UUID REFERENCES products(id) ON DELETE CASCADE,
     branch_id UUID REFERENCES branches(id) ON DELETE CASCADE,
-    quantity INTEGER DEFAULT 0,
+    current_quantity INTEGER DEFAULT 0,
     reserved_quantity INTEGER DEFAULT 0,
+    reorder_level INTEGER NOT NULL DEFAULT 0, -- copy of products.reorder_level, see create_low_stock_view.sql
     last_counted_at TIMESTAMP WITH TIME ZONE,
     last_counted_by UUID REFERENCES users(id),
+    last_updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(product_id, branch_id)
 );
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Demand Forecasting Job
+Forecasts daily demand for every product x branch series from the sales
+rollups and writes the results to demand_forecasts, where the summary report
+and replenishment engine read them. Run it offline, e.g. nightly.
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import numpy as np
+from dotenv import load_dotenv
+from supabase_manager import create_supabase_manager
+from forecasting import forecast_daily_demand, METHOD_NAMES
+
+HISTORY_DAYS = 182
+HORIZON_DAYS = 30
+
+def build_history(batch, start_date, history_days):
+    """Turn one get_sales_history_batch document into series keys and a (series, days) matrix"""
+    series_index = {}
+    rows = np.fromiter(
+        (series_index.setdefault(key, len(series_index)) for key in zip(batch['product_id'], batch['branch_id'])),
+        dtype=np.intp, count=len(batch['product_id']))
+    days = (np.array(batch['sale_date'], dtype='datetime64[D]') - np.datetime64(start_date, 'D')).astype(np.intp)
+
+    history = np.zeros((len(series_index), history_days))
+    np.add.at(history, (rows, days), np.asarray(batch['quantity'], dtype=float))
+    return list(series_index), history
+
+def forecast_batch(history):
+    """Worker: forecast one batch of series (runs in a separate process)"""
+    daily, method = forecast_daily_demand(history)
+    return daily, method, (history > 0).sum(axis=1)
+
+def forecast_rows(keys, result, run_date, history_days, horizon_days):
+    """demand_forecasts rows for one forecast batch"""
+    daily, method, sale_days = result
+    return [{
+        'product_id': product_id,
+        'branch_id': branch_id,
+        'forecast_date': run_date.isoformat(),
+        'daily_demand': round(float(daily[i]), 4),
+        'horizon_days': horizon_days,
+        'forecast_quantity': round(float(daily[i]) * horizon_days, 2),
+        'method': METHOD_NAMES[int(method[i])],
+        'history_days': history_days,
+        'sale_days': int(sale_days[i]),
+        'updated_at': datetime.now().isoformat()
+    } for i, (product_id, branch_id) in enumerate(keys)]
+
+def run(manager, workers, history_days, horizon_days, product_batch, dry_run=False):
+    """Fetch history batch by batch, forecast in worker processes and save as results arrive.
+
+    The main process does all database reads and writes; workers only compute.
+    At most two batches per worker are in flight, which bounds memory.
+    """
+    run_date = datetime.now().date()
+    end_date = run_date - timedelta(days=1)  # today is not complete yet
+    start_date = end_date - timedelta(days=history_days - 1)
+    print(f"Forecasting from sales {start_date} to {end_date} with {workers} workers")
+
+    series_count = 0
+    saved = 0
+    failed = False
+    pending = {}
+
+    def collect(done):
+        nonlocal series_count, saved, failed
+        for future in done:
+            keys = pending.pop(future)
+            try:
+                rows = forecast_rows(keys, future.result(), run_date, history_days, horizon_days)
+            except Exception as e:
+                print(f"Error forecasting batch: {e}")
+                failed = True
+                continue
+            series_count += len(rows)
+            if not dry_run:
+                batch_saved = manager.save_demand_forecasts(rows)
+                saved += batch_saved
+                failed = failed or batch_saved < len(rows)
+            print(f"Forecast {series_count} series")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in manager.iter_sales_history(start_date, end_date, product_batch):
+            keys, history = build_history(batch, start_date, history_days)
+            if keys:
+                pending[pool.submit(forecast_batch, history)] = keys
+
+            while len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    # Series that no longer sell got no forecast this run; drop their old rows
+    if not dry_run and not failed:
+        manager.delete_stale_demand_forecasts(run_date)
+
+    print(f"Done: {series_count} series forecast, {saved} saved" + (" (with errors)" if failed else ""))
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Forecast demand per product and branch')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPU count)')
+    parser.add_argument('--history-days', type=int, default=HISTORY_DAYS, help='Days of sales history to fit')
+    parser.add_argument('--horizon-days', type=int, default=HORIZON_DAYS, help='Forecast horizon in days')
+    parser.add_argument('--batch-size', type=int, default=2000, help='Products per history batch')
+    parser.add_argument('--dry-run', action='store_true', help='Compute forecasts without saving them')
+
+    args = parser.parse_args()
+
+    load_dotenv()
+    manager = create_supabase_manager()
+    if not manager:
+        print("Error: Supabase is not configured")
+        sys.exit(1)
+
+    success = run(manager, max(1, args.workers), args.history_days, args.horizon_days, args.batch_size, args.dry_run)
+    sys.exit(0 if success else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Demand Forecasting Models
+Simple exponential smoothing and Croston (SBA) forecasts of daily demand,
+computed for many product x branch series at once with NumPy
+"""
+
+import numpy as np
+
+# Smoothing factors
+SES_ALPHA = 0.2
+CROSTON_ALPHA = 0.1
+
+# Average days between sales above which a series counts as intermittent
+# (Syntetos-Boylan cut-off) and is forecast with Croston instead of SES
+INTERMITTENT_ADI = 1.32
+
+METHOD_NONE, METHOD_SES, METHOD_CROSTON = 0, 1, 2
+METHOD_NAMES = {METHOD_NONE: 'none', METHOD_SES: 'ses', METHOD_CROSTON: 'croston'}
+
+def _first_sale_index(history):
+    """Index of the first day with demand in each series (len(days) when none)"""
+    has_demand = history > 0
+    first = np.argmax(has_demand, axis=1)
+    first[~has_demand.any(axis=1)] = history.shape[1]
+    return first
+
+def ses_forecast(history, alpha=SES_ALPHA):
+    """Simple exponential smoothing level of each series, starting at its first sale.
+
+    history is a (series, days) array of daily quantities, oldest day first.
+    """
+    first = _first_sale_index(history)
+    level = np.zeros(history.shape[0])
+
+    for t in range(history.shape[1]):
+        demand = history[:, t]
+        started = t > first
+        level = np.where(started, level + alpha * (demand - level), level)
+        level = np.where(t == first, demand, level)
+
+    return level
+
+def croston_forecast(history, alpha=CROSTON_ALPHA):
+    """Croston's method with the Syntetos-Boylan bias correction (SBA).
+
+    Demand size and the interval between sales are smoothed separately and
+    only updated on days with a sale; the daily forecast is size / interval.
+    """
+    n_series = history.shape[0]
+    size = np.zeros(n_series)
+    interval = np.ones(n_series)
+    since_last = np.ones(n_series)
+    started = np.zeros(n_series, dtype=bool)
+
+    for t in range(history.shape[1]):
+        demand = history[:, t]
+        sale = demand > 0
+
+        update = sale & started
+        size = np.where(update, size + alpha * (demand - size), size)
+        interval = np.where(update, interval + alpha * (since_last - interval), interval)
+
+        first = sale & ~started
+        size = np.where(first, demand, size)
+        interval = np.where(first, t + 1, interval)
+        started |= sale
+
+        since_last = np.where(sale, 1, since_last + 1)
+
+    forecast = (1 - alpha / 2) * size / interval
+    return np.where(started, forecast, 0.0)
+
+def forecast_daily_demand(history):
+    """Pick a model per series and forecast its daily demand.
+
+    Returns (daily demand, method code) arrays. Series whose sales are
+    intermittent use Croston, the rest SES; series with no sales forecast 0.
+    """
+    history = np.maximum(np.asarray(history, dtype=float), 0)  # returns never add demand
+    first = _first_sale_index(history)
+    sale_days = (history > 0).sum(axis=1)
+    active_days = history.shape[1] - first
+
+    adi = np.divide(active_days, sale_days, out=np.full(len(sale_days), np.inf), where=sale_days > 0)
+    intermittent = adi > INTERMITTENT_ADI
+
+    method = np.where(sale_days == 0, METHOD_NONE, np.where(intermittent, METHOD_CROSTON, METHOD_SES)).astype(np.int8)
+
+    daily = np.zeros(len(history))
+    for code, model in ((METHOD_SES, ses_forecast), (METHOD_CROSTON, croston_forecast)):
+        rows = method == code
+        if rows.any():
+            daily[rows] = model(history[rows])
+
+    return daily, method
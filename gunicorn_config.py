@@ -5,8 +5,15 @@ bind = "0.0.0.0:8000"
 backlog = 2048
 
 # Worker processes
-workers = 4
-worker_class = "sync"
+# Live dashboard events (SSE, see live_events.py) are fanned out in-process and
+# each open stream holds a thread, so the default is one threaded worker: every
+# write and every dashboard stream share the same process. With more workers a
+# dashboard only hears about writes handled by its own worker, and the
+# LIVE_EVENTS_MAX_SUBSCRIBERS cap (default 8) applies to each worker separately.
+# Keep that cap well below GUNICORN_THREADS, leaving most threads for requests.
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', '32'))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Product Importer
+Imports products from a Google Sheet or CSV file into Supabase with a
+configurable column layout, batched upserts keyed on barcode or SKU, and a
+checkpoint so an interrupted import resumes where it stopped
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from itertools import islice
+from dotenv import load_dotenv
+from batch_writes import IMPORT_WINDOW, upsert_bisecting
+
+PRODUCT_SHEET_ID = os.environ.get('PRODUCT_SHEET_ID', '17fQBTqiUG6tFH-67its-iaKDV2ef4HLJ9S3BGKTVSdM')
+
+# Column layouts of the product sheets used so far (field=column letter)
+LAYOUTS = {
+    'ab': 'barcode=A,name=B',         # Column A = บาร์โค้ด, B = ชื่อสินค้า
+    'cde': 'sku=C,barcode=D,name=E',  # Column C = รหัสสินค้า, D = บาร์โค้ด, E = ชื่อสินค้า
+    'de': 'barcode=D,name=E'          # Product Master sheet read by the app
+}
+
+# Product columns a layout may map; numeric ones have a parser and the value
+# used for an empty cell (the products table defaults)
+IMPORT_FIELDS = ['sku', 'barcode', 'name', 'category', 'brand', 'unit',
+                 'cost_price', 'selling_price', 'reorder_level', 'max_stock_level']
+NUMERIC_FIELDS = {
+    'cost_price': (float, 0.0),
+    'selling_price': (float, 0.0),
+    'reorder_level': (int, 10),
+    'max_stock_level': (int, 100)
+}
+
+# Header cells that mark a repeated header row rather than a product
+HEADER_VALUES = {'barcode', 'บาร์โค้ด'}
+
+# Barcodes per request when looking up the current SKUs of a batch
+SKU_LOOKUP_CHUNK = 200
+
+CHECKPOINT_FILE = os.environ.get('PRODUCT_IMPORT_CHECKPOINT_FILE', 'product_import_checkpoint.json')
+REJECTS_FILE = os.environ.get('PRODUCT_IMPORT_REJECTS_FILE', 'product_import_rejects.csv')
+
+def column_index(letter):
+    """0-based index of a column letter (A -> 0, AA -> 26)"""
+    index = 0
+    for char in letter.strip().upper():
+        if not 'A' <= char <= 'Z':
+            raise ValueError(f"Invalid column letter: {letter}")
+        index = index * 26 + ord(char) - ord('A') + 1
+    return index - 1
+
+def column_letter(index):
+    """Column letter of a 0-based index (0 -> A, 26 -> AA)"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def parse_columns(spec):
+    """Parse 'barcode=A,name=B' into {field: column index}; barcode and name are required"""
+    mapping = {}
+    for part in spec.split(','):
+        field, _, letter = part.partition('=')
+        field = field.strip()
+        if field not in IMPORT_FIELDS:
+            raise ValueError(f"Unknown product field: {field}")
+        mapping[field] = column_index(letter)
+
+    missing = {'barcode', 'name'} - set(mapping)
+    if missing:
+        raise ValueError(f"Column layout must map {', '.join(sorted(missing))}")
+    return mapping
+
+def product_record(values, mapping):
+    """Map one sheet row to a products record.
+
+    Returns (record, None), (None, reason) for a row that cannot be
+    imported, or (None, None) for empty and header rows. The record has a
+    sku only when the layout maps one (an empty SKU cell falls back to the
+    barcode); upsert_products fills it in otherwise.
+    """
+    cells = {field: str(values[i]).strip() if i < len(values) else '' for field, i in mapping.items()}
+    if not cells['barcode'] and not cells['name']:
+        return None, None
+    if cells['barcode'].lower() in HEADER_VALUES:
+        return None, None
+    if not cells['barcode'] or not cells['name']:
+        return None, 'missing barcode or name'
+
+    record = dict(cells)
+    if 'sku' in record:
+        record['sku'] = record['sku'] or cells['barcode']
+    if len(record['name']) > 500:
+        record['name'] = record['name'][:497] + "..."
+
+    for field, (parse, default) in NUMERIC_FIELDS.items():
+        if field in record:
+            try:
+                record[field] = parse(record[field].replace(',', '')) if record[field] else default
+            except ValueError:
+                return None, f"invalid {field}: {record[field]}"
+
+    record['is_active'] = True
+    return record, None
+
+def sheet_windows(sheets_manager, sheet_id, mapping, start_row, window):
+    """Yield (first row number, rows) windows of a Google Sheet, reading only the mapped columns.
+
+    Rows are returned as full-width lists (column A at index 0), so the
+    mapping applies unchanged.
+    """
+    first = min(mapping.values())
+    last = max(mapping.values())
+    while True:
+        result = sheets_manager.sheets_service.spreadsheets().values().get(
+            spreadsheetId=sheet_id,
+            range=f'{column_letter(first)}{start_row}:{column_letter(last)}{start_row + window - 1}'
+        ).execute()
+        rows = result.get('values', [])
+        if not rows:
+            return
+        yield start_row, [[''] * first + row for row in rows]
+        start_row += len(rows)
+
+def csv_windows(csv_file_path, start_row, window):
+    """Yield (first row number, rows) windows of a CSV file (row 1 is the header)"""
+    with open(csv_file_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        for _ in islice(reader, start_row - 1):
+            pass
+        while True:
+            rows = list(islice(reader, window))
+            if not rows:
+                return
+            yield start_row, rows
+            start_row += len(rows)
+
+def upsert_products(supabase, records, key):
+    """Upsert products records on key (barcode or sku).
+
+    sku is NOT NULL, so records from a layout without an SKU column are given
+    the product's current SKU, or the barcode for a new product, rather than
+    overwriting real SKUs with barcodes.
+    """
+    barcodes = [record['barcode'] for record in records if 'sku' not in record]
+    skus = {}
+    for i in range(0, len(barcodes), SKU_LOOKUP_CHUNK):
+        rows = supabase.table('products').select('barcode, sku') \
+            .in_('barcode', barcodes[i:i + SKU_LOOKUP_CHUNK]).execute().data or []
+        skus.update((row['barcode'], row['sku']) for row in rows)
+    records = [record if 'sku' in record else dict(record, sku=skus.get(record['barcode']) or record['barcode'])
+               for record in records]
+    supabase.table('products').upsert(records, on_conflict=key).execute()
+
+def _load_checkpoint(source_id, columns):
+    """Progress of an earlier import of the same source and layout, if any"""
+    try:
+        with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('source') == source_id and checkpoint.get('columns') == columns:
+            return checkpoint
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: Could not read import checkpoint, starting over: {e}")
+    return None
+
+def _save_checkpoint(checkpoint):
+    """Write the import checkpoint atomically"""
+    temp_file = f"{CHECKPOINT_FILE}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_file, CHECKPOINT_FILE)
+
+def _append_rejects(rejects, fresh):
+    """Record rejected rows (row, barcode, sku, name, reason) in the rejects CSV"""
+    with open(REJECTS_FILE, 'w' if fresh else 'a', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        if fresh:
+            writer.writerow(['row', 'barcode', 'sku', 'name', 'reason'])
+        for row_number, record, reason in rejects:
+            writer.writerow([row_number, record.get('barcode', ''), record.get('sku', ''), record.get('name', ''), reason])
+
+def run_import(supabase, windows, mapping, source_id, key='barcode', restart=False):
+    """Import products window by window; returns (written, rejected).
+
+    windows(start_row) yields (first row number, rows). Each window is
+    upserted on key (barcode or sku) and then checkpointed, so rerunning
+    after an interruption continues from the next window; upserts make a
+    repeated window harmless. Rejected rows go to REJECTS_FILE.
+    """
+    columns = ','.join(f"{field}={column_letter(index)}" for field, index in sorted(mapping.items()))
+    checkpoint = None if restart else _load_checkpoint(source_id, columns)
+    if checkpoint:
+        print(f"Resuming at row {checkpoint['next_row']} ({checkpoint['written']} products already imported)")
+    else:
+        checkpoint = {'source': source_id, 'columns': columns, 'key': key, 'next_row': 2, 'written': 0, 'rejected': 0}
+    fresh = checkpoint['next_row'] == 2
+    if fresh:
+        _append_rejects([], fresh=True)
+
+    def write(batch):
+        upsert_products(supabase, [record for _, record in batch], key)
+
+    started_at = time.monotonic()
+    rows_read = 0
+    for first_row, rows in windows(checkpoint['next_row']):
+        batch = {}
+        rejects = []
+        for offset, values in enumerate(rows):
+            record, reason = product_record(values, mapping)
+            if record:
+                # A key repeated within the window would make the upsert fail; the last row wins
+                batch.pop(record[key], None)
+                batch[record[key]] = (first_row + offset, record)
+            elif reason:
+                cells = {field: values[i] for field, i in mapping.items() if i < len(values)}
+                rejects.append((first_row + offset, cells, reason))
+
+        written = upsert_bisecting(write, list(batch.values()), rejects) if batch else 0
+
+        _append_rejects(rejects, fresh=False)
+        checkpoint['next_row'] = first_row + len(rows)
+        checkpoint['written'] += written
+        checkpoint['rejected'] += len(rejects)
+        _save_checkpoint(checkpoint)
+
+        rows_read += len(rows)
+        elapsed = time.monotonic() - started_at
+        print(f"  rows {first_row}-{checkpoint['next_row'] - 1}: {checkpoint['written']} imported, "
+              f"{checkpoint['rejected']} rejected - {rows_read / elapsed if elapsed else 0:,.0f} rows/s")
+
+    print(f"Imported {checkpoint['written']} products, rejected {checkpoint['rejected']} rows"
+          + (f" (see {REJECTS_FILE})" if checkpoint['rejected'] else ''))
+    return checkpoint['written'], checkpoint['rejected']
+
+def main():
+    parser = argparse.ArgumentParser(description='Import products into Supabase')
+    parser.add_argument('--sheet-id', type=str, default=PRODUCT_SHEET_ID, help='Google Sheets document ID')
+    parser.add_argument('--csv', type=str, help='Import from a CSV file instead of the sheet')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='ab', help='Preset column layout')
+    parser.add_argument('--columns', type=str, help='Custom layout, e.g. "sku=C,barcode=D,name=E,category=F"')
+    parser.add_argument('--key', choices=['barcode', 'sku'], default='barcode', help='Unique column to upsert on')
+    parser.add_argument('--window', type=int, default=IMPORT_WINDOW, help='Rows per upsert batch')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from row 2')
+
+    args = parser.parse_args()
+
+    try:
+        mapping = parse_columns(args.columns or LAYOUTS[args.layout])
+    except ValueError as e:
+        parser.error(str(e))
+    if args.key not in mapping:
+        parser.error(f"--key {args.key} needs a column layout that maps {args.key}")
+    window = max(1, args.window)
+
+    load_dotenv()
+    from supabase_manager import create_supabase_manager
+    manager = create_supabase_manager()
+    if not manager:
+        print("Error: Supabase is not configured")
+        sys.exit(1)
+
+    if args.csv:
+        source_id = f"csv:{os.path.abspath(args.csv)}"
+        windows = lambda start_row: csv_windows(args.csv, start_row, window)
+    else:
+        from sheets_manager import create_sheets_manager
+        sheets_manager = create_sheets_manager()
+        if not sheets_manager or not sheets_manager.sheets_service:
+            print("Error: Could not initialize Google Sheets manager")
+            sys.exit(1)
+        source_id = f"sheet:{args.sheet_id}"
+        windows = lambda start_row: sheet_windows(sheets_manager, args.sheet_id, mapping, start_row, window)
+
+    written, rejected = run_import(manager.client, windows, mapping, source_id, args.key, args.restart)
+    sys.exit(0 if written or not rejected else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Live Event Broker
+Fans out stock count / alert events to open dashboards over Server-Sent Events
+"""
+
+import os
+import json
+import queue
+import threading
+
+# Open streams allowed at once in this process (the broker is per process, so the
+# limit is per gunicorn worker). Each stream holds a server thread for as long as
+# it is open, so keep this well below the gunicorn thread count (gunicorn_config.py)
+MAX_SUBSCRIBERS = int(os.environ.get('LIVE_EVENTS_MAX_SUBSCRIBERS', '8'))
+
+class EventBroker:
+    def __init__(self, max_queue_size=100, heartbeat_seconds=15, max_subscribers=MAX_SUBSCRIBERS):
+        """In-process publish/subscribe broker; one queue per connected dashboard"""
+        self.max_queue_size = max_queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register a new subscriber and return its queue, or None when max_subscribers are connected"""
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a subscriber queue"""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        """Number of connected subscribers"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event, data):
+        """Send an event to every subscriber.
+
+        The SSE message is serialized once per write and shared by all
+        subscribers. A subscriber whose queue is full (a stalled browser)
+        is dropped; its stream reconnects and reloads the dashboard state.
+        """
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                print(f"Dropping slow live event subscriber ({event})")
+                self.unsubscribe(subscriber)
+                self._close(subscriber)
+
+    def _close(self, subscriber):
+        """Discard pending messages and tell the subscriber's stream to end"""
+        while True:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            subscriber.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def stream(self, subscriber):
+        """Generator of SSE messages for one subscriber, with keep-alive comments"""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+# Shared broker for the web process
+event_broker = EventBroker()
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Local-First Store
+SQLite copy (WAL mode) of the products, branches and stock counts a branch
+server needs to keep counting while Supabase is unreachable. Lookups and
+submits are served locally; writes go to an outbox that a background thread
+replicates to Supabase, and master data is pulled back on the same cycle.
+"""
+
+import os
+import sys
+import json
+import uuid
+import sqlite3
+import argparse
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+import batch_writes
+
+# Its own file: inventory.db belongs to sync_sales.py, whose products table has a different schema
+LOCAL_STORE_DB = os.environ.get('LOCAL_STORE_DB', 'local_store.db')
+
+# Seconds between replication passes (push the outbox, then pull changes)
+REPLICATION_SECONDS = int(os.environ.get('LOCAL_STORE_REPLICATION_SECONDS', '30'))
+
+# Seconds between full refreshes of products and branches from Supabase
+MASTER_REFRESH_SECONDS = 3600
+
+# Outbox rows pushed per request, and rejected pushes (while Supabase is reachable)
+# after which a row is set aside as 'failed' instead of retried forever
+OUTBOX_BATCH = 200
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Stock counts made elsewhere are pulled from this many days back on the first sync
+STOCK_COUNT_PULL_DAYS = 90
+
+# Same columns as the Supabase tables (products, branches, stock_counts)
+PRODUCT_COLUMNS = ['id', 'sku', 'barcode', 'name', 'description', 'category', 'brand', 'unit',
+                   'cost_price', 'selling_price', 'reorder_level', 'max_stock_level', 'is_active',
+                   'created_at', 'updated_at']
+BRANCH_COLUMNS = ['id', 'name', 'code', 'address', 'phone', 'is_active', 'created_at', 'updated_at']
+STOCK_COUNT_COLUMNS = ['id', 'product_id', 'branch_id', 'barcode', 'product_name', 'counted_quantity',
+                       'counter_name', 'image_url', 'notes', 'counted_at', 'count_number', 'repeat_count',
+                       'branch_name', 'system_quantity', 'variance', 'created_at']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    sku TEXT,
+    barcode TEXT,
+    name TEXT NOT NULL,
+    description TEXT,
+    category TEXT,
+    brand TEXT,
+    unit TEXT,
+    cost_price REAL,
+    selling_price REAL,
+    reorder_level INTEGER,
+    max_stock_level INTEGER,
+    is_active INTEGER DEFAULT 1,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_local_products_barcode ON products(barcode);
+
+CREATE TABLE IF NOT EXISTS branches (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    code TEXT,
+    address TEXT,
+    phone TEXT,
+    is_active INTEGER DEFAULT 1,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_local_branches_name ON branches(name);
+
+CREATE TABLE IF NOT EXISTS stock_counts (
+    id TEXT PRIMARY KEY,
+    product_id TEXT,
+    branch_id TEXT,
+    barcode TEXT NOT NULL,
+    product_name TEXT,
+    counted_quantity INTEGER NOT NULL DEFAULT 0,
+    counter_name TEXT,
+    image_url TEXT,
+    notes TEXT,
+    counted_at TEXT,
+    count_number INTEGER,
+    repeat_count INTEGER,
+    branch_name TEXT,
+    system_quantity INTEGER,
+    variance INTEGER,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_local_stock_counts_barcode ON stock_counts(barcode, counted_at);
+CREATE INDEX IF NOT EXISTS idx_local_stock_counts_product_branch ON stock_counts(product_id, branch_id);
+
+-- Local writes waiting to be replicated to Supabase, in order
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, seq);
+
+-- Replication bookkeeping (last master refresh, stock count pull date)
+CREATE TABLE IF NOT EXISTS replica_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+def _row_dict(row):
+    """sqlite3.Row as a dict shaped like the Supabase row (is_active as a bool)"""
+    record = dict(row)
+    if 'is_active' in record and record['is_active'] is not None:
+        record['is_active'] = bool(record['is_active'])
+    return record
+
+def _upsert(conn, table, columns, rows):
+    """Insert or replace rows by id, keeping only the local columns"""
+    if not rows:
+        return
+    placeholders = ', '.join('?' for _ in columns)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'id')
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+        f"ON CONFLICT(id) DO UPDATE SET {updates}",
+        [tuple(row.get(column) for column in columns) for row in rows]
+    )
+
+class LocalFirstManager:
+    """SupabaseManager interface backed by a local SQLite store.
+
+    The counting path (product lookup, branches, stock counts) is served
+    locally; any other method (reports, dashboards) is passed on to the
+    wrapped SupabaseManager.
+    """
+
+    def __init__(self, remote, db_path=LOCAL_STORE_DB):
+        self.remote = remote
+        self.db_path = db_path
+        self._replication_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def __getattr__(self, name):
+        remote = self.__dict__.get('remote')
+        if remote is None:
+            raise AttributeError(name)
+        return getattr(remote, name)
+
+    def _connect(self):
+        """Open a connection (one per call, so request threads never share one)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # Product Management
+    def get_product_by_barcode(self, barcode):
+        """Get product by barcode; a product not yet pulled is fetched from Supabase and kept"""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM products WHERE barcode = ? AND is_active = 1 LIMIT 1', (barcode,)).fetchone()
+        if row:
+            return _row_dict(row)
+
+        product = self.remote.get_product_by_barcode(barcode) if self.remote else None
+        if product:
+            with closing(self._connect()) as conn, conn:
+                _upsert(conn, 'products', PRODUCT_COLUMNS, [product])
+        return product
+
+    # Branch Management
+    def get_all_branches(self):
+        """Get all active branches"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT * FROM branches WHERE is_active = 1 ORDER BY name').fetchall()
+        if not rows and self.remote:
+            branches = self.remote.get_all_branches()
+            with closing(self._connect()) as conn, conn:
+                _upsert(conn, 'branches', BRANCH_COLUMNS, branches)
+            return branches
+        return [_row_dict(row) for row in rows]
+
+    def get_branch_by_name(self, name):
+        """Get branch by name"""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM branches WHERE name = ? LIMIT 1', (name,)).fetchone()
+        if row:
+            return _row_dict(row)
+
+        branch = self.remote.get_branch_by_name(name) if self.remote else None
+        if branch:
+            with closing(self._connect()) as conn, conn:
+                _upsert(conn, 'branches', BRANCH_COLUMNS, [branch])
+        return branch
+
+    def add_branch(self, branch_data):
+        """Add a branch locally and queue it for Supabase"""
+        branch = dict(branch_data)
+        branch['id'] = str(uuid.uuid4())
+        branch['created_at'] = datetime.now().isoformat()
+        with closing(self._connect()) as conn, conn:
+            _upsert(conn, 'branches', BRANCH_COLUMNS, [branch])
+            self._enqueue(conn, 'branches', branch)
+        self._wake.set()
+        return branch
+
+    # Stock Counting
+    def count_stock_counts(self, product_id, branch_id, before=None):
+        """Count earlier stock counts of a product in a branch (optionally only those counted before a time)"""
+        query = 'SELECT COUNT(*) FROM stock_counts WHERE product_id = ? AND branch_id = ?'
+        params = [product_id, branch_id]
+        if before:
+            query += ' AND counted_at < ?'
+            params.append(before)
+        with closing(self._connect()) as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def get_stock_count_history(self, barcode):
+        """Get every count of a barcode (branch_name, count_number, counted_at), newest first"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT branch_name, count_number, counted_at FROM stock_counts WHERE barcode = ? ORDER BY counted_at DESC',
+                (barcode,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_stock_count(self, count_data):
+        """Save a stock count locally and queue it for Supabase (same tracking fields as SupabaseManager)"""
+        try:
+            if 'counted_at' not in count_data:
+                count_data['counted_at'] = datetime.now().isoformat()
+
+            for field in ['product_id', 'branch_id', 'counted_quantity']:
+                if field not in count_data:
+                    print(f"Missing required field: {field}")
+                    return False
+
+            count_number = self.count_stock_counts(count_data['product_id'], count_data['branch_id']) + 1
+            count_status = f"นับครั้งที่ {count_number} - {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+            existing_notes = count_data.get('notes', '')
+            count_data['notes'] = f"{existing_notes} | {count_status}" if existing_notes else count_status
+            count_data['count_number'] = count_number
+            count_data['repeat_count'] = count_number
+
+            branch = self._get_branch_by_id(count_data['branch_id'])
+            count_data['branch_name'] = branch['name'] if branch else 'Unknown'
+
+            count_data['id'] = str(uuid.uuid4())
+            with closing(self._connect()) as conn, conn:
+                _upsert(conn, 'stock_counts', STOCK_COUNT_COLUMNS, [count_data])
+                self._enqueue(conn, 'stock_counts', count_data)
+
+            print(f"✅ Stock count saved locally - {count_status}")
+            self._wake.set()
+            return True
+        except Exception as e:
+            print(f"Error adding stock count locally: {e}")
+            return False
+
+    def _get_branch_by_id(self, branch_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM branches WHERE id = ?', (branch_id,)).fetchone()
+        return _row_dict(row) if row else None
+
+    # Outbox
+    def _enqueue(self, conn, table, row):
+        """Queue a local insert for replication (inside the caller's transaction)"""
+        columns = BRANCH_COLUMNS if table == 'branches' else STOCK_COUNT_COLUMNS
+        payload = {column: row[column] for column in columns if row.get(column) is not None}
+        conn.execute(
+            'INSERT INTO outbox (table_name, row_id, payload, created_at) VALUES (?, ?, ?, ?)',
+            (table, row['id'], json.dumps(payload, ensure_ascii=False), datetime.now().isoformat())
+        )
+
+    def outbox_status(self):
+        """Number of outbox rows per status ('pending', 'failed')"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def retry_failed(self):
+        """Put rows set aside as failed back in the queue; returns how many"""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("UPDATE outbox SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+
+    def _remap_branch(self, local_id, remote_branch):
+        """Replace a branch created offline by the one Supabase already has with the same name"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM branches WHERE id = ?', (local_id,))
+            _upsert(conn, 'branches', BRANCH_COLUMNS, [remote_branch])
+            conn.execute('UPDATE stock_counts SET branch_id = ? WHERE branch_id = ?', (remote_branch['id'], local_id))
+            conn.execute(
+                "UPDATE outbox SET payload = json_set(payload, '$.branch_id', ?) "
+                "WHERE table_name = 'stock_counts' AND json_extract(payload, '$.branch_id') = ?",
+                (remote_branch['id'], local_id)
+            )
+        print(f"Branch {remote_branch['name']} already exists in Supabase, using its id")
+
+    def _renumber_count(self, payload, earlier_in_batch=0):
+        """Renumber a count against Supabase, where other servers may have counted the same product meanwhile.
+
+        earlier_in_batch is the number of counts of the same product and
+        branch ahead of this one in the batch being pushed (not in Supabase yet).
+        """
+        count_number = self.remote.count_stock_counts(payload['product_id'], payload['branch_id'],
+                                                      before=payload['counted_at']) + earlier_in_batch + 1
+        if count_number <= payload.get('count_number', 0):
+            return payload
+
+        old_status = f"นับครั้งที่ {payload['count_number']} "
+        payload['notes'] = payload.get('notes', '').replace(old_status, f"นับครั้งที่ {count_number} ")
+        payload['count_number'] = count_number
+        payload['repeat_count'] = count_number
+        with closing(self._connect()) as conn, conn:
+            conn.execute('UPDATE stock_counts SET count_number = ?, repeat_count = ?, notes = ? WHERE id = ?',
+                         (count_number, count_number, payload['notes'], payload['id']))
+        return payload
+
+    def _push_outbox(self):
+        """Replicate pending outbox rows in order; returns False if Supabase is unreachable.
+
+        Rows carry their own id and are inserted with ON CONFLICT DO NOTHING, so
+        a batch that reached Supabase before the connection dropped is simply
+        replayed. Conflicts: a branch created offline under a name Supabase
+        already has is merged into the existing branch, and count numbers are
+        recomputed against the counts already in Supabase.
+        """
+        checked = False
+        while True:
+            with closing(self._connect()) as conn:
+                entries = conn.execute(
+                    "SELECT seq, table_name, payload, attempts FROM outbox WHERE status = 'pending' ORDER BY seq LIMIT ?",
+                    (OUTBOX_BATCH,)
+                ).fetchall()
+            if not entries:
+                return True
+
+            # Offline, every remote call below would wait for its own timeout
+            if not checked and not self.remote.is_reachable():
+                print("Supabase unreachable, local changes stay in the outbox")
+                return False
+            checked = True
+
+            # Push the leading run of one table, so branches land before the counts that use them
+            table = entries[0]['table_name']
+            run = []
+            for entry in entries:
+                if entry['table_name'] != table:
+                    break
+                run.append(entry)
+
+            batch = []
+            done = []
+            batch_counts = {}
+            for entry in run:
+                payload = json.loads(entry['payload'])
+                if table == 'branches':
+                    existing = self.remote.get_branch_by_name(payload['name'])
+                    if existing and existing['id'] != payload['id']:
+                        self._remap_branch(payload['id'], existing)
+                        done.append(entry['seq'])
+                        continue
+                else:
+                    cell = (payload['product_id'], payload['branch_id'])
+                    payload = self._renumber_count(payload, batch_counts.get(cell, 0))
+                    batch_counts[cell] = batch_counts.get(cell, 0) + 1
+                batch.append((entry['seq'], payload))
+
+            inserted = []
+
+            def write(rows):
+                inserted.extend(self.remote.insert_replicated_rows(table, [payload for _, payload in rows]))
+
+            rejects = []
+            if batch:
+                try:
+                    write(batch)
+                except Exception:
+                    # Bisect only a batch Supabase refused; a lost connection would
+                    # fail every half of it
+                    if not self.remote.is_reachable():
+                        print("Supabase unreachable, local changes stay in the outbox")
+                        self._delete_outbox(done)
+                        return False
+                    batch_writes.upsert_bisecting(write, batch, rejects)
+            rejected = {seq: reason for seq, _, reason in rejects}
+            if rejected and not self.remote.is_reachable():
+                print("Supabase unreachable, local changes stay in the outbox")
+                self._delete_outbox(done)
+                return False
+
+            self._delete_outbox(done + [seq for seq, _ in batch if seq not in rejected])
+            self._record_failures(run, rejected)
+            if table == 'stock_counts' and inserted:
+                # Supabase fills in system_quantity and variance: keep its rows and publish those
+                with closing(self._connect()) as conn, conn:
+                    _upsert(conn, 'stock_counts', STOCK_COUNT_COLUMNS, inserted)
+                for row in inserted:
+                    self.remote._publish_stock_count(row)
+            print(f"Replicated {len(batch) - len(rejected)} {table} rows" +
+                  (f", {len(rejected)} rejected" if rejected else ''))
+
+    def _delete_outbox(self, seqs):
+        if not seqs:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.executemany('DELETE FROM outbox WHERE seq = ?', [(seq,) for seq in seqs])
+
+    def _record_failures(self, run, rejected):
+        """Count a rejected push; after OUTBOX_MAX_ATTEMPTS the row is set aside as 'failed'"""
+        attempts = {entry['seq']: entry['attempts'] for entry in run}
+        with closing(self._connect()) as conn, conn:
+            for seq, reason in rejected.items():
+                status = 'failed' if attempts[seq] + 1 >= OUTBOX_MAX_ATTEMPTS else 'pending'
+                conn.execute('UPDATE outbox SET attempts = attempts + 1, last_error = ?, status = ? WHERE seq = ?',
+                             (reason, status, seq))
+
+    # Pull
+    def _get_state(self, name):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT value FROM replica_state WHERE name = ?', (name,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_state(self, conn, name, value):
+        conn.execute('INSERT INTO replica_state (name, value) VALUES (?, ?) '
+                     'ON CONFLICT(name) DO UPDATE SET value = excluded.value', (name, value))
+
+    def _pull_master_data(self):
+        """Refresh products and branches from Supabase (Supabase wins; products gone there are deactivated).
+
+        Products missing from the pull are only deactivated when the pull is
+        complete (as many rows as Supabase counts); otherwise the refresh is
+        tried again on the next pass.
+        """
+        branches = self.remote.get_all_branches()
+        products = list(self.remote.iter_products())
+        total = self.remote.count_products()
+        complete = total is not None and len(products) >= total
+        with closing(self._connect()) as conn, conn:
+            _upsert(conn, 'branches', BRANCH_COLUMNS, branches)
+            _upsert(conn, 'products', PRODUCT_COLUMNS, products)
+            if complete:
+                conn.execute('CREATE TEMP TABLE pulled_products (id TEXT PRIMARY KEY)')
+                conn.executemany('INSERT INTO pulled_products VALUES (?)', [(product['id'],) for product in products])
+                conn.execute('UPDATE products SET is_active = 0 WHERE id NOT IN (SELECT id FROM pulled_products)')
+                self._set_state(conn, 'master_pulled_at', datetime.now().isoformat())
+        if complete:
+            print(f"Pulled {len(products)} products and {len(branches)} branches")
+        else:
+            print(f"Pulled {len(products)} of {total if total is not None else 'unknown'} products; "
+                  f"nothing deactivated, will refresh again")
+
+    def _pull_stock_counts(self):
+        """Pull stock counts made on other servers since the last pull (a day of overlap)"""
+        pulled_on = self._get_state('stock_counts_pulled_on')
+        today = datetime.now().date()
+        start_date = (datetime.fromisoformat(pulled_on).date() - timedelta(days=1) if pulled_on
+                      else today - timedelta(days=STOCK_COUNT_PULL_DAYS))
+
+        counts = list(self.remote.iter_stock_counts(start_date=start_date))
+        total = self.remote.count_stock_counts_since(start_date)
+        complete = total is not None and len(counts) >= total
+        with closing(self._connect()) as conn, conn:
+            _upsert(conn, 'stock_counts', STOCK_COUNT_COLUMNS, counts)
+            # An incomplete pull keeps the old date, so the next pull covers the gap
+            if complete:
+                self._set_state(conn, 'stock_counts_pulled_on', today.isoformat())
+        if not complete:
+            print(f"Pulled {len(counts)} of {total if total is not None else 'unknown'} stock counts since {start_date}")
+
+    def replicate(self):
+        """One replication pass: push the outbox, then pull changes. Returns False when offline."""
+        if not self.remote:
+            return False
+        with self._replication_lock:
+            if not self._push_outbox():
+                return False
+
+            pulled_at = self._get_state('master_pulled_at')
+            if not pulled_at or datetime.now() - datetime.fromisoformat(pulled_at) > timedelta(seconds=MASTER_REFRESH_SECONDS):
+                self._pull_master_data()
+            self._pull_stock_counts()
+            return True
+
+    def start_replication(self, interval=REPLICATION_SECONDS):
+        """Replicate in a background thread every interval seconds (sooner after a local write)"""
+        if self._thread:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.replicate()
+                except Exception as e:
+                    print(f"Local store replication failed: {e}")
+                self._wake.wait(interval)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=run, name='local-store-replication', daemon=True)
+        self._thread.start()
+
+def create_local_first_manager(remote, db_path=LOCAL_STORE_DB):
+    """Factory function to create a LocalFirstManager around a SupabaseManager"""
+    try:
+        return LocalFirstManager(remote, db_path)
+    except Exception as e:
+        print(f"Failed to create local store: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or sync the local-first store')
+    parser.add_argument('--sync', action='store_true', help='Run one replication pass now')
+    parser.add_argument('--retry-failed', action='store_true', help='Queue rows set aside as failed again')
+    parser.add_argument('--db', type=str, default=LOCAL_STORE_DB, help='Local SQLite database')
+
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from supabase_manager import create_supabase_manager
+    load_dotenv()
+    manager = create_local_first_manager(create_supabase_manager(), args.db)
+    if not manager:
+        sys.exit(1)
+
+    if args.retry_failed:
+        print(f"Re-queued {manager.retry_failed()} failed rows")
+    if args.sync and not manager.replicate():
+        print("Supabase is not reachable")
+        sys.exit(1)
+    print(f"Outbox: {manager.outbox_status() or 'empty'}")
+
+if __name__ == '__main__':
+    main()
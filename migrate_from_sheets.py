@@ -6,6 +6,9 @@ Phase 1: Smart Inventory Management System
 
 import os
 import sys
+import json
+import time
+import argparse
 import pandas as pd
 from datetime import datetime
 import hashlib
@@ -20,6 +23,23 @@ SUPABASE_KEY = os.environ.get('SUPABASE_ANON_KEY', '')
 PRODUCT_SHEET_ID = os.environ.get('PRODUCT_SHEET_ID', '17fQBTqiUG6tFH-67its-iaKDV2ef4HLJ9S3BGKTVSdM')
 STOCK_SHEET_ID = os.environ.get('STOCK_SHEET_ID', '1OaEqOS7I0_hN2Q1nc4isqPXXdjp7_i7ZAPJFhUr5X7k')
 
+# Rows per bulk insert of deduplicated counts (--latest-only), and attempts
+# per insert (exponential backoff between them)
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 2
+
+# Raw stock log migration: sheet rows per window (one insert request each) and resume checkpoint
+STOCK_LOG_WINDOW = 1000
+STOCK_LOG_CHECKPOINT_FILE = os.environ.get('STOCK_LOG_CHECKPOINT_FILE', 'stock_log_migration.json')
+
+# Branch codes written to the stock sheet by the counting page
+BRANCH_CODE_NAMES = {
+    'CITY': 'สาขาตัวเมือง',
+    'SCHOOL': 'สาขาหน้าโรงเรียน',
+    'PONGPAI': 'สาขาโป่งไผ่'
+}
+
 def create_supabase_client():
     """Create Supabase client"""
     if not SUPABASE_URL or not SUPABASE_KEY:
@@ -63,111 +83,231 @@ def migrate_products(sheets_manager, supabase: Client):
         print(f"Error migrating products: {e}")
         return None
 
+def select_all(supabase: Client, table, columns, page_size=1000):
+    """All rows of a table, fetched in pages (a single request is capped by the API row limit)"""
+    rows = []
+    while True:
+        result = supabase.table(table).select(columns).order('id').range(len(rows), len(rows) + page_size - 1).execute()
+        rows.extend(result.data)
+        if len(result.data) < page_size:
+            return rows
+
 def get_branch_mapping(supabase: Client):
-    """Get branch ID mapping"""
-    result = supabase.table('branches').select('id, name').execute()
+    """Get branch ID mapping (by name and by code)"""
     branch_map = {}
-    for branch in result.data:
+    for branch in select_all(supabase, 'branches', 'id, name, code'):
         branch_map[branch['name']] = branch['id']
+        if branch.get('code'):
+            branch_map.setdefault(branch['code'], branch['id'])
     return branch_map
 
 def get_product_mapping(supabase: Client):
     """Get product ID mapping"""
-    result = supabase.table('products').select('id, barcode').execute()
     product_map = {}
-    for product in result.data:
+    for product in select_all(supabase, 'products', 'id, barcode'):
         if product['barcode']:
             product_map[product['barcode']] = product['id']
     return product_map
 
-def get_user_mapping(supabase: Client):
-    """Get user ID mapping"""
-    result = supabase.table('users').select('id, username').execute()
-    user_map = {}
-    for user in result.data:
-        user_map[user['username']] = user['id']
-    return user_map
+def _load_checkpoint(stock_sheet_id):
+    """Progress of an earlier stock log migration of this sheet, or a fresh start (row 1 is the header)"""
+    try:
+        with open(STOCK_LOG_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('spreadsheet_id') == stock_sheet_id:
+            return checkpoint
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: Could not read migration checkpoint, starting over: {e}")
+    
+    return {'spreadsheet_id': stock_sheet_id, 'next_row': 2, 'migrated': 0, 'skipped': 0}
+
+def _save_checkpoint(checkpoint):
+    """Write the migration checkpoint atomically"""
+    temp_file = f"{STOCK_LOG_CHECKPOINT_FILE}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_file, STOCK_LOG_CHECKPOINT_FILE)
+
+def _stock_log_marker(row_number):
+    """notes value identifying the stock_counts record migrated from a sheet row"""
+    return f"Migrated from stock sheet row {row_number}"
 
-def migrate_stock_counts(sheets_manager, supabase: Client):
-    """Migrate stock counting data from Google Sheets to Supabase"""
-    print("Migrating stock counts...")
+def stock_log_record(row, row_number, product_map, branch_map):
+    """Map one raw stock log row (A:I) to a stock_counts record, or None if it cannot be placed.
+    
+    Columns: date, time, barcode, product name, quantity, branch, user, image URL, counter name.
+    """
+    row = (row + [''] * 9)[:9]
+    count_date, count_time, barcode, product_name, quantity, branch, user, image_url, counter_name = \
+        [str(value).strip() for value in row]
+    
+    product_id = product_map.get(barcode)
+    branch_id = branch_map.get(branch) or branch_map.get(BRANCH_CODE_NAMES.get(branch, ''))
+    if not product_id or not branch_id or not quantity.lstrip('-').isdigit():
+        return None
     
     try:
-        # Get mappings
-        branch_map = get_branch_mapping(supabase)
-        product_map = get_product_mapping(supabase)
-        user_map = get_user_mapping(supabase)
+        counted_at = datetime.fromisoformat(f"{count_date} {count_time or '00:00:00'}").isoformat()
+    except ValueError:
+        return None
+    
+    return {
+        'product_id': product_id,
+        'branch_id': branch_id,
+        'barcode': barcode,
+        'product_name': product_name,
+        'counted_quantity': int(quantity),
+        'counter_name': counter_name or user or 'Unknown',
+        'image_url': image_url,
+        'counted_at': counted_at,
+        'notes': _stock_log_marker(row_number)
+    }
+
+def _insert_stock_log_window(supabase: Client, records, check_existing):
+    """Insert one batch of stock log records, retrying with backoff; returns True on success.
+    
+    Before a retry (and when check_existing is set) records already in the
+    database are dropped by their notes marker, since a failed request may
+    still have been committed.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            if check_existing or attempt > 1:
+                markers = [record['notes'] for record in records]
+                done = set()
+                for start in range(0, len(markers), 200):  # keep the filter URL short
+                    existing = supabase.table('stock_counts').select('notes').in_('notes', markers[start:start + 200]).execute()
+                    done.update(row['notes'] for row in existing.data)
+                records = [record for record in records if record['notes'] not in done]
+            if records:
+                supabase.table('stock_counts').insert(records).execute()
+            return True
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                print(f"Error inserting stock log window: {e}")
+                return False
+            delay = RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            print(f"Warning: stock log window failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+def migrate_stock_log(sheets_manager, supabase: Client, window=STOCK_LOG_WINDOW, restart=False):
+    """Stream the raw stock log (one stock_counts record per sheet row) into Supabase.
+    
+    Rows are read window rows at a time and each window is inserted in one
+    request, after which the checkpoint file records the next row, so memory
+    stays flat and an interrupted run resumes where it stopped. Rows of a
+    window that was inserted just before an interruption are recognised by
+    their notes marker and not inserted twice. Returns False if it stopped
+    early. Inventory follows from the inserted counts through the ledger
+    triggers (create_inventory_ledger.sql).
+    """
+    print("Migrating raw stock log...")
+    
+    branch_map = get_branch_mapping(supabase)
+    product_map = get_product_mapping(supabase)
+    print(f"Found {len(branch_map)} branch names/codes, {len(product_map)} products")
+    
+    checkpoint = _load_checkpoint(STOCK_SHEET_ID)
+    if restart:
+        checkpoint = {'spreadsheet_id': STOCK_SHEET_ID, 'next_row': 2, 'migrated': 0, 'skipped': 0}
+    elif checkpoint['next_row'] > 2:
+        print(f"Resuming at sheet row {checkpoint['next_row']} ({checkpoint['migrated']} rows already migrated)")
+    
+    resumed = checkpoint['next_row'] > 2
+    started_at = time.monotonic()
+    
+    while True:
+        start_row = checkpoint['next_row']
+        try:
+            rows = sheets_manager.read_stock_log_window(STOCK_SHEET_ID, start_row, window)
+        except Exception as e:
+            print(f"Error reading stock log at row {start_row}: {e}")
+            return False
+        if not rows:
+            break
         
-        print(f"Found {len(branch_map)} branches, {len(product_map)} products, {len(user_map)} users")
+        records = []
+        for offset, row in enumerate(rows):
+            record = stock_log_record(row, start_row + offset, product_map, branch_map) if row else None
+            if record:
+                records.append(record)
+            elif row:
+                checkpoint['skipped'] += 1
         
-        # Get stock counting data from Google Sheets
-        stock_data = sheets_manager.get_stock_summary(STOCK_SHEET_ID, PRODUCT_SHEET_ID)
+        # The first window after a checkpoint may already be in the database
+        # if the last run stopped between the insert and the checkpoint
+        if records and not _insert_stock_log_window(supabase, records, check_existing=resumed):
+            print(f"Stopped at sheet row {start_row}; run again to resume")
+            return False
+        resumed = False
         
-        if not stock_data:
-            print("No stock counting data found in Google Sheets")
-            return
+        checkpoint['next_row'] = start_row + len(rows)
+        checkpoint['migrated'] += len(records)
+        _save_checkpoint(checkpoint)
         
-        # Transform data for Supabase
-        stock_counts_to_insert = []
-        inventory_to_upsert = []
+        elapsed = time.monotonic() - started_at
+        print(f"  rows {start_row}-{checkpoint['next_row'] - 1}: {checkpoint['migrated']} migrated, "
+              f"{checkpoint['skipped']} skipped ({elapsed:.0f}s)")
+    
+    print(f"Successfully migrated {checkpoint['migrated']} stock log rows ({checkpoint['skipped']} skipped)")
+    return True
+
+def migrate_latest_counts(sheets_manager, supabase: Client, window=STOCK_LOG_WINDOW):
+    """Migrate only the latest count of each product in each branch from the raw stock log.
+    
+    A quick way to set opening stock without the full count history: the log
+    is read window by window and deduplicated in memory to the latest count
+    per (product, branch), so memory grows with the catalogue rather than the
+    log. Those counts are bulk-inserted into stock_counts BATCH_SIZE at a
+    time with retries, and inventory follows through the ledger trigger
+    (create_inventory_ledger.sql). Counts already migrated (by notes marker,
+    also by migrate_stock_log) are skipped, so a re-run is safe. Returns
+    False if a batch could not be inserted.
+    """
+    print("Migrating latest stock counts...")
+    
+    branch_map = get_branch_mapping(supabase)
+    product_map = get_product_mapping(supabase)
+    print(f"Found {len(branch_map)} branch names/codes, {len(product_map)} products")
+    
+    latest = {}
+    rows_read = 0
+    skipped = 0
+    start_row = 2
+    while True:
+        try:
+            rows = sheets_manager.read_stock_log_window(STOCK_SHEET_ID, start_row, window)
+        except Exception as e:
+            print(f"Error reading stock log at row {start_row}: {e}")
+            return False
+        if not rows:
+            break
         
-        for record in stock_data:
-            # Get IDs from mappings
-            product_id = product_map.get(record.get('barcode'))
-            branch_name = record.get('branch', 'สาขาหลัก')
-            branch_id = branch_map.get(branch_name)
-            
-            if not product_id or not branch_id:
-                print(f"Skipping record - Product ID: {product_id}, Branch ID: {branch_id}")
+        for offset, row in enumerate(rows):
+            record = stock_log_record(row, start_row + offset, product_map, branch_map) if row else None
+            if not record:
+                skipped += 1 if row else 0
                 continue
-            
-            # Stock count record
-            stock_count_record = {
-                'product_id': product_id,
-                'branch_id': branch_id,
-                'counted_quantity': int(record.get('quantity', 0)),
-                'counter_name': record.get('counter_name', 'Unknown'),
-                'counted_by': user_map.get('staff'),  # Default to staff user
-                'image_url': record.get('image_url', ''),
-                'counted_at': record.get('timestamp', datetime.now().isoformat())
-            }
-            stock_counts_to_insert.append(stock_count_record)
-            
-            # Update inventory
-            inventory_record = {
-                'product_id': product_id,
-                'branch_id': branch_id,
-                'quantity': int(record.get('quantity', 0)),
-                'last_counted_at': record.get('timestamp', datetime.now().isoformat()),
-                'last_counted_by': user_map.get('staff')
-            }
-            inventory_to_upsert.append(inventory_record)
-        
-        # Insert stock counts
-        if stock_counts_to_insert:
-            result = supabase.table('stock_counts').insert(stock_counts_to_insert).execute()
-            print(f"Successfully migrated {len(stock_counts_to_insert)} stock count records")
-        
-        # Upsert inventory
-        if inventory_to_upsert:
-            for inv_record in inventory_to_upsert:
-                try:
-                    # Try to update existing record, if not exists, insert
-                    existing = supabase.table('inventory').select('id').eq('product_id', inv_record['product_id']).eq('branch_id', inv_record['branch_id']).execute()
-                    
-                    if existing.data:
-                        # Update existing
-                        supabase.table('inventory').update(inv_record).eq('product_id', inv_record['product_id']).eq('branch_id', inv_record['branch_id']).execute()
-                    else:
-                        # Insert new
-                        supabase.table('inventory').insert(inv_record).execute()
-                except Exception as e:
-                    print(f"Error upserting inventory record: {e}")
-            
-            print(f"Successfully updated {len(inventory_to_upsert)} inventory records")
+            # Later rows win a tie on counted_at, as they were logged later
+            key = (record['product_id'], record['branch_id'])
+            if key not in latest or record['counted_at'] >= latest[key]['counted_at']:
+                latest[key] = record
         
-    except Exception as e:
-        print(f"Error migrating stock counts: {e}")
+        rows_read += len(rows)
+        start_row += len(rows)
+        print(f"  rows read: {rows_read}, product/branch pairs: {len(latest)}")
+    
+    records = list(latest.values())
+    for start in range(0, len(records), BATCH_SIZE):
+        if not _insert_stock_log_window(supabase, records[start:start + BATCH_SIZE], check_existing=True):
+            print(f"Stopped after {start} of {len(records)} latest counts; run again to continue")
+            return False
+        print(f"  latest counts: {min(start + BATCH_SIZE, len(records))}/{len(records)}")
+    
+    print(f"Successfully migrated {len(records)} latest counts from {rows_read} stock log rows ({skipped} skipped)")
+    return True
 
 def create_sample_sales_data(supabase: Client):
     """Create sample sales data for analytics demonstration"""
@@ -257,6 +397,14 @@ def create_sample_sales_data(supabase: Client):
 
 def main():
     """Main migration function"""
+    parser = argparse.ArgumentParser(description='Migrate Google Sheets data to Supabase')
+    parser.add_argument('--window', type=int, default=STOCK_LOG_WINDOW, help='Stock log rows per insert')
+    parser.add_argument('--restart', action='store_true', help='Ignore the stock log checkpoint and start from row 2')
+    parser.add_argument('--latest-only', action='store_true',
+                        help='Migrate only the latest count per product and branch (opening stock without history)')
+    
+    args = parser.parse_args()
+    
     print("Starting migration from Google Sheets to Supabase...")
     
     # Initialize services
@@ -272,7 +420,12 @@ def main():
     products = migrate_products(sheets_manager, supabase)
     
     print("\n2. Migrating stock counting data...")
-    migrate_stock_counts(sheets_manager, supabase)
+    if args.latest_only:
+        migrated = migrate_latest_counts(sheets_manager, supabase, max(1, args.window))
+    else:
+        migrated = migrate_stock_log(sheets_manager, supabase, max(1, args.window), args.restart)
+    if not migrated:
+        sys.exit(1)
     
     print("\n3. Creating sample sales data for analytics...")
     create_sample_sales_data(supabase)
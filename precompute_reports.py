@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Report Precomputation
+Builds the heavy admin reports (summary, slow movers, variance, top products)
+and stores them in report_snapshots for the pages to serve.
+Schedule it off-peak after midnight (e.g. a nightly cron job).
+"""
+
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+from supabase_manager import create_supabase_manager
+import report_snapshots
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute report snapshots')
+    parser.add_argument('reports', nargs='*', choices=sorted(report_snapshots.REPORT_BUILDERS),
+                        help='Reports to build (default: all)')
+
+    args = parser.parse_args()
+
+    load_dotenv()
+    manager = create_supabase_manager()
+    if not manager:
+        print("Error: Supabase is not configured")
+        sys.exit(1)
+
+    failed = []
+    for report_key in args.reports or list(report_snapshots.REPORT_BUILDERS):
+        started = time.monotonic()
+        snapshot = report_snapshots.refresh(manager, report_key)
+        if snapshot is None or not snapshot['stored']:
+            print(f"Failed to {'build' if snapshot is None else 'store'} {report_key}")
+            failed.append(report_key)
+            continue
+        print(f"Built {report_key} in {time.monotonic() - started:.1f}s")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Catalog Reconciliation
+Checks that the Product Master sheet and the active products in Supabase
+agree, without downloading the whole table: both sides hash their rows per
+barcode range, and only ranges whose hashes differ are split further, until
+they are small enough to compare row by row. Barcode and name are compared,
+and sku when the sheet layout has an SKU column. Mismatches can be repaired.
+"""
+
+import sys
+import csv
+import hashlib
+import argparse
+from bisect import bisect_left
+from dotenv import load_dotenv
+import import_products
+import batch_writes
+
+# Sub-ranges a differing range is split into, and the size below which a
+# range is compared row by row. 100k rows take about four hash requests.
+FANOUT = 16
+LEAF_ROWS = 256
+
+# Ranges sent per request (keeps the RPC payload small)
+RANGES_PER_REQUEST = 500
+
+def row_digest(record, with_sku=True):
+    """md5 of 'barcode|sku|name' (or 'barcode|name'), as computed by get_product_range_hashes"""
+    fields = [record['barcode'], record.get('sku') or ''] if with_sku else [record['barcode']]
+    text = '|'.join(fields + [record['name']])
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def range_hash(digests):
+    """md5 of the concatenated row digests of a range (in barcode order)"""
+    return hashlib.md5(''.join(digests).encode('utf-8')).hexdigest()
+
+def split_range(keys, lo, hi, fanout=FANOUT):
+    """Split [lo, hi) at quantiles of the sheet keys inside it.
+
+    Every boundary is a key greater than lo, so each split makes progress.
+    """
+    bounds = [lo]
+    for i in range(1, fanout):
+        key = keys[i * len(keys) // fanout]
+        if key > bounds[-1]:
+            bounds.append(key)
+    return list(zip(bounds, bounds[1:] + [hi]))
+
+def _in_requests(fetch, ranges):
+    """Call a range RPC for many ranges, RANGES_PER_REQUEST at a time; merge the column arrays"""
+    merged = None
+    for i in range(0, len(ranges), RANGES_PER_REQUEST):
+        chunk = ranges[i:i + RANGES_PER_REQUEST]
+        data = fetch([lo for lo, _ in chunk], [hi for _, hi in chunk])
+        if data is None:
+            raise RuntimeError("Range request failed")
+        if merged is None:
+            merged = {column: list(values) for column, values in data.items()}
+        else:
+            for column, values in data.items():
+                merged[column].extend(values)
+    return merged or {}
+
+def find_differing_ranges(manager, keys, digests, with_sku=True):
+    """Descend the range tree; returns (ranges to compare row by row, hash requests made)"""
+    fetch = lambda lows, highs: manager.get_product_range_hashes(lows, highs, with_sku)
+    pending = [('', None)]  # '' sorts before every barcode: the whole key space
+    leaves = []
+    requests = 0
+    while pending:
+        remote = _in_requests(fetch, pending)
+        requests += (len(pending) + RANGES_PER_REQUEST - 1) // RANGES_PER_REQUEST
+
+        split = []
+        for (lo, hi), count, remote_hash in zip(pending, remote['count'], remote['hash']):
+            start = bisect_left(keys, lo)
+            end = bisect_left(keys, hi) if hi is not None else len(keys)
+            if count == end - start and remote_hash == range_hash(digests[start:end]):
+                continue
+            if max(count, end - start) <= LEAF_ROWS or end - start < 2:
+                leaves.append((lo, hi))
+            else:
+                split.extend(split_range(keys[start:end], lo, hi))
+        pending = split
+
+    return leaves, requests
+
+def compare_rows(local, remote_rows, with_sku=True):
+    """Exact mismatches between sheet records and Supabase rows of the same ranges.
+
+    Returns a list of (kind, barcode, sheet record or None, Supabase row or None)
+    where kind is 'missing' (only in the sheet), 'extra' (only in Supabase) or
+    'different'.
+    """
+    remote = {
+        barcode: {'barcode': barcode, 'sku': sku, 'name': name}
+        for barcode, sku, name in zip(remote_rows.get('barcode', []), remote_rows.get('sku', []), remote_rows.get('name', []))
+    }
+    mismatches = []
+    for barcode, record in local.items():
+        row = remote.get(barcode)
+        if row is None:
+            mismatches.append(('missing', barcode, record, None))
+        elif row_digest(row, with_sku) != row_digest(record, with_sku):
+            mismatches.append(('different', barcode, record, row))
+    for barcode, row in remote.items():
+        if barcode not in local:
+            mismatches.append(('extra', barcode, None, row))
+    return sorted(mismatches, key=lambda m: m[1])
+
+def reconcile(manager, records, with_sku=True):
+    """Compare sheet records ({barcode: record}) with Supabase; returns (mismatches, requests made).
+
+    Pass with_sku=False when the sheet has no SKU column, so SKUs are not compared.
+    """
+    keys = sorted(records)
+    digests = [row_digest(records[key], with_sku) for key in keys]
+
+    leaves, requests = find_differing_ranges(manager, keys, digests, with_sku)
+    if not leaves:
+        return [], requests
+
+    remote_rows = _in_requests(manager.get_product_range_rows, leaves)
+    requests += (len(leaves) + RANGES_PER_REQUEST - 1) // RANGES_PER_REQUEST
+
+    local = {}
+    for lo, hi in leaves:
+        start = bisect_left(keys, lo)
+        end = bisect_left(keys, hi) if hi is not None else len(keys)
+        for key in keys[start:end]:
+            local[key] = records[key]
+    return compare_rows(local, remote_rows, with_sku), requests
+
+def repair(supabase, records, mismatches):
+    """Make Supabase match the sheet: upsert missing and different rows, deactivate extra ones.
+
+    Only the columns the sheet layout maps are written (see product_record).
+    """
+    from sync_products import deactivate_products
+
+    to_upsert = [(barcode, records[barcode]) for kind, barcode, _, _ in mismatches if kind != 'extra']
+    extra = [barcode for kind, barcode, _, _ in mismatches if kind == 'extra']
+
+    def write(batch):
+        import_products.upsert_products(supabase, [record for _, record in batch], 'barcode')
+
+    rejects = []
+    written = 0
+    for i in range(0, len(to_upsert), batch_writes.IMPORT_WINDOW):
+        written += batch_writes.upsert_bisecting(write, to_upsert[i:i + batch_writes.IMPORT_WINDOW], rejects)
+    for barcode, _, reason in rejects:
+        print(f"  Could not repair {barcode}: {reason}")
+
+    deactivated = deactivate_products(supabase, 'barcode', extra)
+    print(f"Repaired: {written} upserted, {len(deactivated)} deactivated, "
+          f"{len(rejects) + len(extra) - len(deactivated)} failed")
+    return not rejects and len(deactivated) == len(extra)
+
+def write_mismatches(path, mismatches):
+    """Write mismatches to a CSV file (kind, barcode, sheet and Supabase sku/name)"""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['kind', 'barcode', 'sheet_sku', 'sheet_name', 'supabase_sku', 'supabase_name'])
+        for kind, barcode, record, row in mismatches:
+            record = record or {}
+            row = row or {}
+            writer.writerow([kind, barcode, record.get('sku', ''), record.get('name', ''), row.get('sku', ''), row.get('name', '')])
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile the Product Master sheet with Supabase products')
+    parser.add_argument('--sheet-id', type=str, default=import_products.PRODUCT_SHEET_ID, help='Google Sheets document ID')
+    parser.add_argument('--layout', choices=sorted(import_products.LAYOUTS), default='ab', help='Preset column layout')
+    parser.add_argument('--columns', type=str, help='Custom layout, e.g. "sku=C,barcode=D,name=E"')
+    parser.add_argument('--output', type=str, help='Write mismatches to this CSV file')
+    parser.add_argument('--repair', action='store_true', help='Fix Supabase to match the sheet')
+
+    args = parser.parse_args()
+
+    try:
+        mapping = import_products.parse_columns(args.columns or import_products.LAYOUTS[args.layout])
+    except ValueError as e:
+        parser.error(str(e))
+
+    load_dotenv()
+    from supabase_manager import create_supabase_manager
+    from sheets_manager import create_sheets_manager
+    from sync_products import read_sheet_records
+    manager = create_supabase_manager()
+    if not manager:
+        print("Error: Supabase is not configured")
+        sys.exit(1)
+    sheets_manager = create_sheets_manager()
+    if not sheets_manager or not sheets_manager.sheets_service:
+        print("Error: Could not initialize Google Sheets manager")
+        sys.exit(1)
+
+    records = {barcode: record for barcode, (_, record) in
+               read_sheet_records(sheets_manager, args.sheet_id, mapping, 'barcode').items()}
+    print(f"Sheet: {len(records)} products")
+
+    try:
+        mismatches, requests = reconcile(manager, records, 'sku' in mapping)
+    except RuntimeError as e:
+        print(f"Error: {e} (has create_reconciliation_functions.sql been run?)")
+        sys.exit(1)
+
+    counts = {kind: sum(1 for m in mismatches if m[0] == kind) for kind in ('missing', 'different', 'extra')}
+    print(f"{len(mismatches)} mismatches using {requests} requests: "
+          f"{counts['missing']} missing, {counts['different']} different, {counts['extra']} extra in Supabase")
+    for kind, barcode, record, row in mismatches[:20]:
+        print(f"  {kind:9} {barcode}: sheet={record and record['name']!r} supabase={row and row['name']!r}")
+    if len(mismatches) > 20:
+        print(f"  ... and {len(mismatches) - 20} more" + ('' if args.output else ' (use --output to list all)'))
+
+    if args.output:
+        write_mismatches(args.output, mismatches)
+        print(f"Mismatches written to {args.output}")
+
+    if args.repair and mismatches:
+        sys.exit(0 if repair(manager.client, records, mismatches) else 1)
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
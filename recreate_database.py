@@ -6,6 +6,7 @@
 import os
 from supabase import create_client
 from sheets_manager import create_sheets_manager
+import import_products
 
 # Configuration
 SUPABASE_URL = "https://khiooiigrfrluvyobljq.supabase.co"
@@ -86,133 +87,6 @@ def create_tables():
             print(f"❌ สร้างตารางล้มเหลวทั้งสองวิธี: {e2}")
             return False
 
-def get_products_from_sheets():
-    """ดึงข้อมูลจาก Google Sheets Column A (Barcode), B (Product Name)"""
-    print("📊 ดึงข้อมูลจาก Google Sheets...")
-    
-    sheets_manager = create_sheets_manager()
-    if not sheets_manager:
-        print("❌ ไม่สามารถเชื่อมต่อ Google Sheets ได้")
-        return []
-    
-    try:
-        # อ่านข้อมูลจาก Column A (Barcode), B (Product Name)
-        result = sheets_manager.sheets_service.spreadsheets().values().get(
-            spreadsheetId=PRODUCT_SHEET_ID,
-            range='A:B'
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        if not values:
-            print("❌ ไม่มีข้อมูลใน Google Sheets")
-            return []
-        
-        print(f"📋 พบข้อมูล {len(values)} แถวใน Google Sheets")
-        
-        products = []
-        for i, row in enumerate(values):
-            if i == 0:  # Skip header row
-                continue
-            
-            # ตรวจสอบว่ามีข้อมูลใน column A และ B
-            if len(row) >= 2:
-                barcode = str(row[0]).strip() if row[0] else ''
-                name = str(row[1]).strip() if row[1] else ''
-                
-                # เก็บเฉพาะรายการที่มีบาร์โค้ดและชื่อสินค้า และไม่ใช่ header
-                if barcode and name and barcode.lower() != 'barcode':
-                    # ตัดชื่อสินค้าไม่เกิน 500 ตัวอักษร
-                    if len(name) > 500:
-                        name = name[:497] + "..."
-                    
-                    products.append({
-                        'barcode': barcode,
-                        'name': name
-                    })
-        
-        print(f"✅ ข้อมูลที่ใช้ได้: {len(products)} รายการ")
-        
-        # แสดงตัวอย่าง 5 รายการแรก
-        print("🔍 ตัวอย่างข้อมูล 5 รายการแรก:")
-        for i, product in enumerate(products[:5]):
-            print(f"   {i+1}. Barcode: '{product['barcode']}' | Name: '{product['name'][:50]}...'")
-        
-        return products
-        
-    except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดในการอ่าน Google Sheets: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
-
-def import_to_supabase(products_data):
-    """นำเข้าข้อมูลลง Supabase"""
-    if not products_data:
-        print("❌ ไม่มีข้อมูลให้นำเข้า")
-        return False
-    
-    print(f"💾 เริ่มนำเข้า {len(products_data)} รายการลง Supabase...")
-    
-    client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-    
-    # นำเข้าทีละ batch เล็ก ๆ
-    batch_size = 50  # ลดขนาด batch เพื่อป้องกัน error
-    total_inserted = 0
-    
-    try:
-        for i in range(0, len(products_data), batch_size):
-            batch = products_data[i:i + batch_size]
-            batch_num = i // batch_size + 1
-            
-            print(f"📤 Batch {batch_num}/{(len(products_data) + batch_size - 1) // batch_size}: {len(batch)} รายการ...")
-            
-            # เตรียมข้อมูลสำหรับ batch นี้
-            products_to_insert = []
-            for product in batch:
-                product_record = {
-                    'sku': product['barcode'],  # ใช้บาร์โค้ดเป็น SKU
-                    'barcode': product['barcode'], 
-                    'name': product['name'],
-                    'description': f"สินค้าจาก Google Sheets - {product['name'][:50]}",
-                    'category': 'สินค้าทั่วไป',
-                    'brand': 'ไม่ระบุ',
-                    'unit': 'ชิ้น',
-                    'cost_price': 0.00,
-                    'selling_price': 0.00,
-                    'reorder_level': 10,
-                    'max_stock_level': 100,
-                    'is_active': True
-                }
-                products_to_insert.append(product_record)
-            
-            # ลองนำเข้า batch
-            try:
-                result = client.table('products').insert(products_to_insert).execute()
-                if result.data:
-                    total_inserted += len(result.data)
-                    print(f"✅ สำเร็จ {len(result.data)} รายการ")
-                else:
-                    print("⚠️ ไม่มีข้อมูลกลับมา")
-            except Exception as batch_error:
-                print(f"❌ Error ใน batch {batch_num}: {batch_error}")
-                # ลองทีละรายการ
-                for product_data in products_to_insert:
-                    try:
-                        single_result = client.table('products').insert([product_data]).execute()
-                        if single_result.data:
-                            total_inserted += 1
-                    except Exception as single_error:
-                        # ข้าม error เงียบ ๆ เพื่อไม่ให้ log เยอะเกินไป
-                        pass
-        
-        print(f"🎉 นำเข้าสำเร็จทั้งหมด {total_inserted} รายการ!")
-        return True
-        
-    except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดในการนำเข้า: {e}")
-        return False
-
 def show_sample_barcodes():
     """แสดงบาร์โค้ดตัวอย่างสำหรับทดสอบ"""
     print("🧪 ตรวจสอบบาร์โค้ดที่ใช้ทดสอบได้:")
@@ -244,13 +118,22 @@ def main():
         print("❌ ไม่สามารถสร้างตารางได้")
         return False
     
-    # Step 2: Get data from Google Sheets  
-    products_data = get_products_from_sheets()
-    if not products_data:
+    # Step 2: Import products from Google Sheets (Column A = Barcode, B = Name)
+    sheets_manager = create_sheets_manager()
+    if not sheets_manager or not sheets_manager.sheets_service:
+        print("❌ ไม่สามารถเชื่อมต่อ Google Sheets ได้")
         return False
     
-    # Step 3: Import to Supabase
-    success = import_to_supabase(products_data)
+    mapping = import_products.parse_columns(import_products.LAYOUTS['ab'])
+    client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    written, rejected = import_products.run_import(
+        client,
+        lambda start_row: import_products.sheet_windows(sheets_manager, PRODUCT_SHEET_ID, mapping, start_row, import_products.IMPORT_WINDOW),
+        mapping,
+        f"sheet:{PRODUCT_SHEET_ID}",
+        restart=True
+    )
+    success = written > 0
     
     if success:
         print("\n🎉 การสร้างฐานข้อมูลและนำเข้าเสร็จสิ้น!")
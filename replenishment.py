@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Replenishment Engine
+Days of stock and suggested order quantities for the summary report, computed
+on whole products x branches arrays with NumPy
+"""
+
+import numpy as np
+
+# Days of sales the stock on hand should cover after an order arrives
+COVER_DAYS = 30
+
+# Days between placing an order and receiving it; stock that will not last
+# this long is reordered even when it is above reorder_level
+LEAD_TIME_DAYS = 7
+
+# Weight of the 7-day rate in the blended daily sales velocity (the rest is the 30-day rate)
+RECENT_WEIGHT = 0.5
+
+# days_of_stock reported for items with no recent sales (the template shows ∞)
+NO_SALES_DAYS = 999.0
+
+def daily_velocity(sold_30days, sold_7days):
+    """Blended units sold per day from the 30-day and 7-day totals"""
+    return (1 - RECENT_WEIGHT) * (sold_30days / 30.0) + RECENT_WEIGHT * (sold_7days / 7.0)
+
+def days_of_cover(stock, velocity):
+    """Days the stock lasts at the given velocity (NO_SALES_DAYS when nothing sells)"""
+    stock = np.maximum(stock, 0)
+    days = np.full(np.shape(stock), NO_SALES_DAYS)
+    selling = velocity > 0
+    np.divide(stock, velocity, out=days, where=selling)
+    return np.minimum(days, NO_SALES_DAYS)
+
+def compute_replenishment(stock, sold_30days, sold_7days, reorder_level, max_stock_level, forecast_daily=None):
+    """Compute cover and order quantities for every product/branch cell.
+
+    stock, sold_30days and sold_7days are (products, branches) arrays;
+    reorder_level and max_stock_level are per-product vectors, with NaN in
+    max_stock_level meaning no upper limit. forecast_daily, when given, is
+    the forecast demand per day (NaN where there is no forecast) and takes
+    the place of the recent sales velocity. A cell is reordered when its
+    stock is at or below the reorder point, the larger of reorder_level and
+    the lead-time demand, and the order fills it up to COVER_DAYS of sales,
+    never above max_stock_level.
+    """
+    stock = np.asarray(stock, dtype=float)
+    velocity = daily_velocity(np.asarray(sold_30days, dtype=float), np.asarray(sold_7days, dtype=float))
+    if forecast_daily is not None:
+        forecast_daily = np.asarray(forecast_daily, dtype=float)
+        velocity = np.where(np.isnan(forecast_daily), velocity, forecast_daily)
+    reorder_level = np.asarray(reorder_level, dtype=float)[:, None]
+    max_stock_level = np.asarray(max_stock_level, dtype=float)[:, None]
+
+    reorder_point = np.maximum(reorder_level, np.ceil(velocity * LEAD_TIME_DAYS))
+    order_up_to = np.maximum(reorder_point, np.ceil(velocity * COVER_DAYS))
+    order_up_to = np.where(np.isnan(max_stock_level), order_up_to, np.minimum(order_up_to, max_stock_level))
+
+    needs_order = stock <= reorder_point
+    suggested_order = np.where(needs_order, np.maximum(order_up_to - stock, 0), 0).astype(np.int64)
+
+    return {
+        'velocity': velocity,
+        'days_of_stock': days_of_cover(stock, velocity),
+        'reorder_point': reorder_point,
+        'suggested_order': suggested_order
+    }
+
+def _index_of(ids, lookup):
+    """Positions of ids in lookup (-1 where missing)"""
+    positions = {value: i for i, value in enumerate(lookup)}
+    return np.fromiter((positions.get(value, -1) for value in ids), dtype=np.intp, count=len(ids))
+
+def build_matrices(inputs):
+    """Turn the get_replenishment_inputs document into dense (products, branches) arrays"""
+    products = inputs['products']
+    branches = inputs['branches']
+    cells = inputs['cells']
+    shape = (len(products['id']), len(branches['id']))
+
+    product_idx = _index_of(cells['product_id'], products['id'])
+    branch_idx = _index_of(cells['branch_id'], branches['id'])
+    known = (product_idx >= 0) & (branch_idx >= 0)  # skip inactive products / branches
+    product_idx, branch_idx = product_idx[known], branch_idx[known]
+
+    matrices = {}
+    for column in ('current_quantity', 'sold_30days', 'sold_7days', 'counted'):
+        values = np.asarray(cells[column], dtype=float)[known]
+        matrix = np.zeros(shape)
+        np.add.at(matrix, (product_idx, branch_idx), values)
+        matrices[column] = matrix
+    matrices['counted'] = matrices['counted'] > 0
+
+    # Forecasts are one value per cell (NaN where missing), so they are placed, not summed
+    matrices['forecast_daily'] = np.full(shape, np.nan)
+    if cells.get('forecast_daily'):
+        forecast = np.asarray(cells['forecast_daily'], dtype=float)[known]
+        matrices['forecast_daily'][product_idx, branch_idx] = forecast
+    matrices['present'] = np.zeros(shape, dtype=bool)
+    matrices['present'][product_idx, branch_idx] = True
+
+    return matrices
+
+def build_report(inputs):
+    """Build the summary.html product rows and per-branch rollups.
+
+    Returns (products, branch_summary). Product rows total every branch and
+    are sorted by days_of_stock, lowest first.
+    """
+    products = inputs['products']
+    branches = inputs['branches']
+    matrices = build_matrices(inputs)
+    stock = matrices['current_quantity']
+
+    result = compute_replenishment(stock, matrices['sold_30days'], matrices['sold_7days'],
+                                   products['reorder_level'], products['max_stock_level'],
+                                   matrices['forecast_daily'])
+    # Only order for branches that carry the product (counted or sold there)
+    result['suggested_order'] = np.where(matrices['present'], result['suggested_order'], 0)
+
+    # Product level: totals across branches
+    total_stock = stock.sum(axis=1)
+    sold_30days = matrices['sold_30days'].sum(axis=1)
+    sold_7days = matrices['sold_7days'].sum(axis=1)
+    daily_demand = result['velocity'].sum(axis=1)
+    days_of_stock = days_of_cover(total_stock, daily_demand)
+    suggested_order = result['suggested_order'].sum(axis=1)
+
+    rows = np.flatnonzero(matrices['present'].any(axis=1))
+    rows = rows[np.argsort(days_of_stock[rows], kind='stable')]
+
+    product_rows = [{
+        'barcode': products['barcode'][i],
+        'product_name': products['name'][i],
+        'total_stock': int(total_stock[i]),
+        'sold_30days': int(sold_30days[i]),
+        'sold_7days': int(sold_7days[i]),
+        'days_of_stock': float(days_of_stock[i]),
+        'forecast_30days': int(round(daily_demand[i] * COVER_DAYS)),
+        'suggested_order': int(suggested_order[i])
+    } for i in rows.tolist()]
+
+    # Branch level: rollups over each branch column
+    items_counted = matrices['counted'].sum(axis=0)
+    branch_stock = (stock * matrices['counted']).sum(axis=0)
+    items_to_order = (result['suggested_order'] > 0).sum(axis=0)
+    branch_order = result['suggested_order'].sum(axis=0)
+
+    branch_summary = [{
+        'branch_id': branches['id'][j],
+        'branch': branches['name'][j],
+        'items_counted': int(items_counted[j]),
+        'total_quantity': int(branch_stock[j]),
+        'items_to_order': int(items_to_order[j]),
+        'suggested_order': int(branch_order[j])
+    } for j in np.flatnonzero(items_counted).tolist()]
+
+    return product_rows, branch_summary
+
+def build_stock_only_report(stock_summary):
+    """Fill the replenishment fields for a stock-only summary (Google Sheets, no sales data)"""
+    stock = np.array([row['total_stock'] for row in stock_summary], dtype=float).reshape(-1, 1)
+    no_sales = np.zeros_like(stock)
+
+    result = compute_replenishment(stock, no_sales, no_sales,
+                                   np.zeros(len(stock_summary)), np.full(len(stock_summary), np.nan))
+
+    return [dict(row,
+                 sold_30days=0,
+                 sold_7days=0,
+                 forecast_30days=0,
+                 days_of_stock=float(result['days_of_stock'][i, 0]),
+                 suggested_order=int(result['suggested_order'][i, 0]))
+            for i, row in enumerate(stock_summary)]
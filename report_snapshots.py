@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Report Snapshots
+Builds the heavy admin reports and stores them in report_snapshots, so pages
+serve a copy precomputed off-peak (by precompute_reports.py) and show how
+fresh it is instead of computing it while the user waits
+"""
+
+import time
+from datetime import datetime
+import replenishment
+import slow_movers
+
+# Dashboard top products widget: the snapshot covers its default view
+TOP_PRODUCTS_PERIOD_DAYS = 30
+TOP_PRODUCTS_LIMIT = 5
+
+# Products kept in the variance snapshot (largest shortfalls first)
+VARIANCE_LIMIT = 200
+
+def build_summary(manager):
+    """/report/summary data: product rows and per-branch rollups"""
+    inputs = manager.get_replenishment_inputs()
+    if not inputs:
+        return None
+    products, branch_summary = replenishment.build_report(inputs)
+    return {'products': products, 'branch_summary': branch_summary}
+
+def build_slow(manager):
+    """/report/slow data: dead and slow product/branch rows"""
+    today = datetime.now().date()
+    inputs = manager.get_slow_mover_inputs(today)
+    if inputs is None:
+        return None
+    return {'products': slow_movers.build_report(inputs, today)}
+
+def build_variance(manager):
+    """/api/variance data for all branches"""
+    return {
+        'branches': manager.get_branch_variance_summary(),
+        'products': manager.get_shrinkage_report(limit=VARIANCE_LIMIT)
+    }
+
+def build_top_products(manager):
+    """Dashboard top products for the default period, all branches"""
+    start_date, end_date = manager.resolve_period(period=TOP_PRODUCTS_PERIOD_DAYS)
+    return {
+        'items': manager.get_top_selling_products(limit=TOP_PRODUCTS_LIMIT, start_date=start_date, end_date=end_date),
+        'period_start': start_date.isoformat(),
+        'period_end': end_date.isoformat()
+    }
+
+REPORT_BUILDERS = {
+    'summary': build_summary,
+    'slow': build_slow,
+    'variance': build_variance,
+    'top_products': build_top_products
+}
+
+def _local_time(value):
+    """Stored generated_at (ISO, with offset) as a naive local datetime like datetime.now()"""
+    return datetime.fromisoformat(value).astimezone().replace(tzinfo=None)
+
+def load(manager, report_key):
+    """Today's snapshot of a report ({'payload', 'generated_at'}), or None.
+
+    Reports cover "today", so a snapshot made before midnight is not served.
+    """
+    midnight = datetime.combine(datetime.now().date(), datetime.min.time()).astimezone()
+    snapshot = manager.get_report_snapshot(report_key, since=midnight)
+    if not snapshot:
+        return None
+    return {'payload': snapshot['payload'], 'generated_at': _local_time(snapshot['generated_at'])}
+
+def refresh(manager, report_key):
+    """Build a report now and store it as the snapshot.
+
+    Returns it like load() plus 'stored' (False when saving failed), or None
+    when the report could not be built.
+    """
+    started = time.monotonic()
+    payload = REPORT_BUILDERS[report_key](manager)
+    if payload is None:
+        return None
+
+    generated_at = datetime.now().astimezone()
+    duration_ms = int((time.monotonic() - started) * 1000)
+    stored = manager.save_report_snapshot(report_key, payload, generated_at, duration_ms)
+    return {'payload': payload, 'generated_at': generated_at.replace(tzinfo=None), 'stored': stored}
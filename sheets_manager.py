@@ -5,6 +5,9 @@ Handles stock data storage in Google Sheets
 """
 
 import os
+import json
+import time
+import threading
 from datetime import datetime
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -14,12 +17,21 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive.file'
 ]
 
+# Running stock summary (totals per barcode + last processed row of the stock log)
+STOCK_SUMMARY_STATE_FILE = os.environ.get('STOCK_SUMMARY_STATE_FILE', 'stock_summary_state.json')
+
+# Seconds after which the summary is rebuilt from the whole stock log, so edits
+# or deletions above the last processed row are corrected
+STOCK_SUMMARY_REBUILD_SECONDS = int(os.environ.get('STOCK_SUMMARY_REBUILD_SECONDS', '600'))
+
 class SheetsManager:
-    def __init__(self, credentials_file='credentials.json'):
+    def __init__(self, credentials_file='credentials.json', summary_state_file=STOCK_SUMMARY_STATE_FILE):
         """Initialize Google Sheets manager with service account credentials"""
         self.credentials_file = credentials_file
+        self.summary_state_file = summary_state_file
         self.sheets_service = None
         self.drive_service = None
+        self._summary_lock = threading.Lock()
         self._authenticate()
     
     def _authenticate(self):
@@ -149,42 +161,146 @@ class SheetsManager:
             return []
     
     def get_stock_summary(self, stock_sheet_id, product_sheet_id):
-        """Get stock summary from Google Sheets"""
+        """Get stock summary from Google Sheets.
+        
+        The stock log normally only grows by appends, so totals are kept in a
+        state file together with the next unread row; each call reads only the
+        new rows. Edits above the last processed row cannot be seen that way,
+        so the totals are also rebuilt from the whole log every
+        STOCK_SUMMARY_REBUILD_SECONDS.
+        """
         if not self.sheets_service:
             return []
         
         try:
-            # Get all stock records
-            stock_range = 'Sheet1!A:H'
-            stock_result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=stock_sheet_id,
-                range=stock_range
-            ).execute()
-            
-            stock_rows = stock_result.get('values', [])
-            
-            # Calculate totals by barcode
-            stock_summary = {}
-            for row in stock_rows[1:]:  # Skip header
-                if len(row) >= 5:
-                    barcode = row[2]
-                    quantity = int(row[4]) if row[4].isdigit() else 0
-                    
-                    if barcode in stock_summary:
-                        stock_summary[barcode]['total_stock'] += quantity
-                    else:
-                        stock_summary[barcode] = {
-                            'barcode': barcode,
-                            'product_name': row[3],
-                            'total_stock': quantity
-                        }
-            
-            return list(stock_summary.values())
+            with self._summary_lock:
+                state = self._load_summary_state(stock_sheet_id)
+                if time.time() - state.get('rebuilt_at', 0) > STOCK_SUMMARY_REBUILD_SECONDS:
+                    state = self._empty_summary_state(stock_sheet_id)
+                state = self._apply_new_stock_rows(stock_sheet_id, state)
+                self._save_summary_state(state)
+                return list(state['summary'].values())
             
         except Exception as e:
             print(f"Error getting stock summary: {e}")
             return []
     
+    def _empty_summary_state(self, stock_sheet_id):
+        """Summary state before any row has been read (row 1 is the header)"""
+        return {
+            'spreadsheet_id': stock_sheet_id,
+            'next_row': 2,
+            'last_row': None,
+            'summary': {},
+            'rebuilt_at': time.time()
+        }
+    
+    def _load_summary_state(self, stock_sheet_id):
+        """Load the running summary, or start over if missing or for another sheet"""
+        try:
+            with open(self.summary_state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('spreadsheet_id') == stock_sheet_id:
+                return state
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Warning: Could not read stock summary state, rebuilding: {e}")
+        
+        return self._empty_summary_state(stock_sheet_id)
+    
+    def _save_summary_state(self, state):
+        """Write the running summary atomically"""
+        temp_file = f"{self.summary_state_file}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_file, self.summary_state_file)
+        except Exception as e:
+            print(f"Warning: Could not save stock summary state: {e}")
+    
+    def _read_stock_rows_from(self, stock_sheet_id, start_row):
+        """Read stock log rows from start_row to the end of the sheet"""
+        result = self.sheets_service.spreadsheets().values().get(
+            spreadsheetId=stock_sheet_id,
+            range=f'Sheet1!A{start_row}:H'
+        ).execute()
+        return result.get('values', [])
+    
+    def read_stock_log_window(self, stock_sheet_id, start_row, window):
+        """Read up to window raw stock log rows (all columns A:I) starting at start_row.
+        
+        Trailing empty rows are not returned, so an empty list means the end of the log.
+        """
+        if not self.sheets_service:
+            return []
+        
+        result = self.sheets_service.spreadsheets().values().get(
+            spreadsheetId=stock_sheet_id,
+            range=f'Sheet1!A{start_row}:I{start_row + window - 1}'
+        ).execute()
+        return result.get('values', [])
+    
+    def get_file_version(self, file_id):
+        """Drive version and modifiedTime of a file, or None if Drive cannot be read.
+        
+        The version increases on every edit, so polling it is a cheap way to
+        tell whether a sheet changed without reading its cells.
+        """
+        if not self.drive_service:
+            return None
+        
+        try:
+            return self.drive_service.files().get(
+                fileId=file_id,
+                fields='version,modifiedTime',
+                supportsAllDrives=True
+            ).execute()
+            
+        except Exception as e:
+            print(f"Error getting file version: {e}")
+            return None
+    
+    def _apply_new_stock_rows(self, stock_sheet_id, state):
+        """Add rows appended since the last call to the running totals"""
+        next_row = state['next_row']
+        
+        if state['last_row'] is None:
+            rows = self._read_stock_rows_from(stock_sheet_id, next_row)
+        else:
+            # Re-read the last processed row as well; if it changed (rows deleted
+            # or the last row edited) the totals are rebuilt from the start.
+            # Edits further up are picked up by the periodic rebuild.
+            rows = self._read_stock_rows_from(stock_sheet_id, next_row - 1)
+            if not rows or rows[0] != state['last_row']:
+                print("Stock sheet changed above the last processed row, rebuilding summary")
+                state = self._empty_summary_state(stock_sheet_id)
+                return self._apply_new_stock_rows(stock_sheet_id, state)
+            rows = rows[1:]
+        
+        # Calculate totals by barcode
+        stock_summary = state['summary']
+        for row in rows:
+            if len(row) >= 5:
+                barcode = row[2]
+                quantity = int(row[4]) if row[4].isdigit() else 0
+                
+                if barcode in stock_summary:
+                    stock_summary[barcode]['total_stock'] += quantity
+                else:
+                    stock_summary[barcode] = {
+                        'barcode': barcode,
+                        'product_name': row[3],
+                        'total_stock': quantity
+                    }
+        
+        if rows:
+            state['next_row'] = next_row + len(rows)
+            state['last_row'] = rows[-1]
+            print(f"Stock summary: processed {len(rows)} new rows")
+        
+        return state
+    
     def initialize_product_sheet_headers(self, sheet_id):
         """Initialize Product Master sheet with headers"""
         if not self.sheets_service:
@@ -274,9 +390,9 @@ class SheetsManager:
             print(f"Error adding sample products: {e}")
             return False
 
-def create_sheets_manager(credentials_file='credentials.json'):
+def create_sheets_manager(credentials_file='credentials.json', summary_state_file=STOCK_SUMMARY_STATE_FILE):
     """Factory function to create SheetsManager instance"""
-    return SheetsManager(credentials_file)
+    return SheetsManager(credentials_file, summary_state_file)
 
 # Example usage
 if __name__ == '__main__':
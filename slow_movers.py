@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Slow-Moving Inventory Engine
+Classifies stocked products per branch as dead, slow or normal from last sale
+date, sales velocity and stock value, and caches the finished report
+"""
+
+import threading
+import time
+import numpy as np
+from replenishment import days_of_cover
+
+# No sale for longer than this (or never sold) is dead stock
+DEAD_DAYS = 90
+
+# No sale for longer than this is slow stock
+SLOW_DAYS = 30
+
+# Stock that would take longer than this to sell at the 30-day rate is also slow
+SLOW_COVER_DAYS = 180
+
+# How long a computed report is served before it is rebuilt
+REPORT_CACHE_SECONDS = 300
+
+STATUS_NORMAL, STATUS_SLOW, STATUS_DEAD = 0, 1, 2
+STATUS_NAMES = {STATUS_SLOW: 'slow', STATUS_DEAD: 'dead'}
+
+def classify(stock, sold_30days, days_since_sale, never_sold):
+    """Status code per row: STATUS_DEAD, STATUS_SLOW or STATUS_NORMAL"""
+    days_of_stock = days_of_cover(stock, sold_30days / 30.0)
+
+    dead = never_sold | (days_since_sale > DEAD_DAYS)
+    slow = (days_since_sale > SLOW_DAYS) | (days_of_stock > SLOW_COVER_DAYS)
+
+    status = np.full(len(stock), STATUS_NORMAL, dtype=np.int8)
+    status[slow] = STATUS_SLOW
+    status[dead] = STATUS_DEAD
+    return status, days_of_stock
+
+def build_report(inputs, as_of):
+    """Build the slow.html rows from the get_slow_mover_inputs document.
+
+    Only dead and slow rows are returned, highest stock value first.
+    """
+    stock = np.asarray(inputs['current_quantity'], dtype=float)
+    sold_30days = np.asarray(inputs['sold_30days'], dtype=float)
+    stock_value = stock * np.asarray(inputs['cost_price'], dtype=float)
+
+    last_sale = np.array(inputs['last_sale_date'], dtype='datetime64[D]')
+    never_sold = np.isnat(last_sale)
+    days_since_sale = (np.datetime64(as_of, 'D') - last_sale).astype(np.int64)
+    days_since_sale[never_sold] = 0
+
+    status, days_of_stock = classify(stock, sold_30days, days_since_sale, never_sold)
+
+    rows = np.flatnonzero(status != STATUS_NORMAL)
+    rows = rows[np.argsort(-stock_value[rows], kind='stable')]
+
+    return [{
+        'barcode': inputs['barcode'][i],
+        'product_name': inputs['product_name'][i],
+        'branch': inputs['branch_name'][i],
+        'total_stock': int(stock[i]),
+        'stock_value': float(stock_value[i]),
+        'sold_30days': int(sold_30days[i]),
+        'days_of_stock': float(days_of_stock[i]),
+        'last_sale_date': 'Never' if never_sold[i] else str(last_sale[i]),
+        'days_since_sale': None if never_sold[i] else int(days_since_sale[i]),
+        'last_counted_at': (inputs['last_counted_at'][i] or '')[:10],
+        'status': STATUS_NAMES[int(status[i])]
+    } for i in rows.tolist()]
+
+class ReportCache:
+    def __init__(self, ttl_seconds=REPORT_CACHE_SECONDS):
+        """Keep the most recent report for ttl_seconds (a new key replaces the old one)"""
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached report for key, computing it (once, under the lock) when stale.
+
+        Failed computations (None) are not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry['computed_at'] < self.ttl_seconds:
+                return entry['report']
+
+            report = compute()
+            if report is not None:
+                self._entries = {key: {'report': report, 'computed_at': time.monotonic()}}
+            return report
+
+    def invalidate(self):
+        """Drop all cached reports"""
+        with self._lock:
+            self._entries = {}
+
+# Shared cache for the web process
+slow_report_cache = ReportCache()
@@ -4,9 +4,30 @@ Phase 1: Core functionality for dashboard and analytics
 """
 
 import os
-from datetime import datetime, timedelta
+import json
+import base64
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Optional, Any
 from supabase import create_client, Client
+from live_events import event_broker
+
+def _encode_cursor(sort_value: Any, row_id: str) -> str:
+    """Encode the (sort value, id) of the last row of a page as an opaque cursor"""
+    raw = json.dumps([sort_value, row_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_cursor(cursor: str) -> List:
+    """Decode a cursor produced by _encode_cursor into [sort value, id]"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return [sort_value, row_id]
+
+def _quote_filter_value(value: Any) -> str:
+    """Quote a value for use inside a PostgREST or=(...) filter"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
 
 class SupabaseManager:
     def __init__(self):
@@ -18,6 +39,62 @@ class SupabaseManager:
         
         self.client: Client = create_client(self.supabase_url, self.supabase_key)
     
+    # Pagination
+    # Supabase returns at most this many rows per request, whatever the limit
+    MAX_ROWS_PER_REQUEST = 1000
+    
+    def _keyset_query(self, query, sort_column: str, cursor: str = None, desc: bool = True):
+        """Order a query by (sort_column, id) and continue after the cursor row.
+        
+        The range condition on sort_column lets the (sort_column, id) index seek
+        straight to the cursor, so deep pages cost the same as the first page.
+        """
+        if cursor:
+            sort_value, last_id = _decode_cursor(cursor)
+            if sort_column == 'id':
+                query = query.lt('id', last_id) if desc else query.gt('id', last_id)
+            elif desc:
+                query = query.lte(sort_column, sort_value).or_(
+                    f"{sort_column}.lt.{_quote_filter_value(sort_value)},id.lt.{_quote_filter_value(last_id)}")
+            else:
+                query = query.gte(sort_column, sort_value).or_(
+                    f"{sort_column}.gt.{_quote_filter_value(sort_value)},id.gt.{_quote_filter_value(last_id)}")
+        
+        query = query.order(sort_column, desc=desc)
+        if sort_column != 'id':
+            query = query.order('id', desc=desc)
+        return query
+    
+    def _keyset_page(self, query, sort_column: str, limit: int, cursor: str = None, desc: bool = True) -> Dict:
+        """Fetch one page ordered by (sort_column, id), continuing after the cursor row"""
+        limit = min(limit, self.MAX_ROWS_PER_REQUEST - 1)  # one extra row tells whether more follow
+        response = self._keyset_query(query, sort_column, cursor, desc).limit(limit + 1).execute()
+        rows = response.data or []
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][sort_column], rows[-1]['id'])
+        
+        return {'items': rows, 'next_cursor': next_cursor}
+    
+    def _iter_keyset(self, build_query, sort_column: str, batch_size: int = 500, desc: bool = True):
+        """Yield every row of a query, fetched in keyset-paginated batches.
+        
+        build_query is called once per batch (query builders are not reusable),
+        so only one batch is held in memory at a time. Paging continues while
+        full batches come back, from the last row received.
+        """
+        batch_size = min(batch_size, self.MAX_ROWS_PER_REQUEST)
+        cursor = None
+        while True:
+            response = self._keyset_query(build_query(), sort_column, cursor, desc).limit(batch_size).execute()
+            rows = response.data or []
+            yield from rows
+            if len(rows) < batch_size:
+                break
+            cursor = _encode_cursor(rows[-1][sort_column], rows[-1]['id'])
+    
     # Product Management
     def get_all_products(self) -> List[Dict]:
         """Get all active products"""
@@ -28,6 +105,29 @@ class SupabaseManager:
             print(f"Error getting products: {e}")
             return []
     
+    def count_active_products(self) -> int:
+        """Count active products without transferring the rows"""
+        try:
+            response = self.client.table('products').select('id', count='exact').eq('is_active', True).limit(1).execute()
+            return response.count or 0
+        except Exception as e:
+            print(f"Error counting products: {e}")
+            return 0
+    
+    def get_products_page(self, limit: int = 50, cursor: str = None, search: str = None) -> Optional[Dict]:
+        """Get one page of active products ordered by (name, id), optionally matching a barcode or name search (None on error)"""
+        try:
+            query = self.client.table('products').select('id, sku, barcode, name, category').eq('is_active', True)
+            if search:
+                pattern = _quote_filter_value(f"*{search}*")
+                query = query.or_(f"barcode.ilike.{pattern},name.ilike.{pattern}")
+            return self._keyset_page(query, 'name', limit, cursor, desc=False)
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error getting products page: {e}")
+            return None
+    
     def get_product_by_barcode(self, barcode: str) -> Optional[Dict]:
         """Get product by barcode"""
         try:
@@ -37,6 +137,26 @@ class SupabaseManager:
             print(f"Error getting product by barcode {barcode}: {e}")
             return None
     
+    def iter_products(self, batch_size: int = 500):
+        """Yield all products, active or not, in id order"""
+        def build_query():
+            return self.client.table('products').select('*')
+        
+        try:
+            yield from self._iter_keyset(build_query, 'id', batch_size, desc=False)
+        except Exception as e:
+            print(f"Error reading products: {e}")
+            raise
+    
+    def count_products(self) -> Optional[int]:
+        """Count all products, active or not (None if the count failed)"""
+        try:
+            response = self.client.table('products').select('id', count='exact').limit(1).execute()
+            return response.count or 0
+        except Exception as e:
+            print(f"Error counting products: {e}")
+            return None
+    
     def add_product(self, product_data: Dict) -> Optional[Dict]:
         """Add new product"""
         try:
@@ -89,36 +209,69 @@ class SupabaseManager:
             return []
     
     def update_inventory(self, product_id: str, branch_id: str, quantity: int, user_name: str = None) -> bool:
-        """Update inventory quantity - using actual Supabase schema"""
+        """Set inventory quantity by recording an adjustment in the inventory_movements ledger"""
         try:
-            # Check if inventory record exists
-            existing = self.client.table('inventory').select('id').eq('product_id', product_id).eq('branch_id', branch_id).execute()
-            
-            # Use actual column names from Supabase
-            inventory_data = {
-                'current_quantity': quantity,
-                'last_updated_at': datetime.now().isoformat(),
-                'last_counted_at': datetime.now().isoformat()
-            }
-            
-            if existing.data:
-                # Update existing record
-                response = self.client.table('inventory').update(inventory_data).eq('product_id', product_id).eq('branch_id', branch_id).execute()
-                print(f"Updated inventory for product {product_id} in branch {branch_id}")
-            else:
-                # Insert new record
-                inventory_data.update({
-                    'product_id': product_id,
-                    'branch_id': branch_id
-                })
-                response = self.client.table('inventory').insert(inventory_data).execute()
-                print(f"Created new inventory record for product {product_id} in branch {branch_id}")
-            
-            return len(response.data) > 0
+            reason = f"Set by {user_name}" if user_name else None
+            response = self.client.rpc('set_inventory_quantity', {
+                'p_product_id': product_id,
+                'p_branch_id': branch_id,
+                'p_quantity': quantity,
+                'p_reason': reason
+            }).execute()
+            print(f"Adjusted inventory for product {product_id} in branch {branch_id} by {response.data}")
+            return True
         except Exception as e:
             print(f"Error updating inventory: {e}")
             return False
     
+    def record_inventory_movement(self, product_id: str, branch_id: str, movement_type: str, quantity: int,
+                                  reference_type: str = None, reference_id: str = None,
+                                  reason: str = None, notes: str = None) -> Optional[Dict]:
+        """Append a movement to the ledger ('in'/'out' with a positive quantity, 'adjustment' signed).
+        
+        inventory.current_quantity follows from the ledger; movements are never edited,
+        mistakes are corrected with another movement.
+        """
+        try:
+            movement = {
+                'product_id': product_id,
+                'branch_id': branch_id,
+                'movement_type': movement_type,
+                'quantity': quantity,
+                'reference_type': reference_type or ('adjustment' if movement_type == 'adjustment' else None),
+                'reference_id': reference_id,
+                'reason': reason,
+                'notes': notes
+            }
+            response = self.client.table('inventory_movements').insert(movement).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error recording inventory movement: {e}")
+            return None
+    
+    def compact_inventory_snapshots(self, at: datetime = None) -> int:
+        """Checkpoint ledger balances so balance lookups replay only recent movements"""
+        try:
+            params = {'p_at': at.isoformat()} if at else {}
+            response = self.client.rpc('compact_inventory_snapshots', params).execute()
+            return response.data or 0
+        except Exception as e:
+            print(f"Error compacting inventory snapshots: {e}")
+            return 0
+    
+    def get_inventory_as_of(self, branch_id: str, as_of: datetime, product_id: str = None) -> Optional[List[Dict]]:
+        """Get every product's quantity in a branch at a point in time (ledger snapshot + replay)"""
+        try:
+            response = self.client.rpc('get_inventory_as_of', {
+                'p_branch_id': branch_id,
+                'p_as_of': as_of.isoformat(),
+                'p_product_id': product_id
+            }).execute()
+            return response.data or []
+        except Exception as e:
+            print(f"Error getting inventory as of {as_of}: {e}")
+            return None
+    
     # Stock Counting
     def add_stock_count(self, count_data: Dict) -> bool:
         """Add stock count record with count tracking"""
@@ -135,13 +288,8 @@ class SupabaseManager:
                     return False
             
             # Get count number for this product and branch
-            try:
-                existing_counts = self.client.table('stock_counts').select('id').eq('product_id', count_data['product_id']).eq('branch_id', count_data['branch_id']).execute()
-                count_number = len(existing_counts.data) + 1
-                print(f"This will be count #{count_number} for product {count_data['product_id']} in branch {count_data['branch_id']}")
-            except Exception as e:
-                print(f"Error getting count number: {e}")
-                count_number = 1
+            count_number = self.count_stock_counts(count_data['product_id'], count_data['branch_id']) + 1
+            print(f"This will be count #{count_number} for product {count_data['product_id']} in branch {count_data['branch_id']}")
             
             # Add count tracking to notes
             current_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
@@ -173,19 +321,18 @@ class SupabaseManager:
             print(f"Inserting stock count data with tracking: {count_data}")
             response = self.client.table('stock_counts').insert(count_data).execute()
             
-            # Update inventory with counted quantity if insert successful
             if response.data:
                 print(f"✅ Stock count inserted successfully - {count_status}")
-                try:
-                    self.update_inventory(
-                        count_data['product_id'],
-                        count_data['branch_id'],
-                        count_data['counted_quantity'],
-                        count_data.get('counter_name')
-                    )
-                except Exception as inv_error:
-                    print(f"Warning: Failed to update inventory: {inv_error}")
-                    # Don't fail the whole operation if inventory update fails
+                
+                # system_quantity / variance are filled in by the stock_counts_variance trigger
+                inserted = response.data[0]
+                if inserted.get('variance') is not None:
+                    print(f"Expected {inserted.get('system_quantity')}, counted {inserted.get('counted_quantity')} "
+                          f"(variance {inserted['variance']:+d})")
+                
+                # Inventory follows from the count adjustment that the stock_counts_ledger
+                # trigger appends to inventory_movements
+                self._publish_stock_count(inserted)
             
             return len(response.data) > 0
         except Exception as e:
@@ -194,6 +341,131 @@ class SupabaseManager:
             traceback.print_exc()
             return False
     
+    def count_stock_counts(self, product_id: str, branch_id: str, before: str = None) -> int:
+        """Count earlier stock counts of a product in a branch (optionally only those counted before a time)"""
+        try:
+            query = self.client.table('stock_counts').select('id', count='exact') \
+                .eq('product_id', product_id).eq('branch_id', branch_id)
+            if before:
+                query = query.lt('counted_at', before)
+            response = query.limit(1).execute()
+            return response.count or 0
+        except Exception as e:
+            print(f"Error counting stock counts: {e}")
+            return 0
+    
+    def get_stock_count_history(self, barcode: str) -> List[Dict]:
+        """Get every count of a barcode (branch_name, count_number, counted_at), newest first"""
+        try:
+            response = self.client.table('stock_counts').select('branch_name, count_number, counted_at') \
+                .eq('barcode', barcode).order('counted_at', desc=True).execute()
+            return response.data or []
+        except Exception as e:
+            print(f"Error getting stock count history for {barcode}: {e}")
+            return []
+    
+    def insert_replicated_rows(self, table: str, rows: List[Dict]) -> List[Dict]:
+        """Insert rows that carry their own id, skipping ids already present.
+        
+        Returns the rows inserted, as stored (ids already present are not
+        returned), so replaying the same rows is harmless. Errors are raised
+        rather than printed so the local store outbox (local_store.py) can
+        retry them.
+        """
+        response = self.client.table(table).upsert(rows, on_conflict='id', ignore_duplicates=True).execute()
+        return response.data or []
+    
+    def is_reachable(self) -> bool:
+        """Whether Supabase answers at all (one tiny request)"""
+        try:
+            self.client.table('branches').select('id').limit(1).execute()
+            return True
+        except Exception:
+            return False
+    
+    def _publish_stock_count(self, count_row: Dict):
+        """Push a new stock count (and the refreshed low stock badge) to live dashboards"""
+        if not event_broker.subscriber_count():
+            return
+        try:
+            event_broker.publish('stock_count', {
+                'count': count_row,
+                'low_stock_count': self.count_low_stock_alerts(),
+                'branch_low_stock_count': self.count_low_stock_alerts(count_row.get('branch_id'))
+            })
+        except Exception as e:
+            print(f"Warning: Could not publish stock count event: {e}")
+    
+    def get_recent_stock_counts(self, branch_id: str = None, limit: int = 10, cursor: str = None) -> Dict:
+        """Get one page of stock counts, newest first, ordered by (counted_at, id)"""
+        try:
+            query = self.client.table('stock_counts').select('''
+                *,
+                products (name, barcode),
+                branches (name)
+            ''')
+            
+            if branch_id:
+                query = query.eq('branch_id', branch_id)
+            
+            return self._keyset_page(query, 'counted_at', limit, cursor)
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error getting recent stock counts: {e}")
+            return {'items': [], 'next_cursor': None}
+    
+    def iter_stock_counts(self, branch_id: str = None, start_date: date = None, end_date: date = None,
+                          batch_size: int = 500):
+        """Yield all stock counts (optionally for a branch and date range), newest first"""
+        def build_query():
+            query = self.client.table('stock_counts').select('''
+                *,
+                products (name, barcode),
+                branches (name)
+            ''')
+            if branch_id:
+                query = query.eq('branch_id', branch_id)
+            if start_date:
+                query = query.gte('counted_at', start_date.isoformat())
+            if end_date:
+                query = query.lt('counted_at', (end_date + timedelta(days=1)).isoformat())
+            return query
+        
+        try:
+            yield from self._iter_keyset(build_query, 'counted_at', batch_size)
+        except Exception as e:
+            print(f"Error reading stock counts: {e}")
+            raise
+    
+    def count_stock_counts_since(self, start_date: date) -> Optional[int]:
+        """Count stock counts made on or after start_date (None if the count failed)"""
+        try:
+            response = self.client.table('stock_counts').select('id', count='exact') \
+                .gte('counted_at', start_date.isoformat()).limit(1).execute()
+            return response.count or 0
+        except Exception as e:
+            print(f"Error counting stock counts: {e}")
+            return None
+    
+    def iter_inventory(self, branch_id: str = None, batch_size: int = 500):
+        """Yield all inventory rows with product and branch details, in id order"""
+        def build_query():
+            query = self.client.table('inventory').select('''
+                *,
+                products (sku, barcode, name, category, cost_price),
+                branches (name, code)
+            ''')
+            if branch_id:
+                query = query.eq('branch_id', branch_id)
+            return query
+        
+        try:
+            yield from self._iter_keyset(build_query, 'id', batch_size, desc=False)
+        except Exception as e:
+            print(f"Error reading inventory: {e}")
+            raise
+    
     def get_stock_summary(self) -> List[Dict]:
         """Get stock summary with product and branch details"""
         try:
@@ -229,98 +501,238 @@ class SupabaseManager:
             print(f"Error getting sales by period: {e}")
             return []
     
-    def get_daily_sales_summary(self, days: int = 30, branch_id: str = None) -> List[Dict]:
-        """Get daily sales summary for last N days"""
+    def get_daily_sales_summary(self, days: int = 30, branch_id: str = None,
+                                start_date: date = None, end_date: date = None) -> List[Dict]:
+        """Get gap-filled daily sales series (oldest first) for the last N days or a date range"""
         try:
-            start_date = datetime.now() - timedelta(days=days)
-            end_date = datetime.now()
-            
-            query = f'''
-                SELECT 
-                    DATE(transaction_date) as sale_date,
-                    COUNT(*) as transaction_count,
-                    SUM(total_amount) as total_sales
-                FROM sales 
-                WHERE transaction_date >= '{start_date.isoformat()}'
-                AND transaction_date <= '{end_date.isoformat()}'
-            '''
-            
-            if branch_id:
-                query += f" AND branch_id = '{branch_id}'"
-            
-            query += " GROUP BY DATE(transaction_date) ORDER BY sale_date DESC"
-            
-            response = self.client.rpc('execute_sql', {'query': query}).execute()
+            end_date = end_date or datetime.now().date()
+            start_date = start_date or end_date - timedelta(days=days - 1)
+            
+            response = self.client.rpc('get_daily_sales_summary', {
+                'p_start_date': start_date.isoformat(),
+                'p_end_date': end_date.isoformat(),
+                'p_branch_id': branch_id
+            }).execute()
             return response.data if response.data else []
         except Exception as e:
             print(f"Error getting daily sales summary: {e}")
             return []
     
-    def get_top_selling_products(self, days: int = 30, limit: int = 10, branch_id: str = None) -> List[Dict]:
-        """Get top selling products"""
+    def get_sales_period_summary(self, start_date: date, end_date: date, branch_id: str = None) -> Dict:
+        """Get sales totals for a period and for the previous period of the same length"""
         try:
-            start_date = datetime.now() - timedelta(days=days)
-            
-            query = self.client.table('sale_items').select('''
-                product_id,
-                products (name, category, barcode),
-                quantity
-            ''').gte('created_at', start_date.isoformat())
-            
-            # If branch_id is provided, join with sales table to filter by branch
-            if branch_id:
-                query = query.select('''
-                    product_id,
-                    products (name, category, barcode),
-                    quantity,
-                    sales!inner (branch_id)
-                ''').eq('sales.branch_id', branch_id)
-            
-            response = query.execute()
-            
-            # Aggregate the results
-            product_sales = {}
-            for item in response.data:
-                product_id = item['product_id']
-                if product_id not in product_sales:
-                    product_sales[product_id] = {
-                        'product': item['products'],
-                        'total_quantity': 0,
-                        'total_sales': 0
-                    }
-                product_sales[product_id]['total_quantity'] += item['quantity']
-            
-            # Sort and limit
-            sorted_products = sorted(product_sales.values(), key=lambda x: x['total_quantity'], reverse=True)
-            return sorted_products[:limit]
+            response = self.client.rpc('get_sales_period_summary', {
+                'p_start_date': start_date.isoformat(),
+                'p_end_date': end_date.isoformat(),
+                'p_branch_id': branch_id
+            }).execute()
+            row = response.data[0] if response.data else {}
+            
+            current_sales = float(row.get('current_sales') or 0)
+            previous_sales = float(row.get('previous_sales') or 0)
+            change_percent = None
+            if previous_sales:
+                change_percent = (current_sales - previous_sales) / previous_sales * 100
+            
+            return {
+                'current_sales': current_sales,
+                'current_transactions': row.get('current_transactions') or 0,
+                'previous_sales': previous_sales,
+                'previous_transactions': row.get('previous_transactions') or 0,
+                'change_percent': change_percent
+            }
+        except Exception as e:
+            print(f"Error getting sales period summary: {e}")
+            return {
+                'current_sales': 0,
+                'current_transactions': 0,
+                'previous_sales': 0,
+                'previous_transactions': 0,
+                'change_percent': None
+            }
+    
+    def get_top_selling_products(self, days: int = 30, limit: int = 10, branch_id: str = None,
+                                 start_date: date = None, end_date: date = None) -> List[Dict]:
+        """Get top selling products for the last N days or a date range (from sales rollups)"""
+        try:
+            end_date = end_date or datetime.now().date()
+            start_date = start_date or end_date - timedelta(days=days - 1)
+            
+            response = self.client.rpc('get_top_products_for_period', {
+                'p_start_date': start_date.isoformat(),
+                'p_end_date': end_date.isoformat(),
+                'p_branch_id': branch_id,
+                'p_limit': limit
+            }).execute()
+            
+            return [{
+                'product_id': row['product_id'],
+                'product': {
+                    'name': row['name'],
+                    'category': row['category'],
+                    'barcode': row['barcode']
+                },
+                'total_quantity': row['total_quantity'],
+                'total_sales': float(row['total_sales'] or 0)
+            } for row in (response.data or [])]
         except Exception as e:
             print(f"Error getting top selling products: {e}")
             return []
     
     def get_low_stock_alerts(self, branch_id: str = None) -> List[Dict]:
-        """Get products with low stock levels"""
+        """Get products with low stock levels (filtered server-side by the low_stock_inventory view)"""
         try:
-            query = self.client.table('inventory').select('''
-                *,
-                products (id, name, barcode, reorder_level),
-                branches (name, code)
-            ''')
+            query = self.client.table('low_stock_inventory').select('*').order('current_quantity')
             
             if branch_id:
                 query = query.eq('branch_id', branch_id)
             
             response = query.execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting low stock alerts: {e}")
+            return []
+    
+    def count_low_stock_alerts(self, branch_id: str = None) -> int:
+        """Count products with low stock levels without transferring the rows"""
+        try:
+            response = self.client.rpc('count_low_stock_items', {'p_branch_id': branch_id}).execute()
+            return response.data or 0
+        except Exception as e:
+            print(f"Error counting low stock alerts: {e}")
+            return 0
+    
+    def get_replenishment_inputs(self, as_of: date = None) -> Optional[Dict]:
+        """Get stock and 30/7-day sales per product and branch as column arrays (see replenishment.py)"""
+        try:
+            as_of = as_of or datetime.now().date()
+            response = self.client.rpc('get_replenishment_inputs', {'p_as_of': as_of.isoformat()}).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting replenishment inputs: {e}")
+            return None
+    
+    def get_slow_mover_inputs(self, as_of: date = None) -> Optional[Dict]:
+        """Get stocked product/branch rows with last sale date and 30-day sales as column arrays (see slow_movers.py)"""
+        try:
+            as_of = as_of or datetime.now().date()
+            response = self.client.rpc('get_slow_mover_inputs', {'p_as_of': as_of.isoformat()}).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting slow mover inputs: {e}")
+            return None
+    
+    # Demand Forecasts
+    def iter_sales_history(self, start_date: date, end_date: date, product_batch: int = 2000):
+        """Yield daily sales history in batches of products (column arrays, see get_sales_history_batch)"""
+        after_product_id = None
+        while True:
+            response = self.client.rpc('get_sales_history_batch', {
+                'p_start_date': start_date.isoformat(),
+                'p_end_date': end_date.isoformat(),
+                'p_after_product_id': after_product_id,
+                'p_product_limit': product_batch
+            }).execute()
+            batch = response.data
+            if not batch or not batch.get('last_product_id'):
+                break
+            yield batch
+            after_product_id = batch['last_product_id']
+    
+    def save_demand_forecasts(self, forecasts: List[Dict], chunk_size: int = 1000) -> int:
+        """Upsert forecast rows (one per product and branch) in chunks; returns rows saved"""
+        saved = 0
+        for start in range(0, len(forecasts), chunk_size):
+            chunk = forecasts[start:start + chunk_size]
+            try:
+                self.client.table('demand_forecasts').upsert(chunk, on_conflict='product_id,branch_id').execute()
+                saved += len(chunk)
+            except Exception as e:
+                print(f"Error saving demand forecasts: {e}")
+        return saved
+    
+    def delete_stale_demand_forecasts(self, before: date) -> bool:
+        """Remove forecasts from runs before the given date (series that stopped selling)"""
+        try:
+            self.client.table('demand_forecasts').delete().lt('forecast_date', before.isoformat()).execute()
+            return True
+        except Exception as e:
+            print(f"Error deleting stale demand forecasts: {e}")
+            return False
+    
+    # Report Snapshots
+    def get_report_snapshot(self, report_key: str, since: datetime = None) -> Optional[Dict]:
+        """Get the stored snapshot of a report (payload, generated_at), if generated at or after since"""
+        try:
+            query = self.client.table('report_snapshots').select('payload, generated_at').eq('report_key', report_key)
             
-            # Filter products where quantity <= reorder_level
-            low_stock_items = []
-            for item in response.data:
-                reorder_level = item['products']['reorder_level'] or 0
-                if item['quantity'] <= reorder_level:
-                    low_stock_items.append(item)
+            if since:
+                query = query.gte('generated_at', since.isoformat())
             
-            return low_stock_items
+            response = query.limit(1).execute()
+            return response.data[0] if response.data else None
         except Exception as e:
-            print(f"Error getting low stock alerts: {e}")
+            print(f"Error getting report snapshot {report_key}: {e}")
+            return None
+    
+    def save_report_snapshot(self, report_key: str, payload, generated_at: datetime, duration_ms: int = None) -> bool:
+        """Store (replace) the precomputed snapshot of a report"""
+        try:
+            self.client.table('report_snapshots').upsert({
+                'report_key': report_key,
+                'payload': payload,
+                'generated_at': generated_at.isoformat(),
+                'duration_ms': duration_ms,
+                'updated_at': datetime.now().isoformat()
+            }, on_conflict='report_key').execute()
+            return True
+        except Exception as e:
+            print(f"Error saving report snapshot {report_key}: {e}")
+            return False
+    
+    # Reconciliation
+    def get_product_range_hashes(self, lows: List[str], highs: List[Optional[str]], with_sku: bool = True) -> Optional[Dict]:
+        """Get row count and hash of the active products per barcode range (column arrays, see reconcile.py)"""
+        try:
+            response = self.client.rpc('get_product_range_hashes', {
+                'p_lows': lows, 'p_highs': highs, 'p_with_sku': with_sku
+            }).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting product range hashes: {e}")
+            return None
+    
+    def get_product_range_rows(self, lows: List[str], highs: List[Optional[str]]) -> Optional[Dict]:
+        """Get the active products (barcode, sku, name) in the given barcode ranges as column arrays"""
+        try:
+            response = self.client.rpc('get_product_range_rows', {'p_lows': lows, 'p_highs': highs}).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting product range rows: {e}")
+            return None
+    
+    # Count Variance
+    def get_shrinkage_report(self, branch_id: str = None, limit: int = 50) -> List[Dict]:
+        """Get products with the largest cumulative shortfall at count time (from count_variance_stats)"""
+        try:
+            query = self.client.table('variance_stats_report').select('*').gt('shrinkage_units', 0)
+            
+            if branch_id:
+                query = query.eq('branch_id', branch_id)
+            
+            response = query.order('shrinkage_units', desc=True).limit(limit).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting shrinkage report: {e}")
+            return []
+    
+    def get_branch_variance_summary(self) -> List[Dict]:
+        """Get count variance totals per branch"""
+        try:
+            response = self.client.table('branch_variance_summary').select('*').order('shrinkage_value', desc=True).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting branch variance summary: {e}")
             return []
     
     # Alert Management
@@ -328,11 +740,27 @@ class SupabaseManager:
         """Create a new alert"""
         try:
             response = self.client.table('alerts').insert(alert_data).execute()
+            if response.data:
+                self._publish_alert(response.data[0]['id'])
             return len(response.data) > 0
         except Exception as e:
             print(f"Error creating alert: {e}")
             return False
     
+    def _publish_alert(self, alert_id: str):
+        """Push a new alert (with product/branch names) to live dashboards"""
+        if not event_broker.subscriber_count():
+            return
+        try:
+            alert = self.client.table('alerts').select('''
+                *,
+                products (name, barcode),
+                branches (name, code)
+            ''').eq('id', alert_id).single().execute()
+            event_broker.publish('alert', alert.data)
+        except Exception as e:
+            print(f"Warning: Could not publish alert event: {e}")
+    
     def get_active_alerts(self, branch_id: str = None) -> List[Dict]:
         """Get active (unresolved) alerts"""
         try:
@@ -351,6 +779,39 @@ class SupabaseManager:
             print(f"Error getting active alerts: {e}")
             return []
     
+    def get_active_alerts_page(self, branch_id: str = None, limit: int = 10, cursor: str = None) -> Dict:
+        """Get one page of active alerts, newest first, ordered by (created_at, id)"""
+        try:
+            query = self.client.table('alerts').select('''
+                *,
+                products (name, barcode),
+                branches (name, code)
+            ''').eq('is_resolved', False)
+            
+            if branch_id:
+                query = query.eq('branch_id', branch_id)
+            
+            return self._keyset_page(query, 'created_at', limit, cursor)
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error getting active alerts page: {e}")
+            return {'items': [], 'next_cursor': None}
+    
+    def count_active_alerts(self, branch_id: str = None) -> int:
+        """Count active alerts without transferring the rows"""
+        try:
+            query = self.client.table('alerts').select('id', count='exact').eq('is_resolved', False)
+            
+            if branch_id:
+                query = query.eq('branch_id', branch_id)
+            
+            response = query.limit(1).execute()
+            return response.count or 0
+        except Exception as e:
+            print(f"Error counting active alerts: {e}")
+            return 0
+    
     def resolve_alert(self, alert_id: str, user_id: str) -> bool:
         """Resolve an alert"""
         try:
@@ -359,77 +820,90 @@ class SupabaseManager:
                 'resolved_by': user_id,
                 'resolved_at': datetime.now().isoformat()
             }).eq('id', alert_id).execute()
+            
+            if response.data:
+                event_broker.publish('alert_resolved', {
+                    'id': alert_id,
+                    'branch_id': response.data[0].get('branch_id')
+                })
             return len(response.data) > 0
         except Exception as e:
             print(f"Error resolving alert: {e}")
             return False
     
     # Dashboard Analytics
-    def get_dashboard_summary(self, branch_id: str = None) -> Dict:
-        """Get dashboard summary data"""
-        try:
-            # Get date ranges
-            today = datetime.now()
-            yesterday = today - timedelta(days=1)
-            last_30_days = today - timedelta(days=30)
-            
-            summary = {
-                'total_products': 0,
-                'total_branches': 0,
-                'low_stock_count': 0,
-                'active_alerts_count': 0,
-                'today_sales': 0,
-                'yesterday_sales': 0,
-                'monthly_sales': 0,
-                'top_products': [],
-                'recent_stock_counts': []
-            }
-            
+    def resolve_period(self, period: int = 30, start_date: date = None, end_date: date = None):
+        """Turn a day count or an explicit range into (start_date, end_date)"""
+        end_date = end_date or datetime.now().date()
+        start_date = start_date or end_date - timedelta(days=period - 1)
+        return start_date, end_date
+    
+    def get_dashboard_kpis(self, branch_id: str = None, period: int = 30,
+                           start_date: date = None, end_date: date = None) -> Dict:
+        """Get dashboard counters and sales figures (the KPI cards)"""
+        start_date, end_date = self.resolve_period(period, start_date, end_date)
+        
+        kpis = {
+            'total_products': 0,
+            'total_branches': 0,
+            'low_stock_count': 0,
+            'active_alerts_count': 0,
+            'today_sales': 0,
+            'yesterday_sales': 0,
+            'period_start': start_date.isoformat(),
+            'period_end': end_date.isoformat(),
+            'period_days': (end_date - start_date).days + 1,
+            'period_sales': 0,
+            'period_transactions': 0,
+            'previous_period_sales': 0,
+            'period_change_percent': None
+        }
+        
+        try:
             # Total products
-            products = self.get_all_products()
-            summary['total_products'] = len(products)
+            kpis['total_products'] = self.count_active_products()
             
             # Total branches
             branches = self.get_all_branches()
-            summary['total_branches'] = len(branches)
+            kpis['total_branches'] = len(branches)
             
             # Low stock count
-            low_stock = self.get_low_stock_alerts(branch_id)
-            summary['low_stock_count'] = len(low_stock)
+            kpis['low_stock_count'] = self.count_low_stock_alerts(branch_id)
             
             # Active alerts count
-            alerts = self.get_active_alerts(branch_id)
-            summary['active_alerts_count'] = len(alerts)
-            
-            # Sales data
-            today_sales = self.get_sales_by_period(today.replace(hour=0, minute=0, second=0), today, branch_id)
-            summary['today_sales'] = sum(sale['total_amount'] for sale in today_sales)
-            
-            yesterday_sales = self.get_sales_by_period(yesterday.replace(hour=0, minute=0, second=0), yesterday.replace(hour=23, minute=59, second=59), branch_id)
-            summary['yesterday_sales'] = sum(sale['total_amount'] for sale in yesterday_sales)
-            
-            monthly_sales = self.get_sales_by_period(last_30_days, today, branch_id)
-            summary['monthly_sales'] = sum(sale['total_amount'] for sale in monthly_sales)
+            kpis['active_alerts_count'] = self.count_active_alerts(branch_id)
+            
+            # Sales data (answered from daily rollups, so long periods cost the same as short ones)
+            today = datetime.now().date()
+            today_summary = self.get_sales_period_summary(today, today, branch_id)
+            kpis['today_sales'] = today_summary['current_sales']
+            kpis['yesterday_sales'] = today_summary['previous_sales']
+            
+            period_summary = self.get_sales_period_summary(start_date, end_date, branch_id)
+            kpis['period_sales'] = period_summary['current_sales']
+            kpis['period_transactions'] = period_summary['current_transactions']
+            kpis['previous_period_sales'] = period_summary['previous_sales']
+            kpis['period_change_percent'] = period_summary['change_percent']
+        except Exception as e:
+            print(f"Error getting dashboard KPIs: {e}")
+        
+        return kpis
+    
+    def get_dashboard_summary(self, branch_id: str = None, period: int = 30,
+                              start_date: date = None, end_date: date = None) -> Dict:
+        """Get all dashboard data in one call (KPIs, top products and recent stock counts)"""
+        try:
+            start_date, end_date = self.resolve_period(period, start_date, end_date)
+            summary = self.get_dashboard_kpis(branch_id, start_date=start_date, end_date=end_date)
             
             # Top products
-            summary['top_products'] = self.get_top_selling_products(30, 5, branch_id)
+            summary['top_products'] = self.get_top_selling_products(
+                limit=5, branch_id=branch_id, start_date=start_date, end_date=end_date)
             
-            # Recent stock counts
-            try:
-                recent_counts = self.client.table('stock_counts').select('''
-                    *,
-                    products (name, barcode),
-                    branches (name)
-                ''').order('counted_at', desc=True).limit(10)
-                
-                if branch_id:
-                    recent_counts = recent_counts.eq('branch_id', branch_id)
-                
-                response = recent_counts.execute()
-                summary['recent_stock_counts'] = response.data
-            except Exception as e:
-                print(f"Error getting recent stock counts: {e}")
-                summary['recent_stock_counts'] = []
+            # Recent stock counts (first page; further pages via get_recent_stock_counts)
+            recent_counts = self.get_recent_stock_counts(branch_id, limit=10)
+            summary['recent_stock_counts'] = recent_counts['items']
+            summary['recent_stock_counts_cursor'] = recent_counts['next_cursor']
             
             return summary
         except Exception as e:
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Product Sync Daemon
+Keeps the products table in step with the Product Master sheet: polls the
+sheet's Drive version and, when it changes, pushes only the rows that differ
+from the last synced snapshot (new and edited rows are upserted, rows removed
+from the sheet are deactivated)
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from dotenv import load_dotenv
+import import_products
+import batch_writes
+
+# Seconds between checks of the sheet's Drive version
+POLL_SECONDS = 60
+
+# Sheet rows read per request when a change is detected
+READ_WINDOW = 5000
+
+# Keys per request when deactivating removed rows or paging through products
+KEY_CHUNK = 200
+PAGE_SIZE = 1000
+
+# A sync that would deactivate more than this share of the synced products
+# (or all of them, after an empty read) is refused unless forced: a
+# truncated or failed sheet read looks exactly like mass deletion
+MAX_REMOVED_FRACTION = 0.1
+
+# Hash of every synced row (by key) and the sheet version they came from
+SYNC_STATE_FILE = os.environ.get('PRODUCT_SYNC_STATE_FILE', 'product_sync_state.json')
+
+def row_hash(record):
+    """Stable hash of a products record, used to spot changed rows"""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def _columns_id(mapping):
+    return ','.join(f"{field}={import_products.column_letter(index)}" for field, index in sorted(mapping.items()))
+
+def _load_state(sheet_id, mapping, key):
+    """Last synced snapshot of this sheet, layout and key, or None"""
+    try:
+        with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if (state.get('sheet_id') == sheet_id and state.get('columns') == _columns_id(mapping)
+                and state.get('key') == key):
+            return state
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: Could not read product sync state, rebuilding: {e}")
+    return None
+
+def _save_state(state):
+    """Write the sync snapshot atomically"""
+    temp_file = f"{SYNC_STATE_FILE}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_file, SYNC_STATE_FILE)
+
+def snapshot_from_supabase(supabase, sheet_id, mapping, key):
+    """Build the starting snapshot from the active products already in Supabase.
+
+    Hashing what Supabase holds means the first sync pushes only the rows
+    that really differ instead of re-importing the whole sheet.
+    """
+    fields = sorted(set(mapping) | {'is_active'})
+    hashes = {}
+    start = 0
+    while True:
+        rows = supabase.table('products').select(','.join(fields)).eq('is_active', True) \
+            .order(key).range(start, start + PAGE_SIZE - 1).execute().data or []
+        for row in rows:
+            record = {field: row.get(field) for field in fields}
+            if record.get(key):
+                hashes[record[key]] = row_hash(record)
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+    print(f"Snapshot built from {len(hashes)} active products in Supabase")
+    return {'sheet_id': sheet_id, 'columns': _columns_id(mapping), 'key': key, 'version': None, 'hashes': hashes}
+
+def read_sheet_records(sheets_manager, sheet_id, mapping, key):
+    """Current sheet rows as {key: (row number, record)}; the last row wins for a repeated key"""
+    records = {}
+    skipped = 0
+    for first_row, rows in import_products.sheet_windows(sheets_manager, sheet_id, mapping, 2, READ_WINDOW):
+        for offset, values in enumerate(rows):
+            record, reason = import_products.product_record(values, mapping)
+            if record:
+                records[record[key]] = (first_row + offset, record)
+            elif reason:
+                skipped += 1
+    if skipped:
+        print(f"Skipped {skipped} sheet rows that cannot be imported (run import_products.py to list them)")
+    return records
+
+def deactivate_products(supabase, key, keys):
+    """Mark products removed from the sheet inactive; returns the keys that were updated"""
+    done = []
+    for i in range(0, len(keys), KEY_CHUNK):
+        chunk = keys[i:i + KEY_CHUNK]
+        try:
+            supabase.table('products').update({'is_active': False}).in_(key, chunk).execute()
+            done.extend(chunk)
+        except Exception as e:
+            print(f"Error deactivating {len(chunk)} products: {e}")
+    return done
+
+def sync_once(supabase, sheets_manager, sheet_id, mapping, key, state, force=False):
+    """Push the sheet rows changed since the snapshot; returns the updated state.
+
+    The Drive version is checked first, so an unchanged sheet costs one
+    small request. Rows that fail to sync keep their old hash and the
+    version is not recorded, so the next poll tries them again. A read that
+    would remove more than MAX_REMOVED_FRACTION of the products is not
+    synced at all unless force is set.
+    """
+    file_version = sheets_manager.get_file_version(sheet_id)
+    version = file_version.get('version') if file_version else None
+    if version is not None and version == state.get('version'):
+        return state
+
+    started_at = time.monotonic()
+    current = read_sheet_records(sheets_manager, sheet_id, mapping, key)
+    hashes = state['hashes']
+    new_hashes = {k: row_hash(record) for k, (_, record) in current.items()}
+
+    changed = [current[k] for k, h in new_hashes.items() if hashes.get(k) != h]
+    removed = [k for k in hashes if k not in current]
+    if not changed and not removed:
+        state['version'] = version
+        return state
+    if removed and not force and (not current or len(removed) > MAX_REMOVED_FRACTION * len(hashes)):
+        print(f"Refusing to sync sheet version {version}: {len(removed)} of {len(hashes)} products are missing "
+              f"from the sheet, which looks like an incomplete read (use --force if they were really removed)")
+        return state
+
+    def write(batch):
+        import_products.upsert_products(supabase, [record for _, record in batch], key)
+
+    rejects = []
+    written = 0
+    for i in range(0, len(changed), batch_writes.IMPORT_WINDOW):
+        written += batch_writes.upsert_bisecting(write, changed[i:i + batch_writes.IMPORT_WINDOW], rejects)
+    rejected_keys = {record.get(key) for _, record, _ in rejects}
+    for _, record in changed:
+        if record[key] not in rejected_keys:
+            hashes[record[key]] = new_hashes[record[key]]
+    for row_number, record, reason in rejects:
+        print(f"  row {row_number} ({record.get(key)}): {reason}")
+
+    deactivated = deactivate_products(supabase, key, removed)
+    for k in deactivated:
+        del hashes[k]
+
+    complete = not rejects and len(deactivated) == len(removed)
+    state['version'] = version if complete else None
+    print(f"Synced sheet version {version}: {written} upserted, {len(deactivated)} deactivated, "
+          f"{len(rejects)} failed in {time.monotonic() - started_at:.1f}s")
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync Product Master sheet changes to Supabase')
+    parser.add_argument('--sheet-id', type=str, default=import_products.PRODUCT_SHEET_ID, help='Google Sheets document ID')
+    parser.add_argument('--layout', choices=sorted(import_products.LAYOUTS), default='ab', help='Preset column layout')
+    parser.add_argument('--columns', type=str, help='Custom layout, e.g. "sku=C,barcode=D,name=E"')
+    parser.add_argument('--key', choices=['barcode', 'sku'], default='barcode', help='Unique column to sync on')
+    parser.add_argument('--interval', type=int, default=POLL_SECONDS, help='Seconds between checks')
+    parser.add_argument('--once', action='store_true', help='Sync once and exit (for cron)')
+    parser.add_argument('--resnapshot', action='store_true', help='Rebuild the snapshot from Supabase first')
+    parser.add_argument('--force', action='store_true', help='Deactivate removed products even when most of the sheet is missing')
+
+    args = parser.parse_args()
+
+    try:
+        mapping = import_products.parse_columns(args.columns or import_products.LAYOUTS[args.layout])
+    except ValueError as e:
+        parser.error(str(e))
+    if args.key not in mapping:
+        parser.error(f"--key {args.key} needs a column layout that maps {args.key}")
+
+    load_dotenv()
+    from supabase_manager import create_supabase_manager
+    from sheets_manager import create_sheets_manager
+    manager = create_supabase_manager()
+    if not manager:
+        print("Error: Supabase is not configured")
+        sys.exit(1)
+    sheets_manager = create_sheets_manager()
+    if not sheets_manager or not sheets_manager.sheets_service:
+        print("Error: Could not initialize Google Sheets manager")
+        sys.exit(1)
+    if not sheets_manager.get_file_version(args.sheet_id):
+        print("Warning: Drive version unavailable, the sheet will be read and diffed on every poll")
+
+    state = None if args.resnapshot else _load_state(args.sheet_id, mapping, args.key)
+    while True:
+        try:
+            if state is None:
+                state = snapshot_from_supabase(manager.client, args.sheet_id, mapping, args.key)
+                _save_state(state)
+            state = sync_once(manager.client, sheets_manager, args.sheet_id, mapping, args.key, state, args.force)
+            _save_state(state)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            print(f"Product sync failed, retrying in {args.interval}s: {e}")
+            if args.once:
+                sys.exit(1)
+
+        if args.once:
+            break
+        try:
+            time.sleep(max(1, args.interval))
+        except KeyboardInterrupt:
+            break
+
+if __name__ == '__main__':
+    main()
@@ -7,117 +7,483 @@ Syncs sales data from Google Sheets (CSV) to SQLite database
 import sqlite3
 import pandas as pd
 import os
-from datetime import datetime, date
+import json
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+from urllib.parse import quote
 import sys
+import time
 import argparse
 
 DATABASE = 'inventory.db'
 
+# SQLite pragmas for bulk loads: WAL with relaxed fsync is still crash-safe
+# (a power cut can lose at most the last commit), and a larger page cache
+# keeps the unique index in memory while loading
+BULK_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000  # KiB
+}
+
+REQUIRED_COLUMNS = ['barcode', 'quantity_sold', 'date']
+
+# Rows parsed, cleaned and committed at a time; memory use depends on this,
+# not on the size of the export
+CHUNK_ROWS = 100000
+
+# Incremental Sheets syncs re-fetch this many days before the last synced
+# date, so rows added late for the previous day are still picked up
+WATERMARK_LOOKBACK_DAYS = 1
+
+# Multi-source syncs (--sources): concurrent downloads, and attempts per
+# source with exponential backoff between them
+SYNC_WORKERS = 4
+SOURCE_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 2
+
+# Sales are kept per source (a branch's CSV exports, or one sheet tab), so
+# branches selling the same product on the same day do not overwrite each
+# other. CSV loads without --source share CSV_SOURCE; rows loaded before
+# sales had a source column are kept under LEGACY_SOURCE.
+CSV_SOURCE = 'csv'
+LEGACY_SOURCE = 'legacy'
+
 def get_db():
     """Get database connection"""
     conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
     return conn
 
-def sync_from_csv(csv_file_path):
-    """Sync sales data from CSV file"""
+def ensure_sales_schema(conn):
+    """Create the sales table if needed and the (source, barcode, date) unique index used for upserts.
+    
+    Tables created before sales had a source get the column (existing rows
+    under LEGACY_SOURCE) and lose the old (barcode, date) index. Databases
+    loaded before any index existed may hold duplicate rows; those are
+    merged first (quantities summed into the oldest row). Readers use the
+    daily_sales view, which sums the sources of each barcode and day.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            barcode TEXT NOT NULL,
+            quantity_sold INTEGER NOT NULL,
+            date DATE NOT NULL
+        )
+    ''')
+    
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(sales)')}
+    if 'source' not in columns:
+        print(f"Adding a source column to sales (existing rows are kept as source '{LEGACY_SOURCE}')...")
+        with conn:
+            conn.execute(f"ALTER TABLE sales ADD COLUMN source TEXT NOT NULL DEFAULT '{LEGACY_SOURCE}'")
+            conn.execute('DROP INDEX IF EXISTS idx_sales_barcode_date')
+            # CSV loads used to be keyed by file path; their staged rows cannot be resumed under the new keys
+            for table in ('sales_staging', 'sales_load_checkpoints'):
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                    conn.execute(f"DELETE FROM {table} WHERE source NOT LIKE 'sheet:%'")
+    
+    try:
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_source_barcode_date ON sales(source, barcode, date)')
+    except sqlite3.IntegrityError:
+        print("Merging duplicate sales records before creating the unique index...")
+        with conn:
+            conn.execute('''
+                UPDATE sales SET quantity_sold = (
+                    SELECT SUM(d.quantity_sold) FROM sales d
+                    WHERE d.source = sales.source AND d.barcode = sales.barcode AND d.date = sales.date
+                )
+                WHERE rowid IN (SELECT MIN(rowid) FROM sales GROUP BY source, barcode, date HAVING COUNT(*) > 1)
+            ''')
+            conn.execute('''
+                DELETE FROM sales
+                WHERE rowid NOT IN (SELECT MIN(rowid) FROM sales GROUP BY source, barcode, date)
+            ''')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_source_barcode_date ON sales(source, barcode, date)')
+    
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS daily_sales AS
+        SELECT barcode, date, SUM(quantity_sold) AS quantity_sold, COUNT(*) AS sources
+        FROM sales
+        GROUP BY barcode, date
+    ''')
+
+def clean_sales_frame(df):
+    """Validate and normalise a sales export with vectorised pandas operations.
+    
+    Returns one row per (barcode, date) with the day's total quantity_sold,
+    dates as ISO strings, ready for bulk_load_sales.
+    """
+    for col in REQUIRED_COLUMNS:
+        if col not in df.columns:
+            raise ValueError(f"Missing required column: {col}")
+    
+    barcode = df['barcode'].astype('string').str.strip()
+    quantity = pd.to_numeric(df['quantity_sold'], errors='coerce')
+    sale_date = pd.to_datetime(df['date'], errors='coerce')
+    
+    # Remove rows with invalid data
+    valid = barcode.notna() & (barcode != '') & quantity.notna() & (quantity > 0) & sale_date.notna()
+    clean = pd.DataFrame({
+        'barcode': barcode[valid],
+        'date': sale_date[valid].dt.strftime('%Y-%m-%d'),
+        'quantity_sold': quantity[valid].round().astype('int64')
+    })
+    
+    # POS exports may list a product more than once per day
+    return clean.groupby(['barcode', 'date'], as_index=False, sort=False)['quantity_sold'].sum()
+
+def ensure_load_tables(conn):
+    """Create the staging and checkpoint tables used by chunked loads.
+    
+    Everything is keyed by the same source as the sales rows. Chunks
+    accumulate in sales_staging and are merged into sales only when the
+    whole export has been read, so a barcode/day split across chunks is
+    summed rather than overwritten. sales_load_checkpoints records how many
+    rows of the file being loaded for a source are staged, for resuming, and
+    sync_watermarks the latest sale date loaded from each source.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_staging (
+            source TEXT NOT NULL,
+            barcode TEXT NOT NULL,
+            date DATE NOT NULL,
+            quantity_sold INTEGER NOT NULL,
+            PRIMARY KEY (source, barcode, date)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_load_checkpoints (
+            source TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            rows_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_watermarks (
+            source TEXT PRIMARY KEY,
+            last_date DATE,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+
+def _resume_offset(conn, source, fingerprint):
+    """Rows of source already staged by an interrupted load (0 to start over).
+    
+    A checkpoint is only trusted when the fingerprint (file path, size and
+    modification time) still matches; otherwise its staged rows are dropped.
+    """
+    checkpoint = conn.execute(
+        'SELECT fingerprint, rows_done FROM sales_load_checkpoints WHERE source = ?', (source,)).fetchone()
+    if checkpoint and fingerprint and checkpoint['fingerprint'] == fingerprint:
+        return checkpoint['rows_done']
+    
+    with conn:
+        conn.execute('DELETE FROM sales_staging WHERE source = ?', (source,))
+        conn.execute('DELETE FROM sales_load_checkpoints WHERE source = ?', (source,))
+    return 0
+
+def _stage_chunk(conn, source, fingerprint, sales, rows_done):
+    """Add one cleaned chunk to staging and advance the checkpoint, in one transaction"""
+    with conn:
+        conn.executemany('''
+            INSERT INTO sales_staging (source, barcode, date, quantity_sold)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(source, barcode, date) DO UPDATE SET quantity_sold = quantity_sold + excluded.quantity_sold
+        ''', ((source, barcode, sale_date, quantity)
+              for barcode, sale_date, quantity in sales[['barcode', 'date', 'quantity_sold']].itertuples(index=False, name=None)))
+        conn.execute('''
+            INSERT INTO sales_load_checkpoints (source, fingerprint, rows_done, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET rows_done = excluded.rows_done, updated_at = excluded.updated_at
+        ''', (source, fingerprint, rows_done, datetime.now().isoformat()))
+
+def _merge_staged(conn, source):
+    """Upsert the staged totals of source into sales and clear staging; returns rows written.
+    
+    A (barcode, date) the same source already loaded takes the new quantity,
+    so re-running an export (or an overlapping one) does not double count;
+    other sources' totals for that day are left alone. The source's
+    watermark advances to the latest staged date in the same transaction.
+    """
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO sales (source, barcode, quantity_sold, date)
+            SELECT source, barcode, quantity_sold, date FROM sales_staging WHERE source = ?
+            ON CONFLICT(source, barcode, date) DO UPDATE SET quantity_sold = excluded.quantity_sold
+        ''', (source,))
+        written = cursor.rowcount
+        conn.execute('''
+            INSERT INTO sync_watermarks (source, last_date, updated_at)
+            SELECT ?, MAX(date), ? FROM sales_staging WHERE source = ?
+            HAVING MAX(date) IS NOT NULL
+            ON CONFLICT(source) DO UPDATE SET
+                last_date = MAX(last_date, excluded.last_date),
+                updated_at = excluded.updated_at
+        ''', (source, datetime.now().isoformat(), source))
+        conn.execute('DELETE FROM sales_staging WHERE source = ?', (source,))
+        conn.execute('DELETE FROM sales_load_checkpoints WHERE source = ?', (source,))
+    return written
+
+def open_bulk_db():
+    """Connection for bulk loads: tuned pragmas, sales schema and load tables in place"""
+    conn = get_db()
+    for name, value in BULK_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    ensure_sales_schema(conn)
+    ensure_load_tables(conn)
+    return conn
+
+def bulk_load_sales(source, read_chunks, fingerprint=None, size=None):
+    """Stream a sales export into SQLite chunk by chunk; returns the number of sales rows written.
+    
+    read_chunks(skip_rows) returns an iterator of DataFrame chunks starting
+    after skip_rows data rows. Each chunk is cleaned and staged in its own
+    transaction, so memory stays flat and an interrupted load of the same
+    (unchanged) file resumes after the last staged chunk. size, when known,
+    is used with the reader position for the percentage in progress lines.
+    """
+    conn = open_bulk_db()
     try:
-        # Read CSV file
-        df = pd.read_csv(csv_file_path)
+        rows_done = _resume_offset(conn, source, fingerprint)
+        if rows_done:
+            print(f"Resuming {source} after {rows_done:,} rows")
         
-        # Validate required columns
-        required_columns = ['barcode', 'quantity_sold', 'date']
-        for col in required_columns:
-            if col not in df.columns:
-                raise ValueError(f"Missing required column: {col}")
+        started_rows, started_at = rows_done, time.monotonic()
+        for chunk in read_chunks(rows_done):
+            rows_done += len(chunk)
+            _stage_chunk(conn, source, fingerprint, clean_sales_frame(chunk), rows_done)
+            
+            elapsed = time.monotonic() - started_at
+            rate = (rows_done - started_rows) / elapsed if elapsed else 0
+            position = f" ({size() * 100:.1f}%)" if size else ''
+            print(f"  {rows_done:,} rows{position} - {rate:,.0f} rows/s")
         
-        # Clean and validate data
-        df['barcode'] = df['barcode'].astype(str).str.strip()
-        df['quantity_sold'] = pd.to_numeric(df['quantity_sold'], errors='coerce')
+        return _merge_staged(conn, source)
+    finally:
+        conn.close()
+
+def _skip_rows(rows_done):
+    """read_csv skiprows value that skips already staged data rows (keeping the header)"""
+    return range(1, rows_done + 1) if rows_done else None
+
+def sync_from_csv(csv_file_path, chunk_size=CHUNK_ROWS, source=CSV_SOURCE):
+    """Sync sales data from CSV file (streamed in chunks, resumable).
+    
+    source names where the export comes from (e.g. a branch): a later export
+    of the same source replaces its daily totals, other sources add to them.
+    """
+    try:
+        stat = os.stat(csv_file_path)
+        fingerprint = f"{os.path.abspath(csv_file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
         
-        # Parse dates
-        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
+        with open(csv_file_path, 'rb') as handle:
+            def read_chunks(rows_done):
+                # Barcodes are read as text so leading zeros and long codes survive
+                return pd.read_csv(handle, dtype={'barcode': str}, chunksize=chunk_size,
+                                   skiprows=_skip_rows(rows_done))
+            
+            written = bulk_load_sales(f"csv:{source}", read_chunks, fingerprint,
+                                      size=lambda: handle.tell() / max(stat.st_size, 1))
         
-        # Remove rows with invalid data
-        df = df.dropna(subset=['barcode', 'quantity_sold', 'date'])
-        df = df[df['quantity_sold'] > 0]
+        print(f"Successfully synced {written} sales records from {csv_file_path}")
         
-        # Connect to database
-        with get_db() as conn:
-            # Clear existing sales data (optional - depends on your sync strategy)
-            # conn.execute('DELETE FROM sales')
-            
-            # Insert new sales data
-            inserted_count = 0
-            for _, row in df.iterrows():
-                try:
-                    conn.execute('''
-                        INSERT INTO sales (barcode, quantity_sold, date)
-                        VALUES (?, ?, ?)
-                    ''', (row['barcode'], int(row['quantity_sold']), row['date']))
-                    inserted_count += 1
-                except sqlite3.IntegrityError as e:
-                    print(f"Warning: Skipping duplicate or invalid record: {row['barcode']} - {e}")
-                    continue
-            
-            print(f"Successfully synced {inserted_count} sales records from {csv_file_path}")
-            
     except Exception as e:
         print(f"Error syncing sales data: {e}")
         return False
     
     return True
 
-def sync_from_google_sheets(sheet_id, sheet_name="Sales"):
-    """Sync sales data from Google Sheets"""
+def _get_watermark(source):
+    """Latest sale date loaded from source, or None when it has never been synced"""
+    with get_db() as conn:
+        ensure_load_tables(conn)
+        row = conn.execute('SELECT last_date FROM sync_watermarks WHERE source = ?', (source,)).fetchone()
+    return date.fromisoformat(row['last_date']) if row and row['last_date'] else None
+
+def _column_letter(index):
+    """Spreadsheet column letter of a 0-based column index (0 -> A, 26 -> AA)"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def _gviz_url(sheet_id, sheet_name, query=None):
+    """Google Sheets gviz CSV export URL, optionally filtered by a query language statement"""
+    url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&headers=1&sheet={quote(sheet_name)}"
+    return f"{url}&tq={quote(query)}" if query else url
+
+def sheet_source(sheet_id, sheet_name):
+    """Source key (sales, staging, checkpoints, watermarks) of a Google Sheets tab"""
+    return f"sheet:{sheet_id}:{sheet_name}"
+
+def sheet_since(sheet_id, sheet_name, full=False):
+    """First sale date to fetch from a sheet: the watermark less the lookback, or None for everything"""
+    watermark = None if full else _get_watermark(sheet_source(sheet_id, sheet_name))
+    return watermark - timedelta(days=WATERMARK_LOOKBACK_DAYS) if watermark else None
+
+def read_sheet_chunks(sheet_id, sheet_name, chunk_size=CHUNK_ROWS, since=None):
+    """Yield the raw rows of a sheet export in DataFrame chunks, only rows dated since onwards when given"""
+    csv_url = _gviz_url(sheet_id, sheet_name)
+    
+    if since:
+        try:
+            # gviz queries address columns by letter, so find the date column from the header
+            header = pd.read_csv(_gviz_url(sheet_id, sheet_name, 'select * limit 0'), nrows=0)
+            date_column = _column_letter(list(header.columns).index('date'))
+            csv_url = _gviz_url(sheet_id, sheet_name, f"select * where {date_column} >= date '{since.isoformat()}'")
+        except Exception as e:
+            # e.g. the date column is text in the sheet; fall back to filtering after download
+            print(f"Warning: incremental query not available for {sheet_name} ({e}), filtering the full export")
+    
+    for chunk in pd.read_csv(csv_url, dtype={'barcode': str}, chunksize=chunk_size):
+        if since:
+            # Whole days from since onwards, also when the server-side filter was applied
+            chunk = chunk[pd.to_datetime(chunk['date'], errors='coerce').dt.date >= since]
+        yield chunk
+
+def sync_from_google_sheets(sheet_id, sheet_name="Sales", chunk_size=CHUNK_ROWS, full=False):
+    """Sync sales data from Google Sheets (streamed in chunks).
+    
+    Only rows dated on or after the source's watermark (less
+    WATERMARK_LOOKBACK_DAYS) are fetched, so a run costs time in proportion
+    to the new sales; full=True fetches the whole sheet.
+    """
     try:
-        # Construct Google Sheets CSV export URL
-        csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
-        
-        # Read directly from Google Sheets
-        df = pd.read_csv(csv_url)
+        since = sheet_since(sheet_id, sheet_name, full)
+        if since:
+            print(f"Syncing rows dated from {since}")
         
-        # Process the data similar to CSV sync
-        required_columns = ['barcode', 'quantity_sold', 'date']
-        for col in required_columns:
-            if col not in df.columns:
-                raise ValueError(f"Missing required column: {col}")
+        # Read directly from Google Sheets; the sheet can change between runs,
+        # so a load is never resumed (no fingerprint)
+        written = bulk_load_sales(sheet_source(sheet_id, sheet_name),
+                                  lambda rows_done: read_sheet_chunks(sheet_id, sheet_name, chunk_size, since))
+        print(f"Successfully synced {written} sales records from Google Sheets")
         
-        df['barcode'] = df['barcode'].astype(str).str.strip()
-        df['quantity_sold'] = pd.to_numeric(df['quantity_sold'], errors='coerce')
-        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
-        
-        df = df.dropna(subset=['barcode', 'quantity_sold', 'date'])
-        df = df[df['quantity_sold'] > 0]
-        
-        with get_db() as conn:
-            inserted_count = 0
-            for _, row in df.iterrows():
-                try:
-                    conn.execute('''
-                        INSERT INTO sales (barcode, quantity_sold, date)
-                        VALUES (?, ?, ?)
-                    ''', (row['barcode'], int(row['quantity_sold']), row['date']))
-                    inserted_count += 1
-                except sqlite3.IntegrityError as e:
-                    print(f"Warning: Skipping duplicate or invalid record: {row['barcode']} - {e}")
-                    continue
-            
-            print(f"Successfully synced {inserted_count} sales records from Google Sheets")
-            
     except Exception as e:
         print(f"Error syncing from Google Sheets: {e}")
         return False
     
     return True
 
+class _WriterStopped(Exception):
+    """Raised in a worker once the writer has given up on the sync"""
+
+def _send(messages, stop, message):
+    """Queue a message for the writer, giving up once stop is set (the queue may never drain)"""
+    while not stop.is_set():
+        try:
+            messages.put(message, timeout=1)
+            return
+        except queue.Full:
+            pass
+    raise _WriterStopped()
+
+def _fetch_source(spec, since, chunk_size, messages, stop):
+    """Fetch one sheet in a worker thread, sending cleaned chunks to the writer.
+    
+    Failed attempts are retried with exponential backoff; each attempt
+    starts with a 'start' message so the writer drops rows staged by the
+    previous one. The worker quits as soon as stop is set.
+    """
+    source = sheet_source(spec['sheet_id'], spec['sheet_name'])
+    for attempt in range(1, SOURCE_ATTEMPTS + 1):
+        try:
+            _send(messages, stop, ('start', source, None))
+            for chunk in read_sheet_chunks(spec['sheet_id'], spec['sheet_name'], chunk_size, since):
+                _send(messages, stop, ('chunk', source, clean_sales_frame(chunk)))
+            _send(messages, stop, ('done', source, None))
+            return
+        except _WriterStopped:
+            return
+        except Exception as e:
+            if attempt == SOURCE_ATTEMPTS:
+                try:
+                    _send(messages, stop, ('failed', source, e))
+                except _WriterStopped:
+                    pass
+                return
+            delay = RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+            print(f"Warning: {spec['name']} attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+            if stop.wait(delay):
+                return
+
+def sync_sources(sources, workers=SYNC_WORKERS, chunk_size=CHUNK_ROWS, full=False):
+    """Sync several sheets at once; returns True when every source synced.
+    
+    sources is a list of {'name', 'sheet_id', 'sheet_name'}; a sheet listed
+    twice is synced once. Up to workers sheets download concurrently, while
+    this thread is the only SQLite writer: it stages each chunk as it arrives
+    (one commit per chunk) and merges a source into sales once that source is
+    complete. The bounded queue keeps downloads from running ahead of the
+    writer; if the writer fails, the workers are told to stop.
+    """
+    unique = {}
+    for spec in sources:
+        spec = dict(spec, sheet_name=spec.get('sheet_name', 'Sales'), name=spec.get('name') or spec['sheet_id'])
+        unique.setdefault(sheet_source(spec['sheet_id'], spec['sheet_name']), spec)
+    sources = list(unique.values())
+    names = {source: spec['name'] for source, spec in unique.items()}
+    messages = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    results = {}
+    started_at = time.monotonic()
+    
+    conn = open_bulk_db()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for spec in sources:
+                since = sheet_since(spec['sheet_id'], spec['sheet_name'], full)
+                pool.submit(_fetch_source, spec, since, chunk_size, messages, stop)
+            
+            try:
+                rows_staged = {}
+                while len(results) < len(sources):
+                    kind, source, payload = messages.get()
+                    if kind == 'start':
+                        _resume_offset(conn, source, None)
+                        rows_staged[source] = 0
+                    elif kind == 'chunk':
+                        rows_staged[source] += len(payload)
+                        _stage_chunk(conn, source, None, payload, rows_staged[source])
+                    elif kind == 'done':
+                        results[source] = _merge_staged(conn, source)
+                        print(f"  {names[source]}: {results[source]} sales records "
+                              f"({time.monotonic() - started_at:.1f}s)")
+                    else:
+                        _resume_offset(conn, source, None)
+                        results[source] = None
+                        print(f"Error syncing {names[source]}: {payload}")
+            finally:
+                # Workers blocked on the full queue would keep the pool from
+                # shutting down if the writer failed
+                stop.set()
+    finally:
+        conn.close()
+    
+    synced = [count for count in results.values() if count is not None]
+    print(f"Synced {sum(synced)} sales records from {len(synced)}/{len(sources)} sources "
+          f"in {time.monotonic() - started_at:.1f}s")
+    return len(synced) == len(sources)
+
 def validate_products():
     """Validate that all sales have corresponding products"""
     with get_db() as conn:
-        # Find sales records without corresponding products
+        ensure_sales_schema(conn)
+        
+        # Find sales without corresponding products (all sources of a day together)
         orphan_sales = conn.execute('''
-            SELECT DISTINCT s.barcode, COUNT(*) as count
-            FROM sales s
+            SELECT s.barcode, COUNT(*) as days, SUM(s.quantity_sold) as quantity
+            FROM daily_sales s
             LEFT JOIN products p ON s.barcode = p.barcode
             WHERE p.barcode IS NULL
             GROUP BY s.barcode
@@ -126,7 +492,7 @@ def validate_products():
         if orphan_sales:
             print("Warning: Found sales records without corresponding products:")
             for sale in orphan_sales:
-                print(f"  Barcode: {sale['barcode']} ({sale['count']} sales records)")
+                print(f"  Barcode: {sale['barcode']} ({sale['days']} days, {sale['quantity']} sold)")
             
             # Optionally create missing products
             response = input("Create missing products? (y/n): ").strip().lower()
@@ -155,11 +521,18 @@ def generate_sample_csv():
 def main():
     parser = argparse.ArgumentParser(description='Sync sales data to inventory database')
     parser.add_argument('--csv', type=str, help='Path to CSV file')
+    parser.add_argument('--source', type=str, default=CSV_SOURCE,
+                        help='Where the CSV comes from, e.g. a branch code (exports of one source replace each other)')
     parser.add_argument('--sheet-id', type=str, help='Google Sheets document ID')
     parser.add_argument('--sheet-name', type=str, default='Sales', help='Google Sheets sheet name')
     parser.add_argument('--validate', action='store_true', help='Validate products after sync')
     parser.add_argument('--sample', action='store_true', help='Generate sample CSV file')
     parser.add_argument('--clear', action='store_true', help='Clear existing sales data before sync')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_ROWS, help='Rows loaded per transaction')
+    parser.add_argument('--full', action='store_true', help='Fetch the whole sheet instead of rows since the last sync')
+    parser.add_argument('--sources', type=str, help='JSON file listing sheets to sync concurrently '
+                                                    '([{"name", "sheet_id", "sheet_name"}, ...])')
+    parser.add_argument('--workers', type=int, default=SYNC_WORKERS, help='Concurrent downloads with --sources')
     
     args = parser.parse_args()
     
@@ -170,6 +543,12 @@ def main():
     if args.clear:
         with get_db() as conn:
             conn.execute('DELETE FROM sales')
+            # Without these the next sync would resume a staged load or fetch
+            # only rows after the old watermark, leaving sales mostly empty
+            ensure_load_tables(conn)
+            conn.execute('DELETE FROM sales_staging')
+            conn.execute('DELETE FROM sales_load_checkpoints')
+            conn.execute('DELETE FROM sync_watermarks')
             print("Cleared existing sales data")
     
     success = False
@@ -178,13 +557,18 @@ def main():
         if not os.path.exists(args.csv):
             print(f"Error: CSV file not found: {args.csv}")
             return
-        success = sync_from_csv(args.csv)
+        success = sync_from_csv(args.csv, args.chunk_size, args.source)
+    
+    elif args.sources:
+        with open(args.sources, encoding='utf-8') as f:
+            sources = json.load(f)
+        success = sync_sources(sources, max(1, args.workers), args.chunk_size, args.full)
     
     elif args.sheet_id:
-        success = sync_from_google_sheets(args.sheet_id, args.sheet_name)
+        success = sync_from_google_sheets(args.sheet_id, args.sheet_name, args.chunk_size, args.full)
     
     else:
-        print("Error: Please specify either --csv or --sheet-id")
+        print("Error: Please specify --csv, --sources or --sheet-id")
         parser.print_help()
         return
     